@@ -0,0 +1,211 @@
+"""
+Benchmarks of the report pipeline on synthetic data (datagen.py).
+
+For each scale, a dataset is generated into a scratch directory and timed
+in a child process started there (db.py binds ./stores.db at import):
+
+    load_data              full CSV load into an empty stores.db
+    ingest_new_data        ingest of one appended hour of polls
+    get_local_time_range   week window for a sample of stores
+    interpolate_status     week window for the same sample
+    generate_report        full report (engine, or --method)
+
+Results go to a JSON file named after the current commit, and --compare
+prints the ratio against an earlier run:
+
+    python bench.py --scales small medium
+    python bench.py --compare bench_results/<old sha>.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+
+import datagen
+
+# name -> (stores, days, poll minutes)
+SCALES = {
+    "tiny": (10, 2, 60),
+    "small": (100, 7, 60),
+    "medium": (1000, 7, 60),
+    "large": (5000, 7, 60),
+}
+# Stores timed one by one for the utils benchmarks
+SAMPLE_STORES = 100
+
+
+def _timed(fn, repeat):
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - started)
+    return seconds, result
+
+
+def _summary(seconds, **extra):
+    return {"seconds": [round(s, 6) for s in seconds], "min": round(min(seconds), 6),
+            "median": round(statistics.median(seconds), 6), **extra}
+
+
+def run_scale(stores, days, poll_minutes, repeat=3, method=None):
+    """
+    Run every benchmark on one dataset generated into the working directory;
+    returns {benchmark: summary}. Must run in a process whose working
+    directory is the scratch directory from the start (see run()).
+    """
+    import db
+    import report
+    import schedule
+    from models import StoreStatus
+    from uptime_engine import poll_range, polled_store_ids
+    from utils import from_epoch_us, get_local_time_range, interpolate_status
+
+    results = {}
+    try:
+        counts = datagen.generate("data", stores=stores, days=days, poll_minutes=poll_minutes)
+
+        def load():
+            db.engine.dispose()
+            if os.path.exists("stores.db"):
+                os.remove("stores.db")
+            db.init_db()
+            db.load_data()
+        seconds, _ = _timed(load, repeat)
+        results["load_data"] = _summary(seconds, rows=counts["store_status"])
+
+        # One ingest per repeat, each appending the next hour
+        seconds = []
+        for n in range(repeat):
+            end = datagen.DEFAULT_END + timedelta(hours=n)
+            appended = datagen.append_polls("data", stores=stores, poll_minutes=poll_minutes, seed=n + 1, end=end)
+            s, _ = _timed(db.ingest_new_data, 1)
+            seconds += s
+        results["ingest_new_data"] = _summary(seconds, rows=appended)
+
+        with db.SessionLocal() as session:
+            sample = polled_store_ids(session)[:SAMPLE_STORES]
+            now = from_epoch_us(poll_range(session)[1])
+            start = now - timedelta(days=7)
+
+            inputs = []
+            for store_id in sample:
+                hours = session.query(report.BusinessHours).filter_by(store_id=store_id).all()
+                tz = session.query(report.StoreTimezones).filter_by(store_id=store_id).first()
+                polls = session.query(StoreStatus).filter(
+                    StoreStatus.store_id == store_id,
+                    StoreStatus.timestamp_utc >= start,
+                    StoreStatus.timestamp_utc <= now,
+                ).order_by(StoreStatus.timestamp_utc).all()
+                inputs.append((hours, tz.timezone_str if tz else schedule.DEFAULT_TIMEZONE, polls))
+
+        def time_ranges():
+            return [get_local_time_range(start, now, tz, hours=hours, full_day=not hours)
+                    for hours, tz, _ in inputs]
+        seconds, periods = _timed(time_ranges, repeat)
+        results["get_local_time_range"] = _summary(seconds, calls=len(inputs))
+
+        def interpolate():
+            for (_, _, polls), store_periods in zip(inputs, periods):
+                interpolate_status(polls, store_periods)
+        seconds, _ = _timed(interpolate, repeat)
+        results["interpolate_status"] = _summary(seconds, calls=len(inputs),
+                                                 polls=sum(len(p) for _, _, p in inputs))
+
+        os.makedirs("output", exist_ok=True)
+        seconds, _ = _timed(lambda: report.generate_report("bench", method=method), repeat)
+        results["generate_report"] = _summary(seconds, stores=stores, method=method or report.REPORT_METHOD)
+    finally:
+        db.engine.dispose()
+    return results
+
+
+def run_scale_in_child(name, repeat=3, method=None):
+    """run_scale for SCALES[name] in a fresh process and scratch directory."""
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    result_file = os.path.join(workdir, "result.json")
+    command = [sys.executable, os.path.abspath(__file__), "--child", name,
+               "--repeat", str(repeat), "--out", result_file]
+    if method:
+        command += ["--method", method]
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        subprocess.run(command, cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(result_file) as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(scales, repeat=3, method=None):
+    record = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "repeat": repeat,
+        "scales": {},
+    }
+    for name in scales:
+        stores, days, poll_minutes = SCALES[name]
+        print(f"[BENCH] {name}: {stores} stores, {days} days, polls every {poll_minutes} min")
+        results = run_scale_in_child(name, repeat=repeat, method=method)
+        record["scales"][name] = {"stores": stores, "days": days, "poll_minutes": poll_minutes, "results": results}
+        for bench, summary in results.items():
+            print(f"[BENCH]   {bench:<22} median {summary['median']:.4f}s  min {summary['min']:.4f}s")
+    return record
+
+
+def compare(old, new):
+    """Print new/old median ratios for the benchmarks both runs have."""
+    print(f"[BENCH] {old['commit']} -> {new['commit']} (ratio of medians, < 1 is faster)")
+    for scale, entry in new["scales"].items():
+        if scale not in old["scales"]:
+            continue
+        for bench, summary in entry["results"].items():
+            before = old["scales"][scale]["results"].get(bench)
+            if before:
+                print(f"[BENCH]   {scale:<7} {bench:<22} {summary['median'] / before['median']:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["tiny", "small"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--method", choices=["engine", "reference"], default=None)
+    parser.add_argument("--out", default=None, help="default bench_results/<commit>.json")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.out, "w") as f:
+            json.dump(run_scale(*SCALES[args.child], repeat=args.repeat, method=args.method), f)
+        sys.exit(0)
+
+    results = run(args.scales, repeat=args.repeat, method=args.method)
+    out = args.out or os.path.join("bench_results", f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[BENCH] results written to {out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
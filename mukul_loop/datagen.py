@@ -0,0 +1,150 @@
+"""
+Deterministic synthetic store_status / menu_hours / timezones CSVs.
+
+The same parameters and seed always produce byte-identical files, so
+benchmarks (bench.py) and tests can run without the real dataset:
+
+    python datagen.py --stores 1000 --days 7 --poll-minutes 60 --out data
+
+Business-hours patterns (weights set with --hours-mix):
+    always     no menu_hours rows: open 24/7
+    standard   one interval per day, some days closed
+    split      lunch and dinner intervals
+    overnight  closes after local midnight (end < start)
+"""
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+
+TIMEZONES = [
+    'America/Chicago', 'America/New_York', 'America/Denver', 'America/Los_Angeles',
+    'America/Phoenix', 'America/Anchorage', 'Pacific/Honolulu', 'Europe/London',
+    'Europe/Berlin', 'Asia/Kolkata', 'Asia/Tokyo', 'Australia/Sydney',
+]
+
+HOURS_MIX = {'always': 0.15, 'standard': 0.55, 'split': 0.2, 'overnight': 0.1}
+
+# Latest poll, as in the original dataset's range
+DEFAULT_END = datetime(2023, 1, 25, 18, 0, 0)
+
+STATUS_CSV = "store_status.csv"
+HOURS_CSV = "menu_hours.csv"
+TIMEZONES_CSV = "timezones.csv"
+
+
+def store_ids(stores):
+    return [f"store-{n:06d}" for n in range(stores)]
+
+
+def _hours_rows(rng, store_id, pattern):
+    rows = []
+    for day in range(7):
+        if pattern == 'standard':
+            if rng.random() < 0.1:
+                continue
+            start = rng.randint(6, 11)
+            rows.append((store_id, day, f"{start:02d}:00:00", f"{rng.randint(start + 6, 23):02d}:00:00"))
+        elif pattern == 'split':
+            rows.append((store_id, day, "11:00:00", "14:30:00"))
+            rows.append((store_id, day, "17:00:00", f"{rng.randint(21, 23):02d}:00:00"))
+        elif pattern == 'overnight':
+            rows.append((store_id, day, f"{rng.randint(16, 20):02d}:00:00", f"0{rng.randint(0, 3)}:00:00"))
+    return rows
+
+
+def _polls(rng, store_id, start, end, poll_minutes, uptime):
+    """Polls every poll_minutes +-50%, with outages lasting a few polls."""
+    rows = []
+    t = start + timedelta(seconds=rng.uniform(0, poll_minutes * 60))
+    down_for = 0
+    while t <= end:
+        if down_for == 0 and rng.random() > uptime:
+            down_for = rng.randint(1, 4)
+        status = 'inactive' if down_for else 'active'
+        down_for = max(0, down_for - 1)
+        rows.append((t, store_id, status))
+        t += timedelta(seconds=rng.uniform(0.5, 1.5) * poll_minutes * 60)
+    return rows
+
+
+def write_polls(path, rows, mode="w"):
+    rows.sort()
+    with open(path, mode, newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        if mode == "w":
+            writer.writerow(["store_id", "status", "timestamp_utc"])
+        for t, store_id, status in rows:
+            writer.writerow([store_id, status, t.strftime("%Y-%m-%d %H:%M:%S.%f UTC")])
+    return len(rows)
+
+
+def generate(out_dir, stores=100, days=7, poll_minutes=60, timezone_count=5, hours_mix=None,
+             missing_timezone=0.1, uptime=0.9, seed=0, end=DEFAULT_END):
+    """
+    Write the three source CSVs to out_dir; returns their row counts.
+    timezone_count picks how many of TIMEZONES stores are spread over;
+    missing_timezone is the share of stores left to the default timezone.
+    """
+    rng = random.Random(seed)
+    hours_mix = hours_mix or HOURS_MIX
+    patterns, weights = list(hours_mix), list(hours_mix.values())
+    zones = TIMEZONES[:max(1, min(timezone_count, len(TIMEZONES)))]
+    os.makedirs(out_dir, exist_ok=True)
+
+    timezone_rows, hours_rows, polls = [], [], []
+    start = end - timedelta(days=days)
+    for store_id in store_ids(stores):
+        if rng.random() >= missing_timezone:
+            timezone_rows.append((store_id, rng.choice(zones)))
+        hours_rows.extend(_hours_rows(rng, store_id, rng.choices(patterns, weights)[0]))
+        polls.extend(_polls(rng, store_id, start, end, poll_minutes, uptime))
+
+    with open(os.path.join(out_dir, TIMEZONES_CSV), "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["store_id", "timezone_str"])
+        writer.writerows(timezone_rows)
+    with open(os.path.join(out_dir, HOURS_CSV), "w", newline="") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["store_id", "dayOfWeek", "start_time_local", "end_time_local"])
+        writer.writerows(hours_rows)
+    status_rows = write_polls(os.path.join(out_dir, STATUS_CSV), polls)
+
+    return {"store_status": status_rows, "menu_hours": len(hours_rows), "timezones": len(timezone_rows)}
+
+
+def append_polls(out_dir, stores=100, hours=1, poll_minutes=60, uptime=0.9, seed=1, end=DEFAULT_END):
+    """Append polls for (end, end + hours] to store_status.csv, like a new ingest batch."""
+    rng = random.Random(seed)
+    polls = []
+    start = end + timedelta(microseconds=1)
+    for store_id in store_ids(stores):
+        polls.extend(_polls(rng, store_id, start, end + timedelta(hours=hours), poll_minutes, uptime))
+    return write_polls(os.path.join(out_dir, STATUS_CSV), polls, mode="a")
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in HOURS_MIX:
+            raise argparse.ArgumentTypeError(f"unknown hours pattern {name!r}")
+        mix[name] = float(weight)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="data")
+    parser.add_argument("--stores", type=int, default=100)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--poll-minutes", type=float, default=60)
+    parser.add_argument("--timezones", type=int, default=5, help="number of distinct timezones")
+    parser.add_argument("--hours-mix", type=_parse_mix, default=None,
+                        help="e.g. always=0.2,standard=0.5,split=0.2,overnight=0.1")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    counts = generate(args.out, stores=args.stores, days=args.days, poll_minutes=args.poll_minutes,
+                      timezone_count=args.timezones, hours_mix=args.hours_mix, seed=args.seed)
+    print(f"Wrote {counts} to {args.out}")
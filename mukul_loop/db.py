@@ -1,134 +1,636 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker
-from models import Base
-import pandas as pd
+from models import Base, Store, StatusPoll, StoreFingerprint, create_store_status_view
+import schedule
+import status_cache
+from utils import from_epoch_us
+from metrics import phase, INGEST_SECONDS, INGEST_ROWS_PARSED, INGEST_ROWS_CHANGED
+import hashlib
+import io
+import os
+import time
 
 DATABASE_URL = "sqlite:///./stores.db"
 
+STATUS_CSV = "data/store_status.csv"
+HOURS_CSV = "data/menu_hours.csv"
+TIMEZONES_CSV = "data/timezones.csv"
+
+# Rows per CSV chunk / executemany batch during loads and ingestion
+CSV_CHUNK_SIZE = 50_000
+
+# Same text format SQLAlchemy uses for DateTime columns on SQLite
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base.metadata.bind = engine
 
+def database_path():
+    return os.path.abspath(make_url(DATABASE_URL).database)
+
+def read_only_engine(path=None):
+    """Engine on the SQLite file opened with mode=ro, for report worker processes."""
+    path = path or database_path()
+    return create_engine(f"sqlite:///file:{path}?mode=ro&uri=true", connect_args={"check_same_thread": False})
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    migrate_db()
     # load_data()
 
-from datetime import datetime
+# (table, unique index, natural key columns) for databases created before
+# the unique indexes were added to models.py
+NATURAL_KEYS = [
+    ("store_status", "uq_store_status_store_ts", ["store_id", "timestamp_utc"]),
+    ("business_hours", "uq_business_hours_row", ["store_id", "dayOfWeek", "start_time_local", "end_time_local"]),
+    ("store_timezones", "uq_store_timezones_store", ["store_id"]),
+]
+
+def _index_names(conn, table):
+    return [r[1] for r in conn.exec_driver_sql(f"PRAGMA index_list({table})")]
+
+def _is_table(conn, name):
+    return conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).scalar() is not None
+
+def _migrate_natural_keys(conn):
+    """Drop duplicate rows (keeping the newest id) and create missing unique indexes."""
+    for table, index, columns in NATURAL_KEYS:
+        # store_status is a view on databases created after the compact storage
+        if not _is_table(conn, table) or index in _index_names(conn, table):
+            continue
+        key = ", ".join(f'"{c}"' for c in columns)
+        deleted = conn.exec_driver_sql(
+            f"DELETE FROM {table} WHERE id NOT IN (SELECT MAX(id) FROM {table} GROUP BY {key})"
+        ).rowcount
+        conn.exec_driver_sql(f"CREATE UNIQUE INDEX {index} ON {table} ({key})")
+        print(f"Created unique index {index} ({deleted} duplicate rows removed)")
+
+def _migrate_status_indexes(conn):
+    """Covering (store_id, timestamp_utc, status) and timestamp_utc indexes on store_status."""
+    if not _is_table(conn, "store_status"):
+        return
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_store_status_store_ts_status "
+        "ON store_status (store_id, timestamp_utc, status)"
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_store_status_ts ON store_status (timestamp_utc)")
+    # Prefix of the composite index, no longer needed
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_store_status_store_id")
+    conn.exec_driver_sql("ANALYZE store_status")
+
+def _used_bytes(conn):
+    """Bytes in pages actually in use (the file only shrinks on VACUUM)."""
+    page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+    pages = conn.exec_driver_sql("PRAGMA page_count").scalar()
+    free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    return (pages - free) * page_size
+
+def _time_status_scans(conn, latest_us):
+    """Seconds for a week-long all-store window scan and 100 single-store month scans."""
+    week_start, month_start = latest_us - 7 * 86400 * 10**6, latest_us - 30 * 86400 * 10**6
+    if _is_table(conn, "store_status"):
+        to_param = lambda us: from_epoch_us(us).strftime(SQLITE_DATETIME_FORMAT)
+        latest = to_param(latest_us)
+    else:
+        to_param = lambda us: us
+        latest = latest_us
+    stores = [s for (s,) in conn.exec_driver_sql("SELECT DISTINCT store_id FROM store_status LIMIT 100")]
+
+    started = time.perf_counter()
+    conn.exec_driver_sql(
+        "SELECT store_id, timestamp_utc, status FROM store_status WHERE timestamp_utc >= ? AND timestamp_utc <= ?",
+        (to_param(week_start), latest)).all()
+    week = time.perf_counter() - started
+    started = time.perf_counter()
+    for store_id in stores:
+        conn.exec_driver_sql(
+            "SELECT timestamp_utc, status FROM store_status "
+            "WHERE store_id = ? AND timestamp_utc >= ? AND timestamp_utc <= ? ORDER BY timestamp_utc",
+            (store_id, to_param(month_start), latest)).all()
+    return week, time.perf_counter() - started
+
+# ts text as written by SQLAlchemy DateTime -> epoch microseconds, in SQL
+_TEXT_TO_EPOCH_US = (
+    "CAST(strftime('%s', substr({col}, 1, 19)) AS INTEGER) * 1000000 "
+    "+ CAST(substr({col} || '.000000', 21, 6) AS INTEGER)"
+)
+
+def _migrate_compact_status(conn):
+    """
+    Move store_status rows into stores + status_polls (integer keys, epoch
+    microseconds, boolean status, WITHOUT ROWID) and replace the table with
+    the store_status view. Prints size and scan times before and after.
+    """
+    if not _is_table(conn, "store_status"):
+        return
+    latest_us = conn.exec_driver_sql(
+        "SELECT " + _TEXT_TO_EPOCH_US.format(col="t") + " FROM (SELECT MAX(timestamp_utc) AS t FROM store_status)"
+    ).scalar() or 0
+    size_before = _used_bytes(conn)
+    scans_before = _time_status_scans(conn, latest_us)
+
+    Store.__table__.create(conn, checkfirst=True)
+    StatusPoll.__table__.create(conn, checkfirst=True)
+
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO stores (store_id) "
+        "SELECT DISTINCT store_id FROM store_status WHERE store_id IS NOT NULL ORDER BY store_id"
+    )
+    moved = conn.exec_driver_sql(
+        "INSERT OR REPLACE INTO status_polls (store_key, ts, active) "
+        "SELECT s.store_key, " + _TEXT_TO_EPOCH_US.format(col="st.timestamp_utc") + ", st.status = 'active' "
+        "FROM store_status st JOIN stores s ON s.store_id = st.store_id "
+        "WHERE st.timestamp_utc IS NOT NULL"
+    ).rowcount
+    conn.exec_driver_sql("DROP TABLE store_status")
+    create_store_status_view(conn)
+    conn.exec_driver_sql("ANALYZE status_polls")
+    conn.exec_driver_sql("ANALYZE stores")
+
+    size_after = _used_bytes(conn)
+    scans_after = _time_status_scans(conn, latest_us)
+    print(f"[MIGRATE] store_status -> status_polls: {moved} rows, "
+          f"{size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB in use (VACUUM to shrink the file)")
+    print(f"[MIGRATE] week window scan {scans_before[0]:.3f}s -> {scans_after[0]:.3f}s, "
+          f"100 store month scans {scans_before[1]:.3f}s -> {scans_after[1]:.3f}s")
+
+def _migrate_store_fingerprints(conn):
+    """Fingerprints of the stores already loaded, marked changed at the current ingest version."""
+    StoreFingerprint.__table__.create(conn, checkfirst=True)
+    version = get_ingest_version(conn) if _is_table(conn, "app_state") else 0
+    update_fingerprints(conn, version)
+
+def _migrate_report_jobs_created_index(conn):
+    """(created_at, id) index for paging through report_jobs."""
+    if _is_table(conn, "report_jobs"):
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_report_jobs_created ON report_jobs (created_at, id)")
+
+def _migrate_report_jobs_maintenance_index(conn):
+    """At most one live ingest / retention job; duplicates (all but a running one, else the oldest) are marked failed first."""
+    if not _is_table(conn, "report_jobs"):
+        return
+    conn.exec_driver_sql(
+        "UPDATE report_jobs SET status = 'failed', error = 'Failed: duplicate maintenance job' "
+        "WHERE kind IN ('ingest', 'retention') AND status IN ('queued', 'running') AND id NOT IN "
+        "(SELECT id FROM report_jobs j WHERE j.kind = report_jobs.kind AND j.status IN ('queued', 'running') "
+        " ORDER BY j.status = 'running' DESC, j.created_at LIMIT 1)"
+    )
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_report_jobs_live_maintenance ON report_jobs (kind) "
+        "WHERE kind IN ('ingest', 'retention') AND status IN ('queued', 'running')"
+    )
+
+def _migrate_drop_hourly_rollup(conn):
+    """Drop the unused hourly rollups and their coverage keys."""
+    conn.exec_driver_sql("DROP TABLE IF EXISTS store_hourly_rollup")
+    if _is_table(conn, "app_state"):
+        conn.exec_driver_sql("DELETE FROM app_state WHERE key IN ('rollup_start_us', 'rollup_horizon_us')")
+
+# Applied in order; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    _migrate_natural_keys,
+    _migrate_status_indexes,
+    _migrate_compact_status,
+    _migrate_store_fingerprints,
+    _migrate_report_jobs_created_index,
+    _migrate_drop_hourly_rollup,
+    _migrate_report_jobs_maintenance_index,
+]
+
+def migrate_db(bind=None):
+    """Upgrade an existing stores.db in place to the current schema."""
+    with (bind or engine).begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            started = time.perf_counter()
+            migration(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+            print(f"Applied migration {number} ({migration.__name__}) in {time.perf_counter() - started:.2f}s")
+
+def report_query_plans(conn):
+    """EXPLAIN QUERY PLAN of the queries the report path issues, keyed by name."""
+    ts = 1674604800000000
+    queries = {
+        "latest_timestamp": ("SELECT MAX(ts) FROM status_polls", ()),
+        "polled_stores": (
+            "SELECT store_id FROM stores WHERE EXISTS "
+            "(SELECT 1 FROM status_polls p WHERE p.store_key = stores.store_key)", ()),
+        "window_all_stores": (
+            "SELECT s.store_id, p.ts, p.active FROM status_polls p JOIN stores s ON s.store_key = p.store_key "
+            "WHERE p.ts >= ? AND p.ts <= ?", (ts, ts)),
+        "retention_day": ("DELETE FROM status_polls WHERE ts >= ? AND ts < ?", (ts, ts)),
+        "window_one_store": (
+            "SELECT store_id, timestamp_utc, status FROM store_status "
+            "WHERE store_id = ? AND timestamp_utc >= ? AND timestamp_utc <= ? ORDER BY timestamp_utc",
+            ("s", ts, ts)),
+    }
+    plans = {}
+    for name, (sql, params) in queries.items():
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params).all()
+        plans[name] = " | ".join(r[-1] for r in rows)
+    return plans
+
+def check_query_plans(bind=None):
+    """Return the report queries whose plan is a full status_polls scan or a temp sort."""
+    with (bind or engine).connect() as conn:
+        plans = report_query_plans(conn)
+    bad = {}
+    for name, plan in plans.items():
+        print(f"[PLAN] {name}: {plan}")
+        if "USING TEMP B-TREE" in plan or any(
+            step.startswith("SCAN") and "status_polls" in step and "INDEX" not in step
+            for step in plan.split(" | ")
+        ):
+            bad[name] = plan
+    return bad
+
+def to_epoch_us_series(series):
+    """Parse CSV 'YYYY-MM-DD HH:MM:SS[.ffffff] UTC' strings into epoch microseconds."""
+    import pandas as pd
+    parsed = pd.to_datetime(series.str.replace(' UTC', ''), format='ISO8601')
+    return parsed.dt.as_unit('us').astype('int64')
+
+def store_keys(conn, store_ids):
+    """Intern store_ids into the stores table; returns {store_id: store_key}."""
+    conn.exec_driver_sql("INSERT OR IGNORE INTO stores (store_id) VALUES (?)", [(s,) for s in store_ids])
+    return dict(conn.exec_driver_sql("SELECT store_id, store_key FROM stores").all())
+
+def _status_transform(conn, chunk):
+    with conn.begin():
+        keys = store_keys(conn, chunk['store_id'].unique().tolist())
+    chunk['store_key'] = chunk['store_id'].map(keys)
+    chunk['ts'] = to_epoch_us_series(chunk['timestamp_utc'])
+    chunk['active'] = (chunk['status'] == 'active').astype(int)
+    return chunk
+
+# source name -> (csv path, columns, upsert statement, chunk transform,
+# upsert parameter columns if not the CSV columns).
+# The DO UPDATE ... WHERE clauses make rowcount count only real changes.
+SOURCES = {
+    "store_status": (
+        STATUS_CSV,
+        ["store_id", "timestamp_utc", "status"],
+        "INSERT INTO status_polls (store_key, ts, active) VALUES (?, ?, ?) "
+        "ON CONFLICT (store_key, ts) DO UPDATE SET active = excluded.active "
+        "WHERE status_polls.active IS NOT excluded.active",
+        _status_transform,
+        ["store_key", "ts", "active"],
+    ),
+    "business_hours": (
+        HOURS_CSV,
+        ["store_id", "dayOfWeek", "start_time_local", "end_time_local"],
+        'INSERT INTO business_hours (store_id, "dayOfWeek", start_time_local, end_time_local) VALUES (?, ?, ?, ?) '
+        'ON CONFLICT (store_id, "dayOfWeek", start_time_local, end_time_local) DO NOTHING',
+        None,
+        None,
+    ),
+    "store_timezones": (
+        TIMEZONES_CSV,
+        ["store_id", "timezone_str"],
+        "INSERT INTO store_timezones (store_id, timezone_str) VALUES (?, ?) "
+        "ON CONFLICT (store_id) DO UPDATE SET timezone_str = excluded.timezone_str "
+        "WHERE store_timezones.timezone_str IS NOT excluded.timezone_str",
+        None,
+        None,
+    ),
+}
+
+def tune_sqlite_for_bulk_load(conn):
+    """WAL journal, no fsync per commit and a large page cache for bulk inserts."""
+    conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    conn.exec_driver_sql("PRAGMA synchronous=OFF")
+    conn.exec_driver_sql("PRAGMA cache_size=-200000")
+    conn.exec_driver_sql("PRAGMA temp_store=MEMORY")
+    conn.commit()
+
+def restore_sqlite_pragmas(conn):
+    conn.exec_driver_sql("PRAGMA synchronous=NORMAL")
+    conn.exec_driver_sql("PRAGMA cache_size=-2000")
+    conn.commit()
+
+# Bytes before the checkpoint offset hashed to detect in-place rewrites
+CHECKPOINT_TAIL_BYTES = 256
+
+def _tail_hash(f, offset):
+    start = max(0, offset - CHECKPOINT_TAIL_BYTES)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+def _last_line_end(f, start, size):
+    """Offset just past the last newline in [start, size), or start if none."""
+    pos = size
+    while pos > start:
+        step = min(64 * 1024, pos - start)
+        f.seek(pos - step)
+        block = f.read(step)
+        i = block.rfind(b"\n")
+        if i != -1:
+            return pos - step + i + 1
+        pos -= step
+    return start
+
+class _BoundedReader(io.RawIOBase):
+    """Binary view of a header plus bytes [start, end) of a file."""
+
+    def __init__(self, f, start, end, prefix=b""):
+        f.seek(start)
+        self.f = f
+        self.remaining = end - start
+        self.prefix = prefix
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        n = len(buf)
+        if self.prefix:
+            data = self.prefix[:n]
+            self.prefix = self.prefix[n:]
+        else:
+            data = self.f.read(min(n, self.remaining))
+            self.remaining -= len(data)
+        buf[:len(data)] = data
+        return len(data)
+
+def ingest_source(conn, name, chunk_size=CSV_CHUNK_SIZE, full=False, touched=None):
+    """
+    Upsert the bytes of a source CSV appended since its checkpoint.
+
+    Skips the file when size and mtime match the checkpoint, re-reads it from
+    the start when it shrank or was rewritten in place, and only parses up to
+    the last complete line. Returns (rows parsed, rows changed).
+    For store_status, touched (if given) collects store_id -> (min, max)
+    epoch microseconds of the parsed rows.
+
+    Chunks commit as they are upserted. When rows were parsed, the checkpoint
+    commits together with an ingest version bump and the fingerprints (or
+    the schedules version) of what was parsed, so a crash before that point
+    re-reads the rows and bumps the version on the next ingest.
+    """
+    # Deferred: pandas is only needed once data is loaded, not to start the API
+    import pandas as pd
+    from models import IngestCheckpoint
+
+    path, columns, upsert_sql, transform, params = SOURCES[name]
+    params = params or columns
+    stat = os.stat(path)
+    cp = conn.execute(
+        select(IngestCheckpoint).where(IngestCheckpoint.source == name)
+    ).first()
+    conn.commit()
+
+    with open(path, "rb") as f:
+        header = f.readline()
+        start = len(header)
+        if cp is not None and not full:
+            if cp.size == stat.st_size and cp.mtime == stat.st_mtime:
+                return 0, 0
+            if start <= cp.offset <= stat.st_size and _tail_hash(f, cp.offset) == cp.tail_hash:
+                start = cp.offset
+        end = _last_line_end(f, start, stat.st_size)
+
+        parsed = changed = 0
+        spans = {}
+        started = time.perf_counter()
+        if full:
+            LOAD_PROGRESS[name] = (0, end - start)
+        if end > start:
+            reader = io.BufferedReader(_BoundedReader(f, start, end, prefix=header))
+            chunks = pd.read_csv(reader, usecols=columns, chunksize=chunk_size)
+            while True:
+                with phase("ingest", "parse"):
+                    chunk = next(chunks, None)
+                    if chunk is not None and transform is not None:
+                        chunk = transform(conn, chunk)
+                if chunk is None:
+                    break
+                with phase("ingest", "upsert"), conn.begin():
+                    result = conn.exec_driver_sql(upsert_sql, list(chunk[params].itertuples(index=False, name=None)))
+                parsed += len(chunk)
+                changed += max(result.rowcount, 0)
+                if name == "store_status" and not full:
+                    _merge_touched(spans, chunk)
+                elapsed = time.perf_counter() - started
+                if full:
+                    LOAD_PROGRESS[name] = (min(f.tell(), end) - start, end - start)
+                print(f"[LOAD] {path}: {parsed} rows ({parsed / elapsed:,.0f} rows/sec)")
+
+        if full:
+            LOAD_PROGRESS[name] = (end - start, end - start)
+        tail_hash = _tail_hash(f, end)
+    INGEST_ROWS_PARSED.inc(parsed, source=name)
+    INGEST_ROWS_CHANGED.inc(changed, source=name)
+
+    with conn.begin():
+        if parsed:
+            bump_ingest_version(conn)
+            version = get_ingest_version(conn)
+            if name == "store_status":
+                with phase("ingest", "fingerprints"):
+                    update_fingerprints(conn, version, None if full else spans)
+            else:
+                schedule.set_schedules_version(conn, version)
+        conn.execute(sqlite_insert(IngestCheckpoint).values(
+            source=name, offset=end, size=stat.st_size, mtime=stat.st_mtime, tail_hash=tail_hash
+        ).on_conflict_do_update(
+            index_elements=[IngestCheckpoint.source],
+            set_=dict(offset=end, size=stat.st_size, mtime=stat.st_mtime, tail_hash=tail_hash)
+        ))
+    if touched is not None:
+        for store_id, span in spans.items():
+            _merge_touched_span(touched, store_id, *span)
+    return parsed, changed
+
+def _merge_touched(touched, chunk):
+    spans = chunk.groupby("store_id")["ts"].agg(["min", "max"])
+    for store_id, lo, hi in spans.itertuples(name=None):
+        _merge_touched_span(touched, store_id, int(lo), int(hi))
+
+def _merge_touched_span(touched, store_id, lo, hi):
+    if store_id in touched:
+        lo, hi = min(lo, touched[store_id][0]), max(hi, touched[store_id][1])
+    touched[store_id] = (lo, hi)
+
+# app_state key of a counter bumped by every ingest that changed any row
+INGEST_VERSION_KEY = "ingest_version"
+
+def bump_ingest_version(conn):
+    conn.exec_driver_sql(
+        "INSERT INTO app_state (key, value) VALUES (?, '1') "
+        "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+        (INGEST_VERSION_KEY,)
+    )
+
+def get_ingest_version(conn):
+    value = conn.exec_driver_sql("SELECT value FROM app_state WHERE key = ?", (INGEST_VERSION_KEY,)).scalar()
+    return int(value) if value is not None else 0
+
+def current_watermark(conn):
+    """data_watermark() on an open connection."""
+    latest = conn.exec_driver_sql("SELECT MAX(ts) FROM status_polls").scalar()
+    return latest, get_ingest_version(conn)
+
+# Stores per IN (...) list of a fingerprint update
+FINGERPRINT_BATCH = 500
+
+_FINGERPRINT_UPSERT = (
+    "INSERT INTO store_fingerprints (store_key, poll_count, last_ts, changed_version) "
+    "SELECT store_key, COUNT(*), MAX(ts), ? FROM status_polls {where} GROUP BY store_key "
+    "ON CONFLICT (store_key) DO UPDATE SET poll_count = excluded.poll_count, "
+    "last_ts = excluded.last_ts, changed_version = excluded.changed_version"
+)
+
+# Fingerprints of stores left without polls
+_FINGERPRINT_DELETE = (
+    "DELETE FROM store_fingerprints WHERE {where} "
+    "NOT EXISTS (SELECT 1 FROM status_polls p WHERE p.store_key = store_fingerprints.store_key)"
+)
+
+def update_fingerprints(conn, version, store_ids=None):
+    """
+    Recount the polls and latest poll of the given stores (all when None)
+    and mark them changed at ingest version; stores without polls lose
+    their fingerprint. One grouped range read of the primary key per store.
+    """
+    if store_ids is None:
+        # WHERE true: SQLite needs it to parse ON CONFLICT after a SELECT
+        conn.exec_driver_sql(_FINGERPRINT_UPSERT.format(where="WHERE true"), (version,))
+        conn.exec_driver_sql(_FINGERPRINT_DELETE.format(where=""))
+        return
+    store_ids = list(store_ids)
+    for i in range(0, len(store_ids), FINGERPRINT_BATCH):
+        batch = store_ids[i:i + FINGERPRINT_BATCH]
+        keys = "store_key IN (SELECT store_key FROM stores WHERE store_id IN (" + ", ".join("?" * len(batch)) + "))"
+        conn.exec_driver_sql(_FINGERPRINT_UPSERT.format(where="WHERE " + keys), (version, *batch))
+        conn.exec_driver_sql(_FINGERPRINT_DELETE.format(where=keys + " AND"), tuple(batch))
+
+def store_fingerprints(conn):
+    """{store_id: (poll_count, last_ts, changed_version)} of every store with polls."""
+    rows = conn.exec_driver_sql(
+        "SELECT s.store_id, f.poll_count, f.last_ts, f.changed_version "
+        "FROM store_fingerprints f JOIN stores s ON s.store_key = f.store_key"
+    )
+    return {store_id: (count, last_ts, changed) for store_id, count, last_ts, changed in rows}
+
+def data_watermark():
+    """(latest poll in epoch microseconds, ingest version): identifies the data a report was computed from."""
+    with engine.connect() as conn:
+        return current_watermark(conn)
+
+# source -> (bytes parsed, bytes to parse) of the current or last full load
+LOAD_PROGRESS = {}
+
+def load_fraction():
+    """Share of the source bytes parsed by the running bulk load (1.0 when none is running)."""
+    done = sum(d for d, _ in LOAD_PROGRESS.values())
+    total = sum(t for _, t in LOAD_PROGRESS.values())
+    return done / total if total else 1.0
+
+def bulk_load_csvs(chunk_size=CSV_CHUNK_SIZE):
+    """Bulk-load the three source CSVs through executemany upserts and checkpoint them."""
+    # Sizes of every source up front, so progress covers the whole load
+    LOAD_PROGRESS.clear()
+    LOAD_PROGRESS.update({name: (0, os.path.getsize(path)) for name, (path, *_) in SOURCES.items()})
+    with engine.connect() as conn:
+        tune_sqlite_for_bulk_load(conn)
+        try:
+            for name in SOURCES:
+                ingest_source(conn, name, chunk_size=chunk_size, full=True)
+        finally:
+            restore_sqlite_pragmas(conn)
+    schedule.invalidate()
 
 def load_data():
-    from models import StoreStatus, BusinessHours, StoreTimezones
+    from models import StatusPoll, BusinessHours, StoreTimezones
 
     with SessionLocal() as session:
         # Check if data already exists
-        existing_status_count = session.query(StoreStatus).count()
+        existing_status_count = session.query(StatusPoll).count()
         existing_hours_count = session.query(BusinessHours).count()
         existing_tz_count = session.query(StoreTimezones).count()
-        
-        # Only load data if database is empty
-        if existing_status_count == 0 and existing_hours_count == 0 and existing_tz_count == 0:
-            print("Database is empty, loading initial data...")
-            
-            df_status = pd.read_csv("data/store_status.csv")
-            df_hours = pd.read_csv("data/menu_hours.csv")
-            df_tz = pd.read_csv("data/timezones.csv")
-
-            # 👇 Convert timestamp string to datetime
-            df_status['timestamp_utc'] = pd.to_datetime(df_status['timestamp_utc'].str.replace(' UTC', ''))
-
-            for _, row in df_status.iterrows():
-                session.add(StoreStatus(
-                    store_id=row.store_id,
-                    timestamp_utc=row.timestamp_utc,
-                    status=row.status
-                ))
-
-            for _, row in df_hours.iterrows():
-                session.add(BusinessHours(
-                    store_id=row.store_id,
-                    dayOfWeek=row.dayOfWeek,
-                    start_time_local=row.start_time_local,
-                    end_time_local=row.end_time_local
-                ))
-
-            for _, row in df_tz.iterrows():
-                session.add(StoreTimezones(
-                    store_id=row.store_id,
-                    timezone_str=row.timezone_str
-                ))
-
-            session.commit()
-            print("Initial data loaded successfully!")
-        else:
-            print(f"Database already contains data: {existing_status_count} status records, {existing_hours_count} business hours, {existing_tz_count} timezones")
+
+    # Only load data if database is empty
+    if existing_status_count == 0 and existing_hours_count == 0 and existing_tz_count == 0:
+        print("Database is empty, loading initial data...")
+        bulk_load_csvs()
+        print("Initial data loaded successfully!")
+    else:
+        print(f"Database already contains data: {existing_status_count} status records, {existing_hours_count} business hours, {existing_tz_count} timezones")
 
 def ingest_new_data():
-    """Incrementally ingest new rows from CSVs. Idempotent via merge on natural keys."""
-    from models import StoreStatus, BusinessHours, StoreTimezones
+    """
+    Incrementally ingest new rows from CSVs. Each source is tailed from its
+    checkpoint and upserted in batches on its natural key, so unchanged files
+    cost a stat() and appended rows are parsed once.
+    Returns {source: rows changed}.
+    """
+    with INGEST_SECONDS.time():
+        return _ingest_new_data()
 
-    with SessionLocal() as session:
-        # latest timestamp seen in DB for status
-        latest = session.query(StoreStatus.timestamp_utc).order_by(StoreStatus.timestamp_utc.desc()).first()
-        latest_ts = latest[0] if latest else None
-
-        # read CSVs
-        df_status = pd.read_csv("data/store_status.csv")
-        df_status['timestamp_utc'] = pd.to_datetime(df_status['timestamp_utc'].str.replace(' UTC', ''))
-
-        # filter to only newer
-        if latest_ts is not None:
-            df_status = df_status[df_status['timestamp_utc'] > latest_ts]
-
-        inserted = 0
-        for _, row in df_status.iterrows():
-            # merge ensures idempotency based on store_id+timestamp_utc
-            existing = session.query(StoreStatus).filter(
-                StoreStatus.store_id == row.store_id,
-                StoreStatus.timestamp_utc == row.timestamp_utc
-            ).first()
-            if existing:
-                existing.status = row.status
-            else:
-                session.add(StoreStatus(
-                    store_id=row.store_id,
-                    timestamp_utc=row.timestamp_utc,
-                    status=row.status
-                ))
-                inserted += 1
-
-        # business hours and timezones assumed slowly changing; upsert all present rows
-        df_hours = pd.read_csv("data/menu_hours.csv")
-        for _, row in df_hours.iterrows():
-            existing = session.query(BusinessHours).filter(
-                BusinessHours.store_id == row.store_id,
-                BusinessHours.dayOfWeek == row.dayOfWeek,
-                BusinessHours.start_time_local == row.start_time_local,
-                BusinessHours.end_time_local == row.end_time_local,
-            ).first()
-            if not existing:
-                session.add(BusinessHours(
-                    store_id=row.store_id,
-                    dayOfWeek=row.dayOfWeek,
-                    start_time_local=row.start_time_local,
-                    end_time_local=row.end_time_local
-                ))
-
-        df_tz = pd.read_csv("data/timezones.csv")
-        for _, row in df_tz.iterrows():
-            existing = session.query(StoreTimezones).filter(
-                StoreTimezones.store_id == row.store_id
-            ).first()
-            if existing:
-                existing.timezone_str = row.timezone_str
-            else:
-                session.add(StoreTimezones(
-                    store_id=row.store_id,
-                    timezone_str=row.timezone_str
-                ))
+def _ingest_new_data():
+    changes = {}
+    reparsed = {}
+    touched = {}
+    with engine.connect() as conn:
+        since = get_ingest_version(conn)
+        conn.commit()
+        for name in SOURCES:
+            parsed, changed = ingest_source(conn, name, touched=touched)
+            changes[name] = changed
+            reparsed[name] = parsed
+            if parsed:
+                print(f"[INGEST] {name}: parsed {parsed} rows, {changed} inserted/updated")
+        version = get_ingest_version(conn)
+
+    if reparsed['business_hours'] or reparsed['store_timezones']:
+        schedule.invalidate()
+
+    if reparsed['store_status']:
+        with SessionLocal() as session, phase("ingest", "status_cache"):
+            status_cache.update(session, touched, version, since)
 
-        session.commit()
-        print(f"Ingestion complete. Inserted/updated {inserted} status rows.")
+    print(f"Ingestion complete. Inserted/updated {changes['store_status']} status rows.")
+    return changes
+
+def upsert_observations(batches):
+    """
+    Upsert pushed polls (see observations.py) with the same statement as
+    the store_status CSV, bumping the ingest version in the same transaction. batches are lists of
+    (store_id, epoch microseconds, active) tuples; returns rows changed per batch.
+    """
+    upsert_sql = SOURCES["store_status"][2]
+    touched = {}
+    for batch in batches:
+        for store_id, ts, _ in batch:
+            lo, hi = touched.get(store_id, (ts, ts))
+            touched[store_id] = (min(lo, ts), max(hi, ts))
+
+    # The polls and the version bump commit together, so a crash cannot leave new polls at an old version
+    with engine.connect() as conn, conn.begin():
+        keys = store_keys(conn, list(touched))
+        changed = []
+        with phase("observations", "upsert"):
+            for batch in batches:
+                result = conn.exec_driver_sql(upsert_sql, [(keys[s], ts, int(active)) for s, ts, active in batch])
+                changed.append(max(result.rowcount, 0))
+        if any(changed):
+            bump_ingest_version(conn)
+            version = get_ingest_version(conn)
+            with phase("observations", "fingerprints"):
+                update_fingerprints(conn, version, touched)
+    INGEST_ROWS_PARSED.inc(sum(len(batch) for batch in batches), source="observations")
+    INGEST_ROWS_CHANGED.inc(sum(changed), source="observations")
+
+    if any(changed):
+        with SessionLocal() as session, phase("observations", "status_cache"):
+            status_cache.update(session, touched, version)
+    return changed
 
 # Main execution block
 if __name__ == "__main__":
@@ -139,3 +641,7 @@ if __name__ == "__main__":
     print("Loading data...")
     load_data()
     print("Data loaded successfully!")
+
+    bad_plans = check_query_plans()
+    if bad_plans:
+        print(f"[WARN] Report queries not using indexes: {list(bad_plans)}")
@@ -0,0 +1,299 @@
+"""
+Report jobs in the report_jobs table, run by a fixed-size worker pool.
+
+Every API process (uvicorn --workers N) enqueues into and polls the same
+table, so a report's status is the same whichever process answers. Each
+process runs JOB_WORKERS threads that claim the highest priority queued job
+with a single UPDATE ... RETURNING, which SQLite serializes across
+processes. A claim is a lease: the worker renews it every
+HEARTBEAT_SECONDS, and a job whose lease runs out (its process died) is
+claimed again by another worker, up to MAX_ATTEMPTS times. Finishing a job
+only counts if the worker still holds its lease.
+
+The queue is bounded for reports: submit raises QueueFull for a report
+once JOB_QUEUE_MAX reports are waiting. Other kinds (the scheduled ingest
+and retention jobs, one at a time each) are always accepted, so a burst of
+report triggers cannot crowd them out. Jobs with a cache_key are shared: while a job for the key is
+queued or running, or its finished file still exists, submitting the same
+key returns that job instead of adding one (see report_cache.py for when
+finished reports are dropped).
+"""
+import base64
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from sqlalchemy import func, text, tuple_
+from sqlalchemy.exc import IntegrityError
+
+from models import ReportJob
+
+# Worker threads per API process
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# Queued (not yet running) reports accepted before submit refuses new ones
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "100"))
+# A running job is reclaimed this long after its last heartbeat
+LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+HEARTBEAT_SECONDS = LEASE_SECONDS / 4
+MAX_ATTEMPTS = 3
+# Idle workers check for new jobs this often
+POLL_SECONDS = 0.5
+
+# Single-store reports are quick; do not queue them behind full reports.
+# Ingests go first so reports see fresh data; maintenance waits for idle workers.
+PRIORITY_MAINTENANCE = -10
+PRIORITY_FULL = 0
+PRIORITY_SINGLE_STORE = 10
+PRIORITY_INGEST = 20
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETE = "complete"
+FAILED = "failed"
+EVICTED = "evicted"
+
+# Job kinds bounded by JOB_QUEUE_MAX
+REPORT_KINDS = ("full", "single_store")
+
+# submit() outcomes
+CACHED = "cached"
+COALESCED = "coalesced"
+STARTED = "started"
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _live_job(db, cache_key):
+    return db.query(ReportJob).filter(
+        ReportJob.cache_key == cache_key,
+        ReportJob.status.in_([QUEUED, RUNNING, COMPLETE]),
+    ).first()
+
+
+def submit(db, kind, params=None, priority=PRIORITY_FULL, cache_key=None, job_id=None):
+    """
+    Queue a job and return (job_id, STARTED), or for a cache_key that already
+    has a job, (that job's id, CACHED or COALESCED). Raises IntegrityError
+    for a second live ingest / retention job.
+    """
+    for _ in range(3):
+        if cache_key is not None:
+            existing = _live_job(db, cache_key)
+            if existing is not None:
+                if existing.status != COMPLETE:
+                    return existing.id, COALESCED
+                if existing.path and os.path.exists(existing.path):
+                    return existing.id, CACHED
+                # The file was removed behind our back
+                existing.status = EVICTED
+                db.commit()
+
+        if kind in REPORT_KINDS and db.query(ReportJob).filter(
+                ReportJob.status == QUEUED, ReportJob.kind.in_(REPORT_KINDS)).count() >= JOB_QUEUE_MAX:
+            raise QueueFull(f"{JOB_QUEUE_MAX} report jobs already queued")
+
+        now = time.time()
+        job = ReportJob(
+            id=job_id or str(uuid.uuid4()), kind=kind, params=json.dumps(params or {}),
+            priority=priority, status=QUEUED, cache_key=cache_key, attempts=0,
+            created_at=now, updated_at=now,
+        )
+        db.add(job)
+        try:
+            db.commit()
+            return job.id, STARTED
+        except IntegrityError:
+            db.rollback()
+            if cache_key is None:
+                raise
+            # Another process queued the same cache_key first; join it
+    raise RuntimeError(f"Could not queue job for {cache_key!r}")
+
+
+def claim(db, owner):
+    """Lease the next job to owner; returns (job_id, kind, params dict) or None."""
+    now = time.time()
+    db.execute(text(
+        "UPDATE report_jobs SET status = :failed, error = :error, lease_owner = NULL, updated_at = :now "
+        "WHERE status = :running AND lease_expires < :now AND attempts >= :max_attempts"
+    ), {"failed": FAILED, "running": RUNNING, "now": now, "max_attempts": MAX_ATTEMPTS,
+        "error": f"Failed: worker lost {MAX_ATTEMPTS} times"})
+    row = db.execute(text(
+        "UPDATE report_jobs SET status = :running, lease_owner = :owner, lease_expires = :expires, "
+        "attempts = attempts + 1, updated_at = :now "
+        "WHERE id = (SELECT id FROM report_jobs "
+        "            WHERE status = :queued OR (status = :running AND lease_expires < :now) "
+        "            ORDER BY priority DESC, created_at LIMIT 1) "
+        "RETURNING id, kind, params"
+    ), {"running": RUNNING, "queued": QUEUED, "owner": owner,
+        "expires": now + LEASE_SECONDS, "now": now}).first()
+    db.commit()
+    if row is None:
+        return None
+    return row.id, row.kind, json.loads(row.params)
+
+
+def heartbeat(db, job_id, owner):
+    """Extend owner's lease; False if the job was reclaimed by someone else."""
+    result = db.execute(text(
+        "UPDATE report_jobs SET lease_expires = :expires WHERE id = :id AND lease_owner = :owner AND status = :running"
+    ), {"expires": time.time() + LEASE_SECONDS, "id": job_id, "owner": owner, "running": RUNNING})
+    db.commit()
+    return result.rowcount == 1
+
+
+def finish(db, job_id, owner, path=None, error=None):
+    """Mark owner's job complete (with its output path) or failed; False if the lease was lost."""
+    result = db.execute(text(
+        "UPDATE report_jobs SET status = :status, path = :path, error = :error, lease_owner = NULL, "
+        "lease_expires = NULL, updated_at = :now WHERE id = :id AND lease_owner = :owner AND status = :running"
+    ), {"status": FAILED if error else COMPLETE, "path": path, "error": error, "now": time.time(),
+        "id": job_id, "owner": owner, "running": RUNNING})
+    db.commit()
+    return result.rowcount == 1
+
+
+def get_job(db, job_id):
+    return db.get(ReportJob, job_id)
+
+
+def status_text(job):
+    """Status string as the API has always reported it."""
+    if job.status == QUEUED:
+        return "Queued"
+    if job.status == RUNNING:
+        return "Running"
+    if job.status == COMPLETE:
+        return "Complete"
+    return job.error or "Failed"
+
+
+def count_by_status(db):
+    """{status: number of jobs}, with every status present."""
+    counts = dict.fromkeys([QUEUED, RUNNING, COMPLETE, FAILED, EVICTED], 0)
+    counts.update(db.query(ReportJob.status, func.count()).group_by(ReportJob.status).all())
+    return counts
+
+
+def active_job(db, kind):
+    """The queued or running job of this kind, if any."""
+    return db.query(ReportJob).filter(
+        ReportJob.kind == kind, ReportJob.status.in_([QUEUED, RUNNING])
+    ).order_by(ReportJob.created_at).first()
+
+
+def list_jobs(db, kinds=None):
+    """{job_id: status text} of all jobs still on record, oldest first."""
+    jobs = db.query(ReportJob).filter(ReportJob.status != EVICTED)
+    if kinds is not None:
+        jobs = jobs.filter(ReportJob.kind.in_(kinds))
+    jobs = jobs.order_by(ReportJob.created_at)
+    return {job.id: status_text(job) for job in jobs}
+
+
+def _encode_cursor(job):
+    return base64.urlsafe_b64encode(json.dumps([job.created_at, job.id]).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        created_at, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(created_at), str(job_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def page_jobs(db, kinds=None, limit=100, cursor=None):
+    """
+    One page of list_jobs, oldest first: ({job_id: status text}, cursor of
+    the next page or None). Pages follow (created_at, id), so jobs added
+    while paging never shift the pages already returned.
+    """
+    jobs = db.query(ReportJob).filter(ReportJob.status != EVICTED)
+    if kinds is not None:
+        jobs = jobs.filter(ReportJob.kind.in_(kinds))
+    if cursor is not None:
+        jobs = jobs.filter(tuple_(ReportJob.created_at, ReportJob.id) > _decode_cursor(cursor))
+    jobs = jobs.order_by(ReportJob.created_at, ReportJob.id).limit(limit + 1).all()
+    next_cursor = _encode_cursor(jobs[limit - 1]) if len(jobs) > limit else None
+    return {job.id: status_text(job) for job in jobs[:limit]}, next_cursor
+
+
+class WorkerPool:
+    """
+    JOB_WORKERS threads running jobs from the table. handlers maps a job kind
+    to a callable(job_id, **params) returning the output path (or None for
+    jobs without one) and raising on failure; after_complete
+    (optional) is called with a session after each successful job.
+    """
+
+    def __init__(self, session_factory, handlers, workers=JOB_WORKERS, after_complete=None):
+        self.session_factory = session_factory
+        self.handlers = handlers
+        self.workers = workers
+        self.after_complete = after_complete
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(n,), name=f"report-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"[JOBS] {self.workers} report workers started in process {os.getpid()}")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self, n):
+        owner = f"{socket.gethostname()}:{os.getpid()}:{n}"
+        while not self._stop.is_set():
+            try:
+                if not self.run_one(owner):
+                    self._stop.wait(POLL_SECONDS)
+            except Exception as e:
+                print(f"[JOBS] worker {owner} error: {e}")
+                self._stop.wait(POLL_SECONDS)
+
+    def run_one(self, owner):
+        """Claim and run one job; False if the queue was empty."""
+        with self.session_factory() as db:
+            job = claim(db, owner)
+        if job is None:
+            return False
+        job_id, kind, params = job
+
+        done = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job_id, owner, done), daemon=True)
+        beat.start()
+        path, error = None, None
+        try:
+            path = self.handlers[kind](job_id, **params)
+        except Exception as e:
+            error = f"Failed: {str(e)}"
+        finally:
+            done.set()
+            beat.join()
+
+        with self.session_factory() as db:
+            if not finish(db, job_id, owner, path, error):
+                print(f"[JOBS] {job_id}: lease lost to another worker, result dropped")
+            elif error is None and self.after_complete is not None:
+                self.after_complete(db)
+        return True
+
+    def _heartbeat(self, job_id, owner, done):
+        while not done.wait(HEARTBEAT_SECONDS):
+            with self.session_factory() as db:
+                if not heartbeat(db, job_id, owner):
+                    print(f"[JOBS] {job_id}: lease lost by {owner}")
+                    return
@@ -1,35 +1,184 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import Body, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, PlainTextResponse, Response
+from contextlib import nullcontext
+import gzip
+import threading
+import traceback
 import uuid
 import os
+from sqlalchemy.exc import IntegrityError
 from report import generate_report, generate_single_store_report
-from db import init_db, load_data, ingest_new_data
-import threading
-import time
-from apscheduler.schedulers.background import BackgroundScheduler
+from db import SessionLocal, init_db, load_data, ingest_new_data, data_watermark, get_ingest_version, load_fraction
+import job_queue
+from job_queue import WorkerPool, QueueFull, REPORT_KINDS, CACHED, COALESCED, PRIORITY_FULL, PRIORITY_SINGLE_STORE, PRIORITY_INGEST, PRIORITY_MAINTENANCE
+from report_cache import cache_key, evict_reports, profile_path
+from report_state import read_metadata
+from report_writer import validate_format, report_path, media_type, read_rows
+import json
+from datetime import datetime
+from typing import Optional
+import metrics
+import observations
+import snapshot
+import status_cache
+from retention import apply_retention, RETENTION_INTERVAL_HOURS
 
 app = FastAPI(title="Store Monitoring System", description="API for monitoring restaurant uptime/downtime")
-scheduler = BackgroundScheduler()
+# Created once the initial load is done (apscheduler is imported then)
+scheduler = None
 
-# Global dictionary to store report status
-report_status = {}
+# Startup phase of this process: None when the startup hook never ran
+# (tests, embedding), else initializing, loading, warming, ready or failed
+startup_state = {"phase": None, "error": None}
+# Seconds clients are told to wait while data is loading
+READY_RETRY_AFTER = 5
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database and load data on startup"""
-    print("Initializing database...")
-    init_db()
-    print("Loading data...")
-    load_data()
-    print("Application startup complete!")
+def is_ready():
+    return startup_state["phase"] in (None, "ready")
+
+def require_ready():
+    """Dependency of the data endpoints: 503 with Retry-After until the initial load is done."""
+    if not is_ready():
+        raise HTTPException(status_code=503, detail=f"Data not ready ({startup_state['phase']})",
+                            headers={"Retry-After": str(READY_RETRY_AFTER)})
+
+# Data endpoints are only served once the initial load is done
+READY = [Depends(require_ready)]
+
+def _report_file(path):
+    if not os.path.exists(path):
+        raise RuntimeError("CSV file not created")
+    return path
+
+def _maybe_profiled(job_id, profile):
+    # Opt-in per report: ?profile=true on the trigger
+    if not profile:
+        return nullcontext()
+    os.makedirs("output", exist_ok=True)
+    return metrics.profiled(profile_path(job_id))
+
+def run_full_report(job_id, fmt="csv", profile=False, differential=None):
+    with _maybe_profiled(job_id, profile):
+        generate_report(job_id, fmt=fmt, differential=differential)
+    return _report_file(report_path(job_id, fmt))
+
+def run_single_store_report(job_id, store_id, profile=False):
+    with _maybe_profiled(job_id, profile):
+        generate_single_store_report(job_id, store_id)
+    return _report_file(f"output/{job_id}.csv")
+
+def run_ingest(job_id):
+    changes = ingest_new_data()
+    print(f"[INGEST] job {job_id}: {changes}")
+
+def run_retention(job_id):
+    deleted = apply_retention()
+    print(f"[RETENTION] job {job_id}: {deleted} polls deleted")
+
+def _submit_once(kind, priority):
+    """Queue a job of kind unless one is already queued or running; returns (job_id, state)."""
+    with SessionLocal() as db:
+        active = job_queue.active_job(db, kind)
+        if active is None:
+            try:
+                return job_queue.submit(db, kind, priority=priority)
+            except IntegrityError:
+                # Another process queued one between the check and the insert
+                active = job_queue.active_job(db, kind)
+                if active is None:
+                    raise
+        return active.id, COALESCED
+
+def submit_ingest():
+    return _submit_once("ingest", PRIORITY_INGEST)
+
+def submit_retention():
+    return _submit_once("retention", PRIORITY_MAINTENANCE)
+
+# Report jobs live in the report_jobs table (see job_queue.py), so every
+# uvicorn worker process sees the same statuses
+worker_pool = WorkerPool(
+    SessionLocal,
+    {"full": run_full_report, "single_store": run_single_store_report, "ingest": run_ingest,
+     "retention": run_retention},
+    after_complete=evict_reports,
+)
+
+def start_scheduler():
+    global scheduler
+    from apscheduler.schedulers.background import BackgroundScheduler
+    scheduler = BackgroundScheduler()
     # Start periodic ingestion every 10 minutes to simulate hourly polling
     try:
-        scheduler.add_job(ingest_new_data, 'interval', minutes=10, id='ingest_job', replace_existing=True)
+        scheduler.add_job(submit_ingest, 'interval', minutes=10, id='ingest_job', replace_existing=True)
+        scheduler.add_job(submit_retention, 'interval', hours=RETENTION_INTERVAL_HOURS, id='retention_job',
+                          replace_existing=True)
         scheduler.start()
-        print("BackgroundScheduler started: ingest_new_data every 10 minutes")
+        print(f"BackgroundScheduler started: ingest job every 10 minutes, "
+              f"retention every {RETENTION_INTERVAL_HOURS:g} hours")
     except Exception as e:
         print(f"Failed to start scheduler: {e}")
 
+def initial_load():
+    """Initialize and load the database, warm caches, then start workers and the scheduler."""
+    try:
+        startup_state["phase"] = "initializing"
+        print("Initializing database...")
+        init_db()
+        # A snapshot of the current data replaces the load checks and warm-up
+        with SessionLocal() as db:
+            restored = snapshot.restore(db)
+        if not restored:
+            startup_state["phase"] = "loading"
+            print("Loading data...")
+            load_data()
+            startup_state["phase"] = "warming"
+            with SessionLocal() as db:
+                status_cache.fill(db, get_ingest_version(db.connection()))
+        worker_pool.start()
+        start_scheduler()
+        startup_state["phase"] = "ready"
+        print("Application startup complete!")
+        if not restored:
+            save_snapshot()
+    except Exception as e:
+        startup_state.update(phase="failed", error=str(e))
+        print(f"[ERROR] Initial load failed: {e}")
+        traceback.print_exc()
+
+def save_snapshot():
+    """Write the startup snapshot if the data changed since it was written."""
+    try:
+        with SessionLocal() as db:
+            snapshot.refresh(db)
+    except Exception as e:
+        print(f"[WARN] Could not write snapshot: {e}")
+
+@app.on_event("startup")
+async def startup_event():
+    """Start the initial load in the background, so the server binds at once"""
+    startup_state.update(phase="initializing", error=None)
+    threading.Thread(target=initial_load, name="initial-load", daemon=True).start()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up (500 only if the initial load failed)"""
+    if startup_state["phase"] == "failed":
+        return JSONResponse({"status": "failed", "error": startup_state["error"]}, status_code=500)
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once data is loaded, else 503 with the phase and load percentage"""
+    phase = startup_state["phase"] or "ready"
+    body = {"ready": is_ready(), "phase": phase,
+            "load_percent": 100.0 if is_ready() else round(100 * load_fraction(), 1)}
+    if is_ready():
+        return body
+    if startup_state["error"]:
+        body["error"] = startup_state["error"]
+    return JSONResponse(body, status_code=503, headers={"Retry-After": str(READY_RETRY_AFTER)})
+
 @app.get("/")
 async def root():
     return {"message": "Store Monitoring System API", "status": "running"}
@@ -37,76 +186,84 @@ async def root():
 @app.on_event("shutdown")
 async def shutdown_event():
     try:
-        scheduler.shutdown(wait=False)
+        if scheduler is not None:
+            scheduler.shutdown(wait=False)
     except Exception:
         pass
+    worker_pool.stop(timeout=5)
+    observations.stop(timeout=5)
+    # Ingests since startup made the snapshot stale: save it for the next start
+    if startup_state["phase"] == "ready":
+        save_snapshot()
 
-@app.post("/trigger_report")
-async def trigger_report():
+@app.post("/trigger_report", dependencies=READY)
+def trigger_report(fmt: str = Query("csv", alias="format"), profile: bool = False,
+                   differential: Optional[bool] = None):
     """
     Trigger report generation from the data stored in DB
     Returns a random report_id for polling
+    format: csv (default), csv.gz or parquet
+    profile: run under cProfile, see GET /get_report/{report_id}/profile
+    differential: reuse unchanged stores' rows of the last full report
+    (default REPORT_DIFFERENTIAL), see GET /get_report/{report_id}/metadata
     """
     try:
-        # Generate a unique report ID
-        report_id = str(uuid.uuid4())
-        
-        # Initialize status as "Running"
-        report_status[report_id] = "Running"
-        
-        # Start report generation in a background thread
-        def generate_report_async():
-            try:
-                generate_report(report_id)
-                # Check if CSV file was created successfully
-                csv_path = f"output/{report_id}.csv"
-                if os.path.exists(csv_path):
-                    report_status[report_id] = "Complete"
-                else:
-                    report_status[report_id] = "Failed: CSV file not created"
-            except Exception as e:
-                report_status[report_id] = f"Failed: {str(e)}"
-        
-        thread = threading.Thread(target=generate_report_async)
-        thread.daemon = True
-        thread.start()
+        validate_format(fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        # Reports are deterministic for a given data watermark, so reuse a
+        # finished report or join one already running for the same data
+        # A profiled run must actually compute, so it bypasses the cache
+        key = None if profile else cache_key("full", fmt, *data_watermark())
+        params = {"fmt": fmt, "profile": True} if profile else {"fmt": fmt}
+        if differential is not None:
+            params["differential"] = differential
+        with SessionLocal() as db:
+            report_id, state = job_queue.submit(db, "full", params, PRIORITY_FULL, cache_key=key)
+        if state == CACHED:
+            return {"report_id": report_id, "status": "Complete", "cached": True}
+        if state == COALESCED:
+            return {"report_id": report_id, "status": "Report generation already running"}
         
         return {"report_id": report_id, "status": "Report generation started"}
         
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to trigger report: {str(e)}")
 
-@app.get("/get_report/{report_id}")
-async def get_report(report_id: str):
+@app.get("/get_report/{report_id}", dependencies=READY)
+def get_report(report_id: str, request: Request):
     """
     Get the status of a report or download the CSV file
+    csv.gz reports are sent as CSV with Content-Encoding: gzip, or
+    decompressed on the fly for clients that do not accept gzip
     """
     try:
         # Check if report exists
-        if report_id not in report_status:
+        with SessionLocal() as db:
+            job = job_queue.get_job(db, report_id)
+        if job is None or job.status == job_queue.EVICTED:
             raise HTTPException(status_code=404, detail="Report not found")
         
-        status = report_status[report_id]
+        status = job_queue.status_text(job)
         
-        # If report is still running
-        if status == "Running":
-            return {"status": "Running"}
+        # If report is still queued or running
+        if status in ("Queued", "Running"):
+            return {"status": status}
         
         # If report failed
         if status.startswith("Failed"):
             return {"status": status}
         
-        # If report is complete, return the CSV file
+        # If report is complete, return the report file
         if status == "Complete":
-            csv_path = f"output/{report_id}.csv"
-            if os.path.exists(csv_path):
-                return FileResponse(
-                    path=csv_path,
-                    filename=f"store_report_{report_id}.csv",
-                    media_type="text/csv"
-                )
+            fmt = json.loads(job.params).get("fmt", "csv")
+            if job.path and os.path.exists(job.path):
+                return report_response(report_id, job.path, fmt, request.headers.get("accept-encoding", ""),
+                                       request.headers.get("if-none-match"))
             else:
-                report_status[report_id] = "Failed: CSV file not found"
                 return {"status": "Failed: CSV file not found"}
         
         return {"status": status}
@@ -116,13 +273,121 @@ async def get_report(report_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving report: {str(e)}")
 
-@app.get("/reports")
-async def list_reports():
-    """List all reports and their statuses"""
-    return {"reports": report_status}
+def report_etag(report_id, path, representation=""):
+    """Strong ETag of a report file: finished reports never change, so id, mtime and size identify it."""
+    st = os.stat(path)
+    return f'"{report_id}-{st.st_mtime_ns:x}-{st.st_size:x}{representation}"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
 
-@app.post("/trigger_single_store_report/{store_id}")
-async def trigger_single_store_report(store_id: str):
+def report_response(report_id, path, fmt, accept_encoding, if_none_match=None):
+    """
+    The report file, with an ETag: 304 when If-None-Match has it. The file
+    itself supports Range / If-Range requests; the decompressed csv.gz stream
+    does not.
+    """
+    filename = f"store_report_{report_id}" + (".parquet" if fmt == "parquet" else ".csv")
+    decompress = fmt == "csv.gz" and "gzip" not in accept_encoding.lower()
+    headers = {"ETag": report_etag(report_id, path, "-identity" if decompress else "")}
+    if fmt == "csv.gz":
+        # gzip or plain bytes depending on the request: caches must key on it
+        headers["Vary"] = "Accept-Encoding"
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if fmt != "csv.gz":
+        return FileResponse(path=path, filename=filename, media_type=media_type(fmt), headers=headers)
+    if not decompress:
+        return FileResponse(
+            path=path,
+            filename=filename,
+            media_type=media_type(fmt),
+            headers={"Content-Encoding": "gzip", **headers}
+        )
+
+    def decompressed():
+        with gzip.open(path, "rb") as f:
+            while chunk := f.read(64 * 1024):
+                yield chunk
+
+    return StreamingResponse(
+        decompressed(),
+        media_type=media_type(fmt),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', **headers}
+    )
+
+# Bound on the rows of one GET /get_report/{report_id}/rows page
+REPORT_PAGE_MAX = 1000
+
+@app.get("/get_report/{report_id}/rows", dependencies=READY)
+def get_report_rows(report_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=REPORT_PAGE_MAX),
+                    store_id: Optional[str] = None):
+    """
+    One page of a finished report as JSON: limit rows from row offset, or
+    the row of store_id. Reads only the requested rows, via the row index
+    saved next to the report.
+    """
+    with SessionLocal() as db:
+        job = job_queue.get_job(db, report_id)
+    if job is None or job.status == job_queue.EVICTED:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if job.status != job_queue.COMPLETE or not job.path or not os.path.exists(job.path):
+        raise HTTPException(status_code=409, detail=f"Report is not ready ({job_queue.status_text(job)})")
+    fmt = json.loads(job.params).get("fmt", "csv")
+    total, rows = read_rows(job.path, fmt, offset, limit, store_id)
+    if store_id is not None and not rows:
+        raise HTTPException(status_code=404, detail="Store not in report")
+    response = {"report_id": report_id, "total": total, "rows": rows}
+    if store_id is None:
+        response.update(offset=offset, limit=limit,
+                        next_offset=offset + limit if offset + limit < total else None)
+    return response
+
+@app.get("/get_report/{report_id}/profile")
+def get_report_profile(report_id: str):
+    """pstats dump of a report triggered with profile=true (python -m pstats <file>)"""
+    path = profile_path(report_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No profile for this report")
+    return FileResponse(path=path, filename=f"report_{report_id}.prof", media_type="application/octet-stream")
+
+@app.get("/get_report/{report_id}/metadata", dependencies=READY)
+def get_report_metadata(report_id: str):
+    """How a full report was computed: mode, stores recomputed and reused, data watermark, seconds"""
+    metadata = read_metadata(report_id)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="No metadata for this report")
+    return metadata
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics of this process, plus job counts from the shared table"""
+    with SessionLocal() as db:
+        for status, count in job_queue.count_by_status(db).items():
+            metrics.JOBS.set(count, status=status)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Bound on the reports of one GET /reports page
+REPORTS_PAGE_MAX = 1000
+
+@app.get("/reports", dependencies=READY)
+def list_reports(limit: int = Query(100, ge=1, le=REPORTS_PAGE_MAX), cursor: Optional[str] = None):
+    """
+    Reports and their statuses, oldest first, limit per page; pass the
+    returned next_cursor to get the next page (null on the last one)
+    """
+    with SessionLocal() as db:
+        try:
+            reports, next_cursor = job_queue.page_jobs(db, kinds=REPORT_KINDS, limit=limit, cursor=cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return {"reports": reports, "next_cursor": next_cursor}
+
+@app.post("/trigger_single_store_report/{store_id}", dependencies=READY)
+def trigger_single_store_report(store_id: str, profile: bool = False):
     """
     Trigger report generation for a single store
     """
@@ -130,42 +395,65 @@ async def trigger_single_store_report(store_id: str):
         # Generate a unique report ID
         report_id = f"single_store_{store_id}_{str(uuid.uuid4())[:8]}"
         
-        # Initialize status as "Running"
-        report_status[report_id] = "Running"
-        
-        # Start report generation in a background thread
-        def generate_single_report_async():
-            try:
-                generate_single_store_report(report_id, store_id)
-                # Check if CSV file was created successfully
-                csv_path = f"output/{report_id}.csv"
-                if os.path.exists(csv_path):
-                    report_status[report_id] = "Complete"
-                else:
-                    report_status[report_id] = "Failed: CSV file not created"
-            except Exception as e:
-                report_status[report_id] = f"Failed: {str(e)}"
-        
-        thread = threading.Thread(target=generate_single_report_async)
-        thread.daemon = True
-        thread.start()
+        with SessionLocal() as db:
+            params = {"store_id": store_id, "profile": True} if profile else {"store_id": store_id}
+            job_queue.submit(db, "single_store", params, PRIORITY_SINGLE_STORE, job_id=report_id)
         
         return {"report_id": report_id, "store_id": store_id, "status": "Single store report generation started"}
         
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to trigger single store report: {str(e)}")
 
-@app.post("/ingest")
-async def ingest_endpoint():
-    """Manually trigger ingestion of new data."""
+@app.post("/ingest", status_code=202, dependencies=READY)
+def ingest_endpoint():
+    """
+    Queue ingestion of new data and return its job id at once;
+    poll GET /jobs/{job_id} for the outcome.
+    """
     try:
-        ingest_new_data()
-        return {"status": "ok"}
+        job_id, state = submit_ingest()
+        return {"job_id": job_id, "status": "Ingestion already queued" if state == COALESCED else "Ingestion queued"}
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion failed: {str(e)}")
 
-@app.get("/store_summary/{store_id}")
-async def get_store_summary(store_id: str):
+# Seconds a client throttled by POST /observations should wait
+OBSERVATIONS_RETRY_AFTER = 1
+
+@app.post("/observations", dependencies=READY)
+async def post_observations(request: Request):
+    """
+    Push status polls as NDJSON or CSV (store_id, timestamp_utc, status).
+    The body is parsed as it streams in and upserted in batches; returns
+    the rows written, changed and rejected, and the rows/sec of the request.
+    """
+    fmt = observations.body_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send application/x-ndjson or text/csv")
+    if observations.queue_full():
+        metrics.OBSERVATIONS_THROTTLED.inc()
+        raise HTTPException(status_code=429, detail="Write queue is full, retry later",
+                            headers={"Retry-After": str(OBSERVATIONS_RETRY_AFTER)})
+    try:
+        return await observations.ingest(request.stream(), fmt)
+    except observations.Rejected as e:
+        headers = {"Retry-After": str(OBSERVATIONS_RETRY_AFTER)} if e.status_code == 429 else None
+        return JSONResponse({"detail": str(e), **e.result}, status_code=e.status_code, headers=headers)
+
+@app.get("/jobs/{job_id}", dependencies=READY)
+def get_job(job_id: str):
+    """Status of any queued job (reports or ingests)"""
+    with SessionLocal() as db:
+        job = job_queue.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job.id, "kind": job.kind, "status": job_queue.status_text(job)}
+
+@app.get("/store_summary/{store_id}", dependencies=READY)
+def get_store_summary(store_id: str):
     """
     Get a quick summary of store data availability
     """
@@ -176,6 +464,40 @@ async def get_store_summary(store_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting store summary: {str(e)}")
 
+@app.get("/uptime/{store_id}", dependencies=READY)
+def get_uptime(store_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+               granularity: str = "hour"):
+    """
+    Uptime/downtime time series of one store, synchronously:
+    start/end ISO timestamps (naive = UTC; default the last day of data),
+    granularity hour, day or week
+    """
+    from report import get_uptime_series
+    try:
+        series = get_uptime_series(store_id, start, end, granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if series is None:
+        raise HTTPException(status_code=404, detail="Store not found")
+    return series
+
+# Bound on one POST /store_summaries request
+MAX_SUMMARY_STORES = 10000
+
+@app.post("/store_summaries", dependencies=READY)
+def get_store_summaries(store_ids: list[str] = Body(..., embed=True)):
+    """
+    Summaries for many stores in one call: {"store_ids": [...]} in,
+    {"summaries": {store_id: summary}} out (unknown stores get an error entry)
+    """
+    if len(store_ids) > MAX_SUMMARY_STORES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SUMMARY_STORES} store_ids per request")
+    try:
+        from report import get_store_summaries
+        return {"summaries": get_store_summaries(store_ids)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting store summaries: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,189 @@
+"""
+In-process counters and histograms, rendered in the Prometheus text format
+on GET /metrics.
+
+Report and ingest code time their phases with
+
+    with phase("report", "query"):
+        ...
+
+which feeds store_monitor_phase_seconds{operation, phase}. Values are per
+process: with several uvicorn workers, each one exposes its own (scrape
+each worker, or sum in the query). Report shards computed in child
+processes are recorded as a whole, per shard.
+
+profiled(path) wraps a block in cProfile and dumps pstats to path, for the
+opt-in ?profile=true on report triggers.
+"""
+import cProfile
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers sub-millisecond phases up to multi-minute full reports
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _label_key(labelnames, labels):
+    if set(labels) != set(labelnames):
+        raise ValueError(f"expected labels {labelnames}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            self._values[key] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [bucket counts..., sum, count]
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        state = self._values.get(_label_key(self.labelnames, labels))
+        return state[-1] if state else 0
+
+    def samples(self):
+        for key, state in sorted(self._values.items()):
+            for bound, n in zip(self.buckets, state):
+                yield (f"{self.name}_bucket",
+                       _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))]), n)
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), state[-2]
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), state[-1]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+PHASE_SECONDS = Histogram(
+    "store_monitor_phase_seconds", "Time spent in each phase of reports and ingests",
+    ["operation", "phase"])
+REPORT_SECONDS = Histogram(
+    "store_monitor_report_duration_seconds", "Wall time of report generation", ["kind"])
+REPORTS = Counter(
+    "store_monitor_reports_total", "Reports generated, by outcome", ["kind", "outcome"])
+STORES_PROCESSED = Counter(
+    "store_monitor_report_stores_total", "Stores processed by reports", ["kind"])
+REPORT_ROWS = Counter(
+    "store_monitor_report_rows_written_total", "Rows written to report files", ["format"])
+INGEST_SECONDS = Histogram(
+    "store_monitor_ingest_duration_seconds", "Wall time of ingest cycles")
+INGEST_ROWS_PARSED = Counter(
+    "store_monitor_ingest_rows_parsed_total", "CSV rows parsed by ingestion", ["source"])
+INGEST_ROWS_CHANGED = Counter(
+    "store_monitor_ingest_rows_changed_total", "Rows inserted or updated by ingestion", ["source"])
+JOBS = Gauge(
+    "store_monitor_jobs", "Jobs in the shared report_jobs table, by status", ["status"])
+RETENTION_ROWS_DELETED = Counter(
+    "store_monitor_retention_polls_deleted_total", "Status polls deleted past the retention window")
+STATUS_CACHE_BYTES = Gauge(
+    "store_monitor_status_cache_bytes", "Memory held by the in-process status poll cache")
+STATUS_CACHE_SAMPLES = Gauge(
+    "store_monitor_status_cache_samples", "Polls held by the in-process status poll cache")
+OBSERVATIONS_QUEUE = Gauge(
+    "store_monitor_observations_queued_batches", "Pushed observation batches waiting for the writer")
+OBSERVATIONS_ROWS_PER_SECOND = Gauge(
+    "store_monitor_observations_rows_per_second", "Upsert throughput of the last observations write")
+OBSERVATIONS_ROWS_REJECTED = Counter(
+    "store_monitor_observations_rows_rejected_total", "Pushed observation rows that did not parse")
+OBSERVATIONS_THROTTLED = Counter(
+    "store_monitor_observations_throttled_total", "POST /observations requests turned away with 429")
+
+
+@contextmanager
+def phase(operation, name):
+    with PHASE_SECONDS.time(operation=operation, phase=name):
+        yield
+
+
+@contextmanager
+def profiled(path):
+    """Profile the block on this thread and dump pstats to path."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"[PROFILE] wrote {path}")
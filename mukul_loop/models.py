@@ -1,16 +1,116 @@
 # File: models.py
 
-from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Integer, String, Float, Boolean, Index, MetaData, Table, event, text
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TypeDecorator
+
+from utils import to_epoch_us
 
 Base = declarative_base()
 
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+
+class EpochMicros(TypeDecorator):
+    """Naive UTC datetime stored as integer microseconds since the epoch"""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return to_epoch_us(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else _NAIVE_EPOCH + timedelta(microseconds=value)
+
+class StatusText(TypeDecorator):
+    """'active' / 'inactive' stored as 1 / 0"""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, (bool, int)):
+            return value
+        return 1 if value == 'active' else 0
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else ('active' if value else 'inactive')
+
+class Store(Base):
+    """store_id strings interned to small integer keys for status_polls"""
+    __tablename__ = "stores"
+    store_key = Column(Integer, primary_key=True)
+    store_id = Column(String, nullable=False, unique=True)
+
+class StatusPoll(Base):
+    """
+    Compact poll storage: one row per store per poll, clustered on
+    (store_key, ts) without a rowid, so a store's window is one range read.
+    """
+    __tablename__ = "status_polls"
+    store_key = Column(Integer, primary_key=True)
+    # Epoch microseconds (polls carry sub-second timestamps)
+    ts = Column(Integer, primary_key=True)
+    active = Column(Boolean, nullable=False)
+
+    __table_args__ = (
+        # max(ts) and the all-store window scans; covering on a WITHOUT ROWID table
+        Index("ix_status_polls_ts_active", "ts", "active"),
+        {"sqlite_with_rowid": False},
+    )
+
+class StoreFingerprint(Base):
+    """Per-store summary of its polls, kept by ingestion, so reports can tell which stores changed"""
+    __tablename__ = "store_fingerprints"
+    store_key = Column(Integer, primary_key=True)
+    poll_count = Column(Integer, nullable=False)
+    # Epoch microseconds of the store's latest poll
+    last_ts = Column(Integer, nullable=False)
+    # Ingest version of the last write to the store's polls
+    changed_version = Column(Integer, nullable=False)
+
+# store_status is a view over status_polls + stores with the original
+# columns, so the ORM and raw queries keep seeing store_id strings,
+# datetimes and 'active'/'inactive'. Filters on timestamp_utc bind to the
+# integer ts column and still use the indexes. Inserts go through an
+# INSTEAD OF trigger. The view is kept out of Base.metadata so create_all
+# does not create it as a table.
+_views = MetaData()
+
+STORE_STATUS_VIEW = Table(
+    "store_status", _views,
+    Column("store_id", String, primary_key=True),
+    Column("timestamp_utc", EpochMicros, primary_key=True),
+    Column("status", StatusText),
+)
+
+STORE_STATUS_VIEW_DDL = [
+    "CREATE VIEW IF NOT EXISTS store_status AS "
+    "SELECT s.store_id AS store_id, p.ts AS timestamp_utc, p.active AS status "
+    "FROM status_polls p JOIN stores s ON s.store_key = p.store_key",
+    "CREATE TRIGGER IF NOT EXISTS store_status_insert INSTEAD OF INSERT ON store_status BEGIN "
+    "INSERT OR IGNORE INTO stores (store_id) VALUES (NEW.store_id); "
+    "INSERT OR REPLACE INTO status_polls (store_key, ts, active) "
+    "VALUES ((SELECT store_key FROM stores WHERE store_id = NEW.store_id), NEW.timestamp_utc, NEW.status); "
+    "END",
+]
+
+def create_store_status_view(conn):
+    for sql in STORE_STATUS_VIEW_DDL:
+        conn.exec_driver_sql(sql)
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_views(metadata, conn, **kw):
+    # A pre-compact database still has store_status as a table until
+    # db.migrate_db converts it
+    kind = conn.exec_driver_sql("SELECT type FROM sqlite_master WHERE name = 'store_status'").scalar()
+    if kind is None:
+        create_store_status_view(conn)
+
 class StoreStatus(Base):
-    __tablename__ = "store_status"
-    id = Column(Integer, primary_key=True, index=True)
-    store_id = Column(String, index=True)
-    timestamp_utc = Column(DateTime)
-    status = Column(String)
+    __table__ = STORE_STATUS_VIEW
 
 class BusinessHours(Base):
     __tablename__ = "business_hours"
@@ -20,8 +120,67 @@ class BusinessHours(Base):
     start_time_local = Column(String)
     end_time_local = Column(String)
 
+    # A store may have several intervals per day, so the whole row is the key
+    __table_args__ = (
+        Index("uq_business_hours_row", "store_id", "dayOfWeek", "start_time_local", "end_time_local", unique=True),
+    )
+
 class StoreTimezones(Base):
     __tablename__ = "store_timezones"
     id = Column(Integer, primary_key=True, index=True)
     store_id = Column(String, index=True)
     timezone_str = Column(String)
+
+    __table_args__ = (
+        Index("uq_store_timezones_store", "store_id", unique=True),
+    )
+
+class IngestCheckpoint(Base):
+    """How far each source CSV has been ingested, so a cycle only parses appended bytes"""
+    __tablename__ = "ingest_checkpoints"
+    source = Column(String, primary_key=True)
+    offset = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)
+    mtime = Column(Float, nullable=False)
+    # Hash of the bytes just before offset, to detect files rewritten in place
+    tail_hash = Column(String, nullable=False)
+
+class AppState(Base):
+    """Small key/value store for process-independent bookkeeping (data and schedule versions)"""
+    __tablename__ = "app_state"
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
+
+class ReportJob(Base):
+    """Report jobs shared by all API processes; see job_queue.py"""
+    __tablename__ = "report_jobs"
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False)
+    # JSON keyword arguments for the job's handler
+    params = Column(String, nullable=False, default="{}")
+    # Higher runs first
+    priority = Column(Integer, nullable=False, default=0)
+    # queued, running, complete, failed or evicted
+    status = Column(String, nullable=False)
+    error = Column(String)
+    path = Column(String)
+    # Identical requests share a job: the data watermark for full reports
+    cache_key = Column(String)
+    attempts = Column(Integer, nullable=False, default=0)
+    lease_owner = Column(String)
+    # Epoch seconds; a running job whose lease expired is picked up again
+    lease_expires = Column(Float)
+    created_at = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_report_jobs_claim", "status", "priority", "created_at"),
+        # Cursor pagination of GET /reports
+        Index("ix_report_jobs_created", "created_at", "id"),
+        # At most one live job per cache key, across processes
+        Index("uq_report_jobs_live_key", "cache_key", unique=True,
+              sqlite_where=text("cache_key IS NOT NULL AND status IN ('queued', 'running', 'complete')")),
+        # At most one queued or running ingest / retention job, across processes
+        Index("uq_report_jobs_live_maintenance", "kind", unique=True,
+              sqlite_where=text("kind IN ('ingest', 'retention') AND status IN ('queued', 'running')")),
+    )
@@ -0,0 +1,298 @@
+"""
+Push ingestion of status polls: POST /observations.
+
+Pollers send polls as NDJSON (one {"store_id", "timestamp_utc", "status"}
+object per line) or as CSV with the columns of store_status.csv, instead
+of rewriting the CSV and waiting for the next ingest cycle. The body is
+parsed as it arrives, OBSERVATIONS_BATCH_ROWS rows at a time, and the
+batches go through a queue of at most OBSERVATIONS_QUEUE_MAX batches to
+one writer thread. The writer upserts whatever batches are waiting in one
+transaction (db.upsert_observations), so SQLite sees one writer and few
+commits however many pollers push at once.
+
+A request waits up to OBSERVATIONS_QUEUE_WAIT seconds for room in the
+queue; after that it gets 429 with Retry-After. The batches queued before
+stay written, and the upsert is idempotent, so a client can resend the
+whole body. Rows that do not parse are skipped and reported with their
+line numbers.
+"""
+import asyncio
+import csv
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from db import upsert_observations
+from metrics import OBSERVATIONS_QUEUE, OBSERVATIONS_ROWS_PER_SECOND, OBSERVATIONS_ROWS_REJECTED, OBSERVATIONS_THROTTLED
+from utils import to_epoch_us
+
+# Rows parsed from a body per queued batch
+OBSERVATIONS_BATCH_ROWS = int(os.environ.get("OBSERVATIONS_BATCH_ROWS", "5000"))
+# Batches waiting for the writer before requests are turned away
+OBSERVATIONS_QUEUE_MAX = int(os.environ.get("OBSERVATIONS_QUEUE_MAX", "64"))
+OBSERVATIONS_QUEUE_WAIT = float(os.environ.get("OBSERVATIONS_QUEUE_WAIT", "2"))
+# Most rows the writer upserts in one transaction
+OBSERVATIONS_WRITE_ROWS = int(os.environ.get("OBSERVATIONS_WRITE_ROWS", "50000"))
+# Longest line accepted, so a body without newlines cannot fill memory
+OBSERVATIONS_MAX_LINE = 64 * 1024
+# Parse errors listed in a response (all are counted)
+OBSERVATIONS_MAX_ERRORS = 10
+
+FORMATS = {
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json": "ndjson",
+    "text/csv": "csv",
+}
+COLUMNS = ("store_id", "timestamp_utc", "status")
+STATUSES = {"active": True, "inactive": False}
+
+_queue = queue.Queue(maxsize=OBSERVATIONS_QUEUE_MAX)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class Rejected(Exception):
+    """A request stopped early: status_code, and result with the rows accepted so far."""
+
+    def __init__(self, status_code, message, result):
+        super().__init__(message)
+        self.status_code = status_code
+        self.result = result
+
+
+def body_format(content_type):
+    """"ndjson" or "csv" for a Content-Type header, None if unsupported."""
+    return FORMATS.get((content_type or "").split(";")[0].strip().lower())
+
+
+def parse_timestamp(value):
+    """Epoch microseconds of 'YYYY-MM-DD HH:MM:SS[.ffffff][ UTC]' or ISO 8601 (naive = UTC)."""
+    if not isinstance(value, str):
+        raise ValueError(f"timestamp_utc must be a string, not {value!r}")
+    value = value.strip()
+    if value.endswith(" UTC"):
+        value = value[:-4]
+    return to_epoch_us(datetime.fromisoformat(value))
+
+
+def parse_observation(store_id, timestamp_utc, status):
+    """(store_id, epoch microseconds, active) of one poll; raises ValueError."""
+    if isinstance(store_id, int) and not isinstance(store_id, bool):
+        store_id = str(store_id)
+    if not isinstance(store_id, str) or not store_id.strip():
+        raise ValueError("missing store_id")
+    if status not in STATUSES:
+        raise ValueError(f"status must be active or inactive, not {status!r}")
+    return store_id.strip(), parse_timestamp(timestamp_utc), STATUSES[status]
+
+
+class ObservationParser:
+    """
+    Incremental parser of a request body: feed() takes bytes as they
+    arrive and returns the complete batches parsed so far, finish() the
+    rest. Raises Rejected for a missing CSV header or an overlong line.
+    """
+
+    def __init__(self, fmt, batch_rows=None):
+        self.fmt = fmt
+        self.batch_rows = batch_rows or OBSERVATIONS_BATCH_ROWS
+        self.columns = None
+        self.line = 0
+        self.rejected = 0
+        self.errors = []
+        self._buffer = b""
+        self._batch = []
+
+    def feed(self, data):
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+        if len(self._buffer) > OBSERVATIONS_MAX_LINE:
+            raise Rejected(400, f"Line {self.line + 1} is longer than {OBSERVATIONS_MAX_LINE} bytes", {})
+        return self._parse_lines(lines)
+
+    def finish(self):
+        batches = self._parse_lines([self._buffer] if self._buffer.strip() else [])
+        self._buffer = b""
+        if self.fmt == "csv" and self.columns is None:
+            raise Rejected(400, f"CSV header must name the columns {', '.join(COLUMNS)}", {})
+        if self._batch:
+            batches.append(self._batch)
+            self._batch = []
+        return batches
+
+    def _parse_lines(self, lines):
+        batches = []
+        for raw in lines:
+            self.line += 1
+            try:
+                text = raw.decode("utf-8").rstrip("\r")
+                if not text.strip():
+                    continue
+                if self.fmt == "csv" and self.columns is None:
+                    self._read_header(text)
+                    continue
+                self._batch.append(self._parse_line(text))
+            except ValueError as e:
+                self.rejected += 1
+                if len(self.errors) < OBSERVATIONS_MAX_ERRORS:
+                    self.errors.append(f"line {self.line}: {e}")
+                continue
+            if len(self._batch) >= self.batch_rows:
+                batches.append(self._batch)
+                self._batch = []
+        return batches
+
+    def _read_header(self, text):
+        header = next(csv.reader([text]))
+        if not set(COLUMNS) <= set(header):
+            raise Rejected(400, f"CSV header must name the columns {', '.join(COLUMNS)}", {})
+        self.columns = [header.index(column) for column in COLUMNS]
+
+    def _parse_line(self, text):
+        if self.fmt == "csv":
+            fields = next(csv.reader([text]))
+            if len(fields) <= max(self.columns):
+                raise ValueError(f"expected at least {max(self.columns) + 1} fields, got {len(fields)}")
+            return parse_observation(*(fields[i] for i in self.columns))
+        record = json.loads(text)
+        if not isinstance(record, dict):
+            raise ValueError("expected a JSON object")
+        return parse_observation(*(record.get(column) for column in COLUMNS))
+
+
+def _write_loop():
+    while True:
+        item = _queue.get()
+        if item is None:
+            return
+        # Everything already waiting goes into the same transaction
+        group, rows = [item], len(item[0])
+        while rows < OBSERVATIONS_WRITE_ROWS:
+            try:
+                item = _queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                _queue.put(None)
+                break
+            group.append(item)
+            rows += len(item[0])
+        OBSERVATIONS_QUEUE.set(_queue.qsize())
+
+        started = time.perf_counter()
+        try:
+            changed = upsert_observations([batch for batch, _ in group])
+        except Exception as e:
+            print(f"[OBSERVATIONS] write of {rows} rows failed: {e}")
+            for _, future in group:
+                future.set_exception(e)
+            continue
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        OBSERVATIONS_ROWS_PER_SECOND.set(rows / elapsed)
+        print(f"[OBSERVATIONS] wrote {rows} rows in {len(group)} batches, {sum(changed)} changed "
+              f"({rows / elapsed:,.0f} rows/sec)")
+        for (_, future), count in zip(group, changed):
+            future.set_result(count)
+
+
+def start():
+    """Start the writer thread unless it is running."""
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_loop, name="observations-writer", daemon=True)
+            _writer.start()
+
+
+def stop(timeout=None):
+    """Let the writer finish the queued batches, then end it."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        try:
+            _queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        writer.join(timeout)
+
+
+def queue_full():
+    return _queue.full()
+
+
+async def enqueue(batch, wait=None):
+    """Queue a batch for the writer, waiting up to wait seconds for room; returns its future (rows changed)."""
+    start()
+    wait = OBSERVATIONS_QUEUE_WAIT if wait is None else wait
+    future = Future()
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            _queue.put_nowait((batch, future))
+            break
+        except queue.Full:
+            if time.monotonic() >= deadline:
+                raise
+            await asyncio.sleep(0.01)
+    OBSERVATIONS_QUEUE.set(_queue.qsize())
+    return future
+
+
+async def ingest(chunks, fmt):
+    """
+    Parse and queue an async iterable of body chunks, then wait for the
+    writer. Returns counts and rows/sec; raises Rejected (400, 429, or 500
+    if the writer failed) with the counts so far.
+    """
+    started = time.perf_counter()
+    parser = ObservationParser(fmt)
+    # (future of rows changed, rows in the batch)
+    futures, rows = [], 0
+
+    def result():
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        written = [(future.result(), size) for future, size in futures if future.exception() is None]
+        return {
+            "rows": rows,
+            "changed": sum(changed for changed, _ in written),
+            "failed": rows - sum(size for _, size in written),
+            "rejected": parser.rejected,
+            "errors": parser.errors,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(rows / elapsed, 1),
+        }
+
+    async def submit(batches):
+        nonlocal rows
+        for batch in batches:
+            futures.append((await enqueue(batch), len(batch)))
+            rows += len(batch)
+
+    stopped = None
+    try:
+        async for chunk in chunks:
+            await submit(parser.feed(chunk))
+        await submit(parser.finish())
+    except (Rejected, queue.Full) as e:
+        stopped = e
+    # What was queued is written either way: wait for it and report it
+    await asyncio.gather(*(asyncio.wrap_future(future) for future, _ in futures), return_exceptions=True)
+    OBSERVATIONS_ROWS_REJECTED.inc(parser.rejected)
+    failures = [future.exception() for future, _ in futures if future.exception() is not None]
+    if failures:
+        raise Rejected(500, f"Write failed: {failures[0]}", result())
+    if isinstance(stopped, Rejected):
+        raise Rejected(stopped.status_code, str(stopped), result())
+    if stopped is not None:
+        OBSERVATIONS_THROTTLED.inc()
+        raise Rejected(429, "Write queue is full, retry later", result())
+    summary = result()
+    print(f"[OBSERVATIONS] request: {rows} rows, {parser.rejected} rejected in {summary['seconds']}s "
+          f"({summary['rows_per_sec']:,.0f} rows/sec)")
+    return summary
@@ -1,15 +1,40 @@
-import pandas as pd
+import numpy as np
 import os
+import time
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import pytz
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from db import SessionLocal
-from models import StoreStatus, BusinessHours, StoreTimezones
-from utils import get_local_time_range, interpolate_status
-import json
+from datetime import timedelta
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, sessionmaker
+from db import SessionLocal, database_path, read_only_engine, get_ingest_version, store_fingerprints
+from models import StatusPoll, Store, BusinessHours, StoreTimezones
+from utils import get_local_time_range, interpolate_status, to_epoch_us, from_epoch_us
+from uptime_engine import compute_report_rows, poll_range, polled_store_ids, bucket_edges, bucket_totals, GRANULARITY_US
+from uptime_engine import load_status_arrays, load_store_series, polls_from_arrays
+from schedule import DEFAULT_TIMEZONE, get_store_schedules, load_business_hours, load_timezones, schedules_version
+from schedule import local_time_range, store_schedule
+from report_writer import ReportWriter, report_path, DEFAULT_FORMAT
+import report_state
+import status_cache
+from metrics import phase, REPORT_SECONDS, REPORTS, STORES_PROCESSED, REPORT_ROWS, PHASE_SECONDS
 
 STATUS_FILE = 'output/status.json'
 
+# How report uptime is computed: "engine" (vectorized, default) or
+# "reference" (per-store loop); both give the same numbers
+REPORT_METHODS = ("engine", "reference")
+REPORT_METHOD = os.environ.get("REPORT_METHOD", "engine")
+
+# Worker processes for generate_report; 1 keeps it in the calling thread
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", "1"))
+# Shards per worker, so a slow shard does not leave the other cores idle
+SHARDS_PER_WORKER = 4
+# Stores per batch handed to the report writer
+REPORT_BATCH_STORES = int(os.environ.get("REPORT_BATCH_STORES", "2000"))
+
 # Remove the local status tracking - main.py will handle this
 # reports_status = {}
 
@@ -21,76 +46,237 @@ STATUS_FILE = 'output/status.json'
 #     """Get report status"""
 #     return reports_status.get(report_id, "Not found")
 
-def generate_report(report_id: str):
+def generate_report(report_id: str, method: str = None, workers: int = None, fmt: str = DEFAULT_FORMAT,
+                    differential: bool = None):
+    """
+    Full report of every polled store. differential (default
+    REPORT_DIFFERENTIAL) reuses the rows of the last full report for stores
+    whose data and windows did not change, see report_state.py.
+    """
+    method = method or REPORT_METHOD
+    workers = REPORT_WORKERS if workers is None else workers
+    differential = report_state.REPORT_DIFFERENTIAL if differential is None else differential
+    started = time.perf_counter()
     try:
         db: Session = SessionLocal()
-        stores = db.query(StoreStatus.store_id).distinct().all()
-        stores = [s[0] for s in stores]
-
-        max_timestamp = db.query(StoreStatus.timestamp_utc).order_by(StoreStatus.timestamp_utc.desc()).first()[0]
-        now = max_timestamp.astimezone(pytz.utc)
+        with phase("report", "query"):
+            stores = polled_store_ids(db)
+            _, latest_us = poll_range(db)
+            version = get_ingest_version(db.connection())
+            status_cache.refresh_if_stale(db, version)
+        now = from_epoch_us(latest_us)
         intervals = {
             'hour': now - timedelta(hours=1),
             'day': now - timedelta(days=1),
             'week': now - timedelta(days=7),
         }
 
-        rows = []
+        reuse, base = {}, None
+        state = report_state.load_state() if differential else None
+        if state is not None:
+            with phase("report", "differential"):
+                conn = db.connection()
+                reuse = report_state.reusable_rows(db, state, stores, now, intervals, version,
+                                                   schedules_version(conn), store_fingerprints(conn), method)
+            base = state[0]["report_id"]
+            row_batches = _merge_reused_rows(db, stores, reuse, now, intervals, method, workers, version)
+        else:
+            row_batches = iter_report_rows(db, stores, now, intervals, method, workers, version)
 
-        for store_id in stores:
-            timezone = db.query(StoreTimezones).filter_by(store_id=store_id).first()
-            timezone_str = timezone.timezone_str if timezone else 'America/Chicago'
+        os.makedirs('output', exist_ok=True)
+        saved = report_state.StateBuilder()
+        # Rows go to disk batch by batch; the file appears only once complete
+        with ReportWriter(report_path(report_id, fmt), fmt) as writer:
+            for rows in row_batches:
+                with phase("report", "serialization"):
+                    writer.write_rows(rows)
+                saved.add(rows)
+            with phase("report", "serialization"):
+                writer.close()
+        report_state.save_state(saved, report_id, latest_us, version, method)
+        metadata = report_state.report_metadata(report_id, "differential" if state is not None else "full",
+                                                len(stores), len(reuse), latest_us, version, method, started, base)
+        report_state.write_metadata(report_id, metadata)
+        if state is not None:
+            print(f"[REPORT] differential from {base}: {metadata['recomputed']} stores recomputed, "
+                  f"{metadata['reused']} reused")
+        STORES_PROCESSED.inc(len(stores), kind="full")
+        REPORT_ROWS.inc(writer.rows_written, format=fmt)
+        REPORTS.inc(kind="full", outcome="complete")
+        # Status will be updated by main.py, not here
 
-            metrics = {
-                'store_id': store_id
-            }
-            for label, start_time in intervals.items():
-                start_time = start_time.astimezone(pytz.utc)
+    except Exception as e:
+        REPORTS.inc(kind="full", outcome="failed")
+        print(f"[ERROR] Report generation failed for {report_id}: {e}")
+        # Status will be updated by main.py, not here
+    finally:
+        REPORT_SECONDS.observe(time.perf_counter() - started, kind="full")
+        if 'db' in locals():
+            db.close()
 
-                status_data = db.query(StoreStatus).filter(
-                    StoreStatus.store_id == store_id,
-                    StoreStatus.timestamp_utc >= start_time,
-                    StoreStatus.timestamp_utc <= now
-                ).order_by(StoreStatus.timestamp_utc).all()
+def iter_report_rows(db: Session, stores, now, intervals, method=None, workers=None, version=None):
+    """
+    Yield report rows in sorted store order, in batches of about
+    REPORT_BATCH_STORES stores, so memory stays bounded by the batch size
+    rather than the store count. version is the ingest version the report
+    reads; the status cache is only used while it holds that version.
+    """
+    method = method or REPORT_METHOD
+    if method not in REPORT_METHODS:
+        raise ValueError(f"Unknown report method {method!r}, expected one of {REPORT_METHODS}")
+    workers = REPORT_WORKERS if workers is None else workers
+    if method == 'reference':
+        for batch in _store_batches(stores):
+            yield compute_report_rows_reference(db, batch, now, intervals)
+    elif workers > 1:
+        yield from iter_report_rows_parallel(stores, now, intervals, workers)
+    else:
+        start_us = to_epoch_us(min(intervals.values()))
+        for batch in _store_batches(stores):
+            # Warm status_cache: no status query per batch
+            arrays = status_cache.status_arrays(batch, start_us, to_epoch_us(now), version)
+            yield compute_report_rows(db, batch, now, intervals, store_range=(batch[0], batch[-1]), arrays=arrays)
+
+def _merge_reused_rows(db, stores, reuse, now, intervals, method, workers, version=None):
+    """Rows of all stores in order: reused ones as given, the others computed."""
+    dirty = [store_id for store_id in stores if store_id not in reuse]
+    computed = {}
+    if dirty:
+        for rows in iter_report_rows(db, dirty, now, intervals, method, workers, version):
+            computed.update((row['store_id'], row) for row in rows)
+    for batch in _store_batches(stores):
+        yield [reuse.get(store_id) or computed[store_id] for store_id in batch]
+
+def _store_batches(stores):
+    for i in range(0, len(stores), REPORT_BATCH_STORES):
+        yield stores[i:i + REPORT_BATCH_STORES]
+
+_worker_session = None
+
+def _init_report_worker(path):
+    global _worker_session
+    _worker_session = sessionmaker(bind=read_only_engine(path))()
+
+def _report_shard(shard_index, store_ids, now, intervals):
+    started = time.perf_counter()
+    rows = compute_report_rows(_worker_session, store_ids, now, intervals,
+                               store_range=(store_ids[0], store_ids[-1]))
+    _worker_session.rollback()
+    return shard_index, rows, time.perf_counter() - started
+
+def compute_report_rows_parallel(stores, now, intervals, workers):
+    """
+    Split the sorted store list into contiguous shards and compute them in a
+    process pool, each worker on its own read-only SQLite connection. Rows are
+    merged back in shard order, so the output order is the sorted store order.
+    Returns (rows, timings) where timings holds per-shard seconds and scaling.
+    """
+    timings = {}
+    rows = [row for shard in iter_report_rows_parallel(stores, now, intervals, workers, timings) for row in shard]
+    return rows, timings
 
-                biz_hours = db.query(BusinessHours).filter_by(store_id=store_id).all()
+def iter_report_rows_parallel(stores, now, intervals, workers, timings=None):
+    """
+    Generator behind compute_report_rows_parallel: yields each shard's rows in
+    shard order as soon as it and all earlier shards are done, and fills
+    timings (if given) when the pool is finished.
+    """
+    stores = sorted(stores)
+    n_shards = min(len(stores), workers * SHARDS_PER_WORKER) or 1
+    size = -(-len(stores) // n_shards)
+    shards = [stores[i:i + size] for i in range(0, len(stores), size)]
+
+    started = time.perf_counter()
+    shard_seconds = {}
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_report_worker, initargs=(database_path(),)) as pool:
+        futures = [pool.submit(_report_shard, i, shard, now, intervals) for i, shard in enumerate(shards)]
+        for future in futures:
+            shard_index, rows, seconds = future.result()
+            shard_seconds[shard_index] = seconds
+            PHASE_SECONDS.observe(seconds, operation="report", phase="shard")
+            yield rows
+    wall = time.perf_counter() - started
+
+    busy = sum(shard_seconds.values())
+    timings = {} if timings is None else timings
+    timings.update({
+        "workers": workers,
+        "shards": len(shards),
+        "wall_seconds": round(wall, 3),
+        "shard_seconds": [round(shard_seconds[i], 3) for i in range(len(shards))],
+        # busy / wall approaches the worker count when scaling is linear
+        "speedup": round(busy / wall, 2) if wall > 0 else 0,
+    })
+    timings["efficiency"] = round(timings["speedup"] / workers, 2)
+    print(f"[REPORT] {len(stores)} stores in {len(shards)} shards on {workers} workers: "
+          f"{timings['wall_seconds']}s wall, {round(busy, 3)}s in shards, "
+          f"speedup {timings['speedup']}x ({timings['efficiency']:.0%} efficiency)")
+
+def compute_report_rows_reference(db: Session, stores, now, intervals):
+    """
+    Per-store reference implementation of the report rows, kept for
+    equivalence testing against uptime_engine.compute_report_rows.
+    The polls of the widest window are read for all stores in one scan,
+    with the timezones and business hours in one query each; the shorter
+    windows are sliced from them in memory.
+    """
+    rows = []
+    earliest = min(start_time.astimezone(pytz.utc) for start_time in intervals.values())
+    now_us = to_epoch_us(now)
+    arrays = load_status_arrays(db, stores, earliest, now)
+    timezones = load_timezones(db)
+    hours = load_business_hours(db)
 
-                if not biz_hours:
-                    business_periods = get_local_time_range(start_time, now, timezone_str, full_day=True)
-                else:
-                    business_periods = get_local_time_range(start_time, now, timezone_str, hours=biz_hours)
+    for store_id in stores:
+        timezone_str = timezones.get(store_id, 'America/Chicago')
 
-                up, down = interpolate_status(status_data, business_periods)
-                metrics[f'uptime_last_{label}'] = round(up.total_seconds() / 3600 if label != 'hour' else up.total_seconds() / 60, 2)
-                metrics[f'downtime_last_{label}'] = round(down.total_seconds() / 3600 if label != 'hour' else down.total_seconds() / 60, 2)
+        metrics = {
+            'store_id': store_id
+        }
+        for label, start_time in intervals.items():
+            start_time = start_time.astimezone(pytz.utc)
 
-            rows.append(metrics)
+            status_data = polls_from_arrays(*arrays.store_series(store_id, to_epoch_us(start_time), now_us))
 
-        df = pd.DataFrame(rows)
-        os.makedirs('output', exist_ok=True)
-        df.to_csv(f'output/{report_id}.csv', index=False)
-        # Status will be updated by main.py, not here
+            biz_hours = hours.get(store_id, [])
 
-    except Exception as e:
-        print(f"[ERROR] Report generation failed for {report_id}: {e}")
-        # Status will be updated by main.py, not here
+            if not biz_hours:
+                business_periods = get_local_time_range(start_time, now, timezone_str, full_day=True)
+            else:
+                business_periods = get_local_time_range(start_time, now, timezone_str, hours=biz_hours)
+
+            up, down = interpolate_status(status_data, business_periods)
+            metrics[f'uptime_last_{label}'] = round(up.total_seconds() / 3600 if label != 'hour' else up.total_seconds() / 60, 2)
+            metrics[f'downtime_last_{label}'] = round(down.total_seconds() / 3600 if label != 'hour' else down.total_seconds() / 60, 2)
+
+        rows.append(metrics)
+
+    return rows
 
 def generate_single_store_report(report_id: str, store_id: str):
     """
     Generate detailed report for a single store/restaurant with day, week, and month data
     """
+    started = time.perf_counter()
     try:
         db: Session = SessionLocal()
         
         # Check if store exists
-        store_exists = db.query(StoreStatus).filter_by(store_id=store_id).first()
+        store_key = db.execute(select(Store.store_key).where(Store.store_id == store_id)).scalar()
+        store_exists = store_key is not None and db.execute(
+            select(StatusPoll.ts).where(StatusPoll.store_key == store_key).limit(1)
+        ).first()
         if not store_exists:
+            REPORTS.inc(kind="single_store", outcome="not_found")
             # Status will be updated by main.py, not here
             return
 
         # Get the latest timestamp to use as reference point
-        max_timestamp = db.query(StoreStatus.timestamp_utc).order_by(StoreStatus.timestamp_utc.desc()).first()[0]
-        now = max_timestamp.astimezone(pytz.utc)
+        _, latest_us = poll_range(db)
+        now = from_epoch_us(latest_us)
+        version = get_ingest_version(db.connection())
         
         # Define time intervals - including month
         intervals = {
@@ -99,13 +285,21 @@ def generate_single_store_report(report_id: str, store_id: str):
             'month': now - timedelta(days=30),  # Adding month data
         }
 
-        # Get timezone for the store
-        timezone = db.query(StoreTimezones).filter_by(store_id=store_id).first()
-        timezone_str = timezone.timezone_str if timezone else 'America/Chicago'
+        # Timezone and compiled hours come from the per-ingest schedule maps
+        compiled_hours, timezone_str = store_schedule(db, store_id)
 
         # Get business hours for the store
         biz_hours = db.query(BusinessHours).filter_by(store_id=store_id).all()
 
+        # Polls of the widest window, read once (from status_cache when it
+        # covers it); the other windows are slices of it
+        with phase("single_store_report", "query"):
+            earliest_us = to_epoch_us(min(intervals.values()))
+            series = status_cache.store_series(store_id, earliest_us, latest_us, version)
+            if series is None:
+                series = load_store_series(db, store_key, earliest_us, latest_us)
+        ts, active = series
+
         metrics = {
             'store_id': store_id,
             'timezone': timezone_str,
@@ -116,26 +310,24 @@ def generate_single_store_report(report_id: str, store_id: str):
         for label, start_time in intervals.items():
             start_time = start_time.astimezone(pytz.utc)
 
-            # Get all status data for this store in the time period
-            status_data = db.query(StoreStatus).filter(
-                StoreStatus.store_id == store_id,
-                StoreStatus.timestamp_utc >= start_time,
-                StoreStatus.timestamp_utc <= now
-            ).order_by(StoreStatus.timestamp_utc).all()
+            first = np.searchsorted(ts, to_epoch_us(start_time), side='left')
+            status_count = len(ts) - first
+            status_data = polls_from_arrays(ts[first:], active[first:])
 
-            print(f"[INFO] Found {len(status_data)} status records for store {store_id} in last {label}")
+            print(f"[INFO] Found {status_count} status records for store {store_id} in last {label}")
 
             # Calculate business periods based on business hours
+            with phase("single_store_report", "schedule"):
+                business_periods = local_time_range(compiled_hours, timezone_str, start_time, now)
             if not biz_hours:
                 # If no business hours defined, assume 24/7 operation
-                business_periods = get_local_time_range(start_time, now, timezone_str, full_day=True)
                 print(f"[INFO] No business hours found for store {store_id}, assuming 24/7 operation")
             else:
-                business_periods = get_local_time_range(start_time, now, timezone_str, hours=biz_hours)
                 print(f"[INFO] Using defined business hours for store {store_id}")
 
             # Calculate uptime and downtime
-            up, down = interpolate_status(status_data, business_periods)
+            with phase("single_store_report", "interpolation"):
+                up, down = interpolate_status(status_data, business_periods)
             
             # Convert to hours for all periods (more consistent reporting)
             uptime_hours = round(up.total_seconds() / 3600, 2)
@@ -152,7 +344,7 @@ def generate_single_store_report(report_id: str, store_id: str):
             metrics[f'uptime_percentage_last_{label}'] = uptime_percentage
             
             # Additional info for debugging
-            metrics[f'status_records_last_{label}'] = len(status_data)
+            metrics[f'status_records_last_{label}'] = status_count
             metrics[f'business_periods_last_{label}'] = len(business_periods)
 
         # Add business hours summary
@@ -168,9 +360,13 @@ def generate_single_store_report(report_id: str, store_id: str):
             metrics['business_hours'] = "24/7 (No specific hours defined)"
 
         # Create DataFrame with single row
-        df = pd.DataFrame([metrics])
-        os.makedirs('output', exist_ok=True)
-        df.to_csv(f'output/{report_id}.csv', index=False)
+        with phase("single_store_report", "serialization"):
+            import pandas as pd
+            df = pd.DataFrame([metrics])
+            os.makedirs('output', exist_ok=True)
+            df.to_csv(f'output/{report_id}.csv', index=False)
+        STORES_PROCESSED.inc(kind="single_store")
+        REPORTS.inc(kind="single_store", outcome="complete")
         
         print(f"[SUCCESS] Single store report generated for {store_id}")
         print(f"[SUMMARY] Day: {metrics.get('uptime_last_day_hours', 0)}h up, Week: {metrics.get('uptime_last_week_hours', 0)}h up, Month: {metrics.get('uptime_last_month_hours', 0)}h up")
@@ -178,110 +374,156 @@ def generate_single_store_report(report_id: str, store_id: str):
         # Status will be updated by main.py, not here
 
     except Exception as e:
+        REPORTS.inc(kind="single_store", outcome="failed")
         print(f"[ERROR] Single store report generation failed for {report_id}, store {store_id}: {e}")
         import traceback
         traceback.print_exc()
         # Status will be updated by main.py, not here
     finally:
+        REPORT_SECONDS.observe(time.perf_counter() - started, kind="single_store")
         if 'db' in locals():
             db.close()
 
 
+# Bound on the buckets of one GET /uptime series
+UPTIME_MAX_BUCKETS = int(os.environ.get("UPTIME_MAX_BUCKETS", "5000"))
+
+def get_uptime_series(store_id: str, start=None, end=None, granularity: str = 'hour'):
+    """
+    Uptime/downtime of one store per hour/day/week bucket between start and
+    end (naive = UTC; default: the day up to the latest poll). Each bucket is
+    computed like a report window of its own. Polls come from status_cache
+    when it covers the range. Returns None for an unknown store, and an
+    empty series when no end is given and there are no polls to default it
+    to; raises ValueError for a bad range or granularity.
+    """
+    if granularity not in GRANULARITY_US:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITY_US)}")
+    with SessionLocal() as db:
+        with phase("uptime_query", "query"):
+            store_key = db.execute(select(Store.store_key).where(Store.store_id == store_id)).scalar()
+            if store_key is None:
+                return None
+            data_range = poll_range(db)
+            if data_range is None and end is None:
+                _, timezones = get_store_schedules(db)
+                return {"store_id": store_id, "timezone": timezones.get(store_id, DEFAULT_TIMEZONE),
+                        "granularity": granularity, "start": None, "end": None, "source": "database",
+                        "series": []}
+            end_us = to_epoch_us(end) if end is not None else data_range[1]
+            start_us = to_epoch_us(start) if start is not None else end_us - GRANULARITY_US['day']
+            if end_us <= start_us:
+                raise ValueError("end must be after start")
+            if (end_us - start_us) // GRANULARITY_US[granularity] >= UPTIME_MAX_BUCKETS:
+                raise ValueError(f"more than {UPTIME_MAX_BUCKETS} {granularity} buckets requested")
+
+            version = get_ingest_version(db.connection())
+            series = status_cache.store_series(store_id, start_us, end_us, version)
+            source = "cache"
+            if series is None:
+                series = load_store_series(db, store_key, start_us, end_us)
+                source = "database"
+            schedules, timezones = get_store_schedules(db)
+
+    timezone_str = timezones.get(store_id, DEFAULT_TIMEZONE)
+    edges = bucket_edges(start_us, end_us, granularity)
+    with phase("uptime_query", "interpolation"):
+        up, down = bucket_totals(*series, schedules.get(store_id), timezone_str, edges)
+    return {
+        "store_id": store_id,
+        "timezone": timezone_str,
+        "granularity": granularity,
+        "start": from_epoch_us(start_us).isoformat(),
+        "end": from_epoch_us(end_us).isoformat(),
+        "source": source,
+        "series": [
+            {"start": from_epoch_us(lo).isoformat(), "end": from_epoch_us(hi).isoformat(),
+             "uptime_seconds": round(float(u) / 1e6, 3), "downtime_seconds": round(float(d) / 1e6, 3)}
+            for lo, hi, u, d in zip(edges, edges[1:], up, down)
+        ],
+    }
+
+# Repeat summary lookups are served from memory until the next ingest
+SUMMARY_CACHE_SIZE = int(os.environ.get("SUMMARY_CACHE_SIZE", "10000"))
+# Bound on the store_ids of one IN (...) list
+SUMMARY_QUERY_BATCH = 500
+
+_summary_lock = threading.Lock()
+_summary_cache = OrderedDict()
+_summary_version = None
+
+def _cached_summaries(version, store_ids):
+    global _summary_version
+    with _summary_lock:
+        if version != _summary_version:
+            _summary_cache.clear()
+            _summary_version = version
+        found = {}
+        for store_id in store_ids:
+            if store_id in _summary_cache:
+                _summary_cache.move_to_end(store_id)
+                found[store_id] = _summary_cache[store_id]
+        return found
+
+def _cache_summaries(version, summaries):
+    with _summary_lock:
+        if version != _summary_version:
+            return
+        _summary_cache.update(summaries)
+        while len(_summary_cache) > SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+
+def _query_summaries(db, store_ids):
+    """Summaries of store_ids with one grouped aggregate plus bulk timezone/hours lookups."""
+    summaries = {store_id: {"error": "Store not found"} for store_id in store_ids}
+    for i in range(0, len(store_ids), SUMMARY_QUERY_BATCH):
+        batch = store_ids[i:i + SUMMARY_QUERY_BATCH]
+        polls = db.execute(
+            select(Store.store_id, func.count(), func.min(StatusPoll.ts), func.max(StatusPoll.ts))
+            .join(StatusPoll, StatusPoll.store_key == Store.store_key)
+            .where(Store.store_id.in_(batch))
+            .group_by(Store.store_id)
+        ).all()
+        timezones = dict(db.execute(
+            select(StoreTimezones.store_id, StoreTimezones.timezone_str).where(StoreTimezones.store_id.in_(batch))
+        ).all())
+        hours = dict(db.execute(
+            select(BusinessHours.store_id, func.count()).where(BusinessHours.store_id.in_(batch))
+            .group_by(BusinessHours.store_id)
+        ).all())
+        for store_id, total_records, oldest_us, newest_us in polls:
+            summaries[store_id] = {
+                "store_id": store_id,
+                "total_status_records": total_records,
+                "data_available_from": from_epoch_us(oldest_us).strftime('%Y-%m-%d %H:%M:%S UTC'),
+                "data_available_until": from_epoch_us(newest_us).strftime('%Y-%m-%d %H:%M:%S UTC'),
+                "timezone": timezones.get(store_id, 'America/Chicago'),
+                "has_business_hours": hours.get(store_id, 0) > 0,
+                "business_days_defined": hours.get(store_id, 0)
+            }
+    return summaries
+
+def get_store_summaries(store_ids):
+    """
+    {store_id: summary} of data availability for many stores at once; unknown
+    stores map to {"error": "Store not found"}. Cached per ingest version.
+    """
+    store_ids = list(dict.fromkeys(store_ids))
+    with SessionLocal() as db:
+        version = get_ingest_version(db.connection())
+        summaries = _cached_summaries(version, store_ids)
+        missing = [store_id for store_id in store_ids if store_id not in summaries]
+        if missing:
+            fresh = _query_summaries(db, missing)
+            _cache_summaries(version, fresh)
+            summaries.update(fresh)
+    return {store_id: summaries[store_id] for store_id in store_ids}
+
 def get_store_summary(store_id: str):
     """
     Helper function to get a quick summary of store data availability
     """
     try:
-        db: Session = SessionLocal()
-        
-        # Get basic store info
-        total_records = db.query(StoreStatus).filter_by(store_id=store_id).count()
-        
-        if total_records == 0:
-            return {"error": "Store not found"}
-        
-        # Get date range of available data
-        oldest_record = db.query(StoreStatus.timestamp_utc).filter_by(store_id=store_id).order_by(StoreStatus.timestamp_utc.asc()).first()
-        newest_record = db.query(StoreStatus.timestamp_utc).filter_by(store_id=store_id).order_by(StoreStatus.timestamp_utc.desc()).first()
-        
-        # Get timezone
-        timezone = db.query(StoreTimezones).filter_by(store_id=store_id).first()
-        timezone_str = timezone.timezone_str if timezone else 'America/Chicago'
-        
-        # Get business hours
-        biz_hours = db.query(BusinessHours).filter_by(store_id=store_id).all()
-        
-        return {
-            "store_id": store_id,
-            "total_status_records": total_records,
-            "data_available_from": oldest_record[0].strftime('%Y-%m-%d %H:%M:%S UTC') if oldest_record else None,
-            "data_available_until": newest_record[0].strftime('%Y-%m-%d %H:%M:%S UTC') if newest_record else None,
-            "timezone": timezone_str,
-            "has_business_hours": len(biz_hours) > 0,
-            "business_days_defined": len(biz_hours)
-        }
-        
+        return get_store_summaries([store_id])[store_id]
     except Exception as e:
         return {"error": str(e)}
-    finally:
-        if 'db' in locals():
-            db.close()
-import pytz
-from datetime import datetime, timedelta, time
-from collections import defaultdict
-
-def get_local_time_range(start, end, timezone_str, hours=None, full_day=False):
-    tz = pytz.timezone(timezone_str)
-    local_periods = []
-    current = start.astimezone(pytz.utc)
-    end = end.astimezone(pytz.utc)
-    while current <= end:
-        local = current.astimezone(tz)
-        day = local.weekday()
-        if full_day:
-            local_periods.append((current, end))
-            break
-        day_hours = [h for h in hours if h.dayOfWeek == day]
-        for h in day_hours:
-            start_time_obj = datetime.strptime(h.start_time_local, "%H:%M:%S").time()
-            end_time_obj = datetime.strptime(h.end_time_local, "%H:%M:%S").time()
-
-            start_local = datetime.combine(local.date(), start_time_obj)
-            end_local = datetime.combine(local.date(), end_time_obj)
-
-            start_utc = tz.localize(start_local).astimezone(pytz.utc)
-            end_utc = tz.localize(end_local).astimezone(pytz.utc)
-
-            if end_utc >= start and start_utc <= end:
-                local_periods.append((max(start_utc, start), min(end_utc, end)))
-        current += timedelta(days=1)
-    return local_periods
-
-def interpolate_status(status_data, periods):
-    if not status_data:
-        return timedelta(), sum((end - start for start, end in periods), timedelta())
-
-    up = timedelta()
-    down = timedelta()
-    for period_start, period_end in periods:
-        times = [s.timestamp_utc.replace(tzinfo=pytz.utc) for s in status_data if period_start <= s.timestamp_utc.replace(tzinfo=pytz.utc) <= period_end]
-        states = [s.status for s in status_data if period_start <= s.timestamp_utc.replace(tzinfo=pytz.utc) <= period_end]
-
-        if not times:
-            down += (period_end - period_start)
-            continue
-
-        for i in range(len(times) - 1):
-            duration = times[i + 1] - times[i]
-            if states[i] == 'active':
-                up += duration
-            else:
-                down += duration
-
-        last_duration = period_end - times[-1]
-        if states[-1] == 'active':
-            up += last_duration
-        else:
-            down += last_duration
-
-    return up, down
\ No newline at end of file
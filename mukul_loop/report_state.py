@@ -0,0 +1,143 @@
+"""
+Differential full reports.
+
+Every full report saves its rows as arrays to STATE_PATH, together with
+the data it was computed from (latest poll, ingest version, method). A
+differential report starts from that state and only recomputes the
+stores whose rows can differ:
+
+- stores whose polls changed since, by the changed_version of their
+  store_fingerprints row (kept by ingestion and retention, see db.py)
+- stores for which moving the windows from the old latest poll to the new
+  one changes the business periods of any window: always for stores open
+  24/7, and for others when a period touches either end of the shift
+
+A store with the same polls and the same clipped periods gets the same
+numbers, so its old row is carried over. Any change to business hours or
+timezones since the saved report makes every store dirty. Each report
+writes {report_id}.meta.json next to it with the counts of recomputed and
+reused stores.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from schedule import DEFAULT_TIMEZONE, get_store_schedules, utc_intervals
+from utils import to_epoch_us
+
+# Default for POST /trigger_report without ?differential=
+REPORT_DIFFERENTIAL = os.environ.get("REPORT_DIFFERENTIAL", "0") == "1"
+STATE_PATH = os.environ.get("REPORT_STATE_PATH", "output/report_state.npz")
+
+
+def metadata_path(report_id, directory="output"):
+    return os.path.join(directory, f"{report_id}.meta.json")
+
+
+def write_metadata(report_id, metadata, directory="output"):
+    os.makedirs(directory, exist_ok=True)
+    with open(metadata_path(report_id, directory), "w") as f:
+        json.dump(metadata, f)
+
+
+def read_metadata(report_id, directory="output"):
+    """Metadata of a report, or None if it has none (e.g. single-store reports)."""
+    try:
+        with open(metadata_path(report_id, directory)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class StateBuilder:
+    """Collects written report rows as (store ids, values per column)."""
+
+    def __init__(self):
+        self.stores = []
+        self.columns = None
+        self.values = []
+
+    def add(self, rows):
+        for row in rows:
+            if self.columns is None:
+                self.columns = [c for c in row if c != 'store_id']
+            self.stores.append(row['store_id'])
+            self.values.append([row[c] for c in self.columns])
+
+
+def save_state(builder, report_id, now_us, version, method, path=None):
+    """Replace the saved state with the rows of report_id."""
+    path = path or STATE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    header = {"report_id": report_id, "now_us": now_us, "version": version, "method": method,
+              "columns": builder.columns or []}
+    tmp = f"{path}.part"
+    with open(tmp, "wb") as f:
+        np.savez(f, header=np.array(json.dumps(header)), stores=np.array(builder.stores, dtype=str),
+                 values=np.array(builder.values, dtype=np.float64).reshape(len(builder.stores), -1))
+    os.replace(tmp, path)
+
+
+def load_state(path=None):
+    """(header, {store_id: row values}) of the last full report, or None."""
+    path = path or STATE_PATH
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(str(data["header"]))
+            stores, values = data["stores"].tolist(), data["values"]
+    except (OSError, ValueError, KeyError) as e:
+        if os.path.exists(path):
+            print(f"[REPORT] ignoring report state {path}: {e}")
+        return None
+    return header, dict(zip(stores, values))
+
+
+def reusable_rows(db, state, stores, now, intervals, version, schedules_version, fingerprints, method):
+    """
+    {store_id: row} of the stores whose saved rows are still exact for this
+    report (see the module docstring). Empty when the state cannot be used.
+    """
+    header, saved = state
+    columns = [f'{kind}_last_{label}' for label in intervals for kind in ('uptime', 'downtime')]
+    if (header["method"] != method or header["columns"] != columns
+            or header["version"] > version or schedules_version > header["version"]):
+        return {}
+
+    now_us = to_epoch_us(now)
+    old_now_us = header["now_us"]
+    schedules, timezones = get_store_schedules(db)
+    # Window offsets from the latest poll, e.g. one hour
+    offsets = [now_us - to_epoch_us(start) for start in intervals.values()]
+
+    reuse = {}
+    for store_id in stores:
+        values = saved.get(store_id)
+        fingerprint = fingerprints.get(store_id)
+        if values is None or fingerprint is None or fingerprint[2] > header["version"]:
+            continue
+        if old_now_us != now_us:
+            schedule, timezone_str = schedules.get(store_id), timezones.get(store_id, DEFAULT_TIMEZONE)
+            if any(utc_intervals(schedule, timezone_str, old_now_us - offset, old_now_us)
+                   != utc_intervals(schedule, timezone_str, now_us - offset, now_us) for offset in offsets):
+                continue
+        row = {'store_id': store_id}
+        row.update(zip(columns, (float(v) for v in values)))
+        reuse[store_id] = row
+    return reuse
+
+
+def report_metadata(report_id, mode, stores, reused, now_us, version, method, started, base=None):
+    return {
+        "report_id": report_id,
+        "mode": mode,
+        "base_report_id": base,
+        "stores": stores,
+        "recomputed": stores - reused,
+        "reused": reused,
+        "now_us": now_us,
+        "ingest_version": version,
+        "method": method,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
@@ -0,0 +1,260 @@
+"""
+Incremental report output.
+
+generate_report hands rows to a ReportWriter batch by batch as stores are
+computed, so the full report never has to be held as one DataFrame. The file
+is written to a ".part" path and renamed into place on close, so a report
+path that exists is always complete.
+
+Formats:
+    csv      plain CSV, same layout as the original pandas output
+    csv.gz   gzip-compressed CSV, served with Content-Encoding: gzip
+    parquet  columnar, needs the optional pyarrow package
+
+Next to each report the writer saves a row index ("<path>.idx"): the store
+id of every row and, for CSV, the byte offset of its line in the decoded
+text. read_rows() serves pages of a report from it without reading the
+rows before the page; reports written without one (single-store reports)
+get it built on first use.
+"""
+import csv
+import gzip
+import io
+import os
+
+import numpy as np
+
+# format -> (file suffix, media type of the decoded content)
+REPORT_FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "csv.gz": (".csv.gz", "text/csv"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+DEFAULT_FORMAT = "csv"
+
+# Rows buffered per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 10_000
+
+
+def validate_format(fmt):
+    """Raise ValueError for unknown formats, or for parquet without pyarrow."""
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format {fmt!r}, expected one of {', '.join(REPORT_FORMATS)}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet reports need pyarrow installed (pip install pyarrow)")
+
+
+def report_path(report_id, fmt=DEFAULT_FORMAT, directory="output"):
+    return os.path.join(directory, f"{report_id}{REPORT_FORMATS[fmt][0]}")
+
+
+def media_type(fmt):
+    return REPORT_FORMATS[fmt][1]
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+def _save_index(path, store_ids, offsets):
+    tmp = index_path(path) + ".part"
+    with open(tmp, "wb") as f:
+        np.savez(f, store_ids=np.array(store_ids, dtype=str), offsets=np.array(offsets, dtype=np.int64))
+    os.replace(tmp, index_path(path))
+
+
+class ReportWriter:
+    def __init__(self, path, fmt=DEFAULT_FORMAT):
+        validate_format(fmt)
+        self.path = path
+        self.fmt = fmt
+        self.rows_written = 0
+        self._tmp_path = path + ".part"
+        self._file = None
+        self._csv = None
+        self._parquet = None
+        self._pending = []
+        self._closed = False
+        # Row index: store id per row and, for CSV, its line's byte offset
+        self._store_ids = []
+        self._offsets = []
+        self._position = 0
+        self._line = io.StringIO()
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        self._store_ids.extend(row.get('store_id') for row in rows)
+        if self.fmt == "parquet":
+            self._pending.extend(rows)
+            if len(self._pending) >= PARQUET_ROW_GROUP_SIZE:
+                self._flush_parquet()
+        else:
+            if self._csv is None:
+                self._open_csv(rows[0].keys())
+            # Rows are formatted one at a time to record where each line starts
+            lines = []
+            for row in rows:
+                self._offsets.append(self._position)
+                self._csv.writerow(row)
+                line = self._line.getvalue()
+                self._line.seek(0)
+                self._line.truncate()
+                self._position += len(line.encode())
+                lines.append(line)
+            self._file.write("".join(lines))
+        self.rows_written += len(rows)
+
+    def _open_csv(self, fieldnames):
+        if self.fmt == "csv.gz":
+            # Level 6: most of level 9's ratio on numeric columns at a
+            # fraction of the CPU
+            self._file = gzip.open(self._tmp_path, "wt", newline="", compresslevel=6, encoding="utf-8")
+        else:
+            self._file = open(self._tmp_path, "w", newline="", encoding="utf-8")
+        self._csv = csv.DictWriter(self._line, fieldnames=list(fieldnames), lineterminator="\n")
+        self._csv.writeheader()
+        header = self._line.getvalue()
+        self._line.seek(0)
+        self._line.truncate()
+        self._file.write(header)
+        self._position = len(header.encode())
+
+    def _flush_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._pending:
+            return
+        table = pa.Table.from_pylist(self._pending)
+        if self._parquet is None:
+            self._parquet = pq.ParquetWriter(self._tmp_path, table.schema, compression="snappy")
+        self._parquet.write_table(table)
+        self._pending = []
+
+    def close(self):
+        """Finish the file and move it into place."""
+        if self._closed:
+            return
+        self._closed = True
+        if self.fmt == "parquet":
+            self._flush_parquet()
+            if self._parquet is not None:
+                self._parquet.close()
+        elif self._file is not None:
+            self._file.close()
+        if self.rows_written == 0:
+            self._write_empty()
+        _save_index(self.path, self._store_ids, self._offsets)
+        os.replace(self._tmp_path, self.path)
+
+    def _write_empty(self):
+        # A report over a database without polls has no rows and no columns
+        if self.fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.table({}), self._tmp_path)
+        elif self.fmt == "csv.gz":
+            gzip.open(self._tmp_path, "wb").close()
+        else:
+            open(self._tmp_path, "wb").close()
+
+    def abort(self):
+        for handle in (self._file, self._parquet):
+            if handle is not None:
+                try:
+                    handle.close()
+                except Exception:
+                    pass
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def _open_text(path, fmt):
+    if fmt == "csv.gz":
+        return gzip.open(path, "rt", newline="", encoding="utf-8")
+    return open(path, newline="", encoding="utf-8")
+
+
+def build_index(path, fmt=DEFAULT_FORMAT):
+    """Write the row index of a report that has none by reading it once."""
+    store_ids, offsets = [], []
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        if "store_id" in parquet.schema_arrow.names:
+            for batch in parquet.iter_batches(columns=["store_id"]):
+                store_ids.extend(batch.column(0).to_pylist())
+    elif os.path.getsize(path):
+        opener = gzip.open if fmt == "csv.gz" else open
+        with opener(path, "rb") as f:
+            position = len(f.readline())
+            for line in f:
+                offsets.append(position)
+                position += len(line)
+                store_ids.append(next(csv.reader([line.decode("utf-8")]))[0])
+    _save_index(path, store_ids, offsets)
+
+
+def _parse_value(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def read_rows(path, fmt=DEFAULT_FORMAT, offset=0, limit=100, store_id=None):
+    """
+    (total rows, rows) of one page of a report: limit rows from row offset,
+    or the rows of store_id. CSV rows are read from their indexed byte
+    offset on; numeric fields are returned as numbers.
+    """
+    if not os.path.exists(index_path(path)):
+        build_index(path, fmt)
+    with np.load(index_path(path), allow_pickle=False) as index:
+        store_ids, offsets = index["store_ids"], index["offsets"]
+    total = len(store_ids)
+    if store_id is not None:
+        rows = np.flatnonzero(store_ids == store_id)
+    else:
+        rows = np.arange(min(offset, total), min(offset + limit, total))
+    if not len(rows):
+        return total, []
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        # Only the row groups holding the page are read
+        page, first_row = [], 0
+        for group in range(parquet.num_row_groups):
+            group_rows = parquet.metadata.row_group(group).num_rows
+            wanted = rows[(rows >= first_row) & (rows < first_row + group_rows)]
+            if len(wanted):
+                table = parquet.read_row_group(group).take(wanted - first_row)
+                page.extend(table.to_pylist())
+            first_row += group_rows
+        return total, page
+
+    with _open_text(path, fmt) as f:
+        fieldnames = next(csv.reader([f.readline()]))
+        page = []
+        # Consecutive rows: one seek, then read on
+        for run in np.split(rows, np.flatnonzero(np.diff(rows) != 1) + 1):
+            f.seek(int(offsets[run[0]]))
+            for values in csv.reader(f.readline() for _ in range(len(run))):
+                page.append({name: value if name == "store_id" else _parse_value(value)
+                             for name, value in zip(fieldnames, values)})
+        return total, page
@@ -0,0 +1,87 @@
+"""
+Retention for status polls.
+
+status_polls is clustered on (store_key, ts) and indexed on ts, so a report
+window reads only its own range of pages whatever the length of the
+history; what grows without limit is the table. apply_retention() deletes
+whole UTC days of polls older than STATUS_RETENTION_DAYS before the latest
+poll, one day per transaction. Each delete finds its rows through the ts
+index; they are spread over the pages of every store that polled that
+day, so a day at a time keeps the write lock short and ingestion is never
+blocked for long. Each day's delete commits with its own ingest version
+bump and the fingerprints of the stores it touched. Freed pages are
+reused by later ingests, so the file stops growing.
+
+Runs as a queued "retention" job every RETENTION_INTERVAL_HOURS, next to
+the ingest job, or by hand:
+
+    python retention.py
+"""
+import os
+import time
+
+import status_cache
+from db import SessionLocal, engine, bump_ingest_version, get_ingest_version, update_fingerprints
+from metrics import phase, RETENTION_ROWS_DELETED
+from schedule import DAY_US
+from uptime_engine import poll_range
+from utils import from_epoch_us
+
+# Longest report window is the single-store month (30 days)
+STATUS_RETENTION_DAYS = float(os.environ.get("STATUS_RETENTION_DAYS", "35"))
+RETENTION_INTERVAL_HOURS = float(os.environ.get("RETENTION_INTERVAL_HOURS", "24"))
+
+
+def retention_cutoff(latest_us, retention_days=None):
+    """Start of the first UTC day kept: polls before it are deleted."""
+    retention_days = STATUS_RETENTION_DAYS if retention_days is None else retention_days
+    return (latest_us - int(retention_days * DAY_US)) // DAY_US * DAY_US
+
+
+def apply_retention(retention_days=None):
+    """Delete the polls of whole days past the retention window; returns rows deleted."""
+    retention_days = STATUS_RETENTION_DAYS if retention_days is None else retention_days
+    if retention_days <= 0:
+        return 0
+    with SessionLocal() as session:
+        data_range = poll_range(session)
+    if data_range is None:
+        return 0
+    first, latest = data_range
+    cutoff = retention_cutoff(latest, retention_days)
+
+    started = time.perf_counter()
+    deleted = 0
+    with engine.connect() as conn, phase("retention", "delete"):
+        since = version = get_ingest_version(conn)
+        conn.commit()
+        day = first // DAY_US * DAY_US
+        while day < cutoff:
+            with conn.begin():
+                stores = conn.exec_driver_sql(
+                    "SELECT DISTINCT s.store_id FROM status_polls p JOIN stores s ON s.store_key = p.store_key "
+                    "WHERE p.ts >= ? AND p.ts < ?", (day, day + DAY_US)
+                ).scalars().all()
+                rows = conn.exec_driver_sql(
+                    "DELETE FROM status_polls WHERE ts >= ? AND ts < ?", (day, day + DAY_US)
+                ).rowcount
+                if rows:
+                    # Reports and caches keyed on the data version see the change,
+                    # and the stores that lost polls are recounted
+                    bump_ingest_version(conn)
+                    version = get_ingest_version(conn)
+                    update_fingerprints(conn, version, stores)
+            deleted += rows
+            day += DAY_US
+
+    if deleted:
+        with SessionLocal() as session:
+            status_cache.evict_before(session, cutoff, version, since)
+        RETENTION_ROWS_DELETED.inc(deleted)
+    print(f"[RETENTION] deleted {deleted} polls before {from_epoch_us(cutoff):%Y-%m-%d} "
+          f"in {time.perf_counter() - started:.2f}s")
+    return deleted
+
+
+if __name__ == "__main__":
+    apply_retention()
@@ -0,0 +1,198 @@
+"""
+Compiled business-hours schedules and a cache of their UTC open intervals.
+
+menu_hours rows are compiled once into a weekly schedule per store: a tuple
+of 7 weekday tuples of (open, close) seconds after local midnight, or None
+for stores open 24/7. Schedules are hashable, so stores with the same hours
+share one. utc_intervals expands a schedule into UTC intervals for a date
+range with the same semantics as utils.get_local_time_range, and caches by
+(schedule, timezone, range); the per local day expansion underneath is
+cached too, so the hour/day/week windows of one report reuse each other's
+DST lookups.
+
+The per-store schedule/timezone maps are built lazily from the DB, or
+installed from a startup snapshot (snapshot.py), and are tagged with the
+schedules version they were built at (app_state, set by ingestion whenever
+business_hours or store_timezones change). Every get_store_schedules call
+compares that tag with the database, so a process rebuilds its maps after an
+ingest run by any other process; invalidate() drops them at once in the
+process that ran it.
+"""
+import threading
+from datetime import datetime, time
+from functools import lru_cache
+
+import pytz
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import AppState, BusinessHours, StoreTimezones
+from utils import to_epoch_us, from_epoch_us
+
+DEFAULT_TIMEZONE = 'America/Chicago'
+
+DAY_US = 86400 * 1_000_000
+
+# app_state key: ingest version of the last business_hours / store_timezones change
+SCHEDULES_VERSION_KEY = "schedules_version"
+
+_lock = threading.Lock()
+_store_schedules = None
+_store_timezones = None
+# Schedules version the maps above were built at
+_schedules_version = None
+
+
+def _seconds(hhmmss):
+    h, m, s = hhmmss.split(':')
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+def compile_schedule(hours):
+    """Compile BusinessHours rows into a weekly schedule, or None if there are none."""
+    if not hours:
+        return None
+    days = [[] for _ in range(7)]
+    for h in hours:
+        days[h.dayOfWeek].append((_seconds(h.start_time_local), _seconds(h.end_time_local)))
+    return tuple(tuple(day) for day in days)
+
+
+@lru_cache(maxsize=1024)
+def _timezone(timezone_str):
+    return pytz.timezone(timezone_str)
+
+
+@lru_cache(maxsize=262144)
+def _day_intervals(slots, timezone_str, local_date):
+    """UTC (start_us, end_us) of the given slots on one local date, unclipped."""
+    tz = _timezone(timezone_str)
+    intervals = []
+    for open_s, close_s in slots:
+        start_local = datetime.combine(local_date, time(open_s // 3600, open_s // 60 % 60, open_s % 60))
+        end_local = datetime.combine(local_date, time(close_s // 3600, close_s // 60 % 60, close_s % 60))
+        intervals.append((to_epoch_us(tz.localize(start_local)), to_epoch_us(tz.localize(end_local))))
+    return tuple(intervals)
+
+
+@lru_cache(maxsize=65536)
+def utc_intervals(schedule, timezone_str, start_us, end_us):
+    """
+    Open intervals of a schedule within [start_us, end_us], as a tuple of
+    (start_us, end_us). Mirrors utils.get_local_time_range: one step per UTC
+    day from start, using the local date of each step.
+    """
+    if start_us > end_us:
+        return ()
+    if schedule is None:
+        return ((start_us, end_us),)
+
+    tz = _timezone(timezone_str)
+    intervals = []
+    current = start_us
+    while current <= end_us:
+        local_date = from_epoch_us(current).astimezone(tz).date()
+        slots = schedule[local_date.weekday()]
+        if slots:
+            for open_us, close_us in _day_intervals(slots, timezone_str, local_date):
+                if close_us >= start_us and open_us <= end_us:
+                    intervals.append((max(open_us, start_us), min(close_us, end_us)))
+        current += DAY_US
+    return tuple(intervals)
+
+
+def local_time_range(schedule, timezone_str, start, end):
+    """utc_intervals as a list of aware datetimes, like get_local_time_range."""
+    return [(from_epoch_us(s), from_epoch_us(e))
+            for s, e in utc_intervals(schedule, timezone_str, to_epoch_us(start), to_epoch_us(end))]
+
+
+def load_business_hours(db):
+    """store_id -> business_hours rows (plain rows with the BusinessHours columns), in one query."""
+    query = select(BusinessHours.store_id, BusinessHours.dayOfWeek,
+                   BusinessHours.start_time_local, BusinessHours.end_time_local).order_by(BusinessHours.id)
+    hours = {}
+    for row in db.execute(query):
+        hours.setdefault(row.store_id, []).append(row)
+    return hours
+
+
+def load_timezones(db):
+    """store_id -> timezone_str of the stores that have one, in one query."""
+    timezones = {}
+    for store_id, timezone_str in db.execute(select(StoreTimezones.store_id, StoreTimezones.timezone_str)):
+        timezones.setdefault(store_id, timezone_str)
+    return timezones
+
+
+def schedules_version(db):
+    """Ingest version of the last change to business hours or timezones (0 if none)."""
+    value = db.execute(select(AppState.value).where(AppState.key == SCHEDULES_VERSION_KEY)).scalar()
+    return int(value) if value is not None else 0
+
+
+def set_schedules_version(db, version):
+    """Record a change to business hours or timezones at ingest version; commits with the caller."""
+    db.execute(sqlite_insert(AppState).values(key=SCHEDULES_VERSION_KEY, value=str(version)).on_conflict_do_update(
+        index_elements=[AppState.key], set_=dict(value=str(version))
+    ))
+
+
+def get_store_schedules(db):
+    """
+    Return (store_id -> schedule, store_id -> timezone_str), rebuilt whenever
+    the schedules version in the database differs from the one they were built at.
+    """
+    return versioned_schedules(db)[:2]
+
+
+def versioned_schedules(db):
+    """get_store_schedules and the schedules version the maps were built at."""
+    global _store_schedules, _store_timezones, _schedules_version
+    version = schedules_version(db)
+    with _lock:
+        if _store_schedules is None or _schedules_version != version:
+            if _store_schedules is not None:
+                utc_intervals.cache_clear()
+                _day_intervals.cache_clear()
+            _store_schedules = {store_id: compile_schedule(rows)
+                                for store_id, rows in load_business_hours(db).items()}
+            _store_timezones = load_timezones(db)
+            _schedules_version = version
+        return _store_schedules, _store_timezones, _schedules_version
+
+
+def current_version():
+    """Schedules version of the maps in memory, None if not built."""
+    return _schedules_version
+
+
+def store_schedule(db, store_id):
+    """(schedule, timezone_str) for one store, with the usual defaults."""
+    schedules, timezones = get_store_schedules(db)
+    return schedules.get(store_id), timezones.get(store_id, DEFAULT_TIMEZONE)
+
+
+def install(schedules, timezones, version):
+    """Use already compiled schedule/timezone maps (e.g. from a snapshot) built at a schedules version."""
+    global _store_schedules, _store_timezones, _schedules_version
+    with _lock:
+        _store_schedules, _store_timezones, _schedules_version = schedules, timezones, version
+
+
+def invalidate():
+    """Drop compiled schedules and cached intervals after business hours or timezones change."""
+    global _store_schedules, _store_timezones, _schedules_version
+    with _lock:
+        _store_schedules = None
+        _store_timezones = None
+        _schedules_version = None
+        utc_intervals.cache_clear()
+        _day_intervals.cache_clear()
+
+
+def cache_info():
+    return {
+        'utc_intervals': utc_intervals.cache_info()._asdict(),
+        'day_intervals': _day_intervals.cache_info()._asdict(),
+    }
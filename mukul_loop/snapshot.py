@@ -0,0 +1,213 @@
+"""
+Snapshot of derived state, for warm restarts.
+
+Startup normally rebuilds everything derived from the database: compiled
+business-hours schedules, the timezone map and the status poll cache
+(status_cache.py). save() writes all of it to one binary file, by default
+output/snapshot.bin; restore() maps that file back in at the next start
+instead of rebuilding, and the status arrays are read lazily from the page
+cache.
+
+Layout (little-endian):
+
+    magic b"STORESNP" | uint32 format | uint32 header length | JSON header
+    | zero padding to 8 bytes | int64 poll timestamps | uint8 poll statuses
+
+The header holds the data watermark (latest poll, ingest version) the
+snapshot was built at, the schedules and timezones with the schedules
+version they were compiled at, and per store the offset of its polls in the
+two arrays. The schedules are checked against the database as they are
+read (schedule.versioned_schedules), and the status cache is only included
+if it holds exactly the watermark's ingest version, which status_cache
+guarantees even across processes. A snapshot is only used if its format is
+SNAPSHOT_FORMAT and its watermark equals the database's, so any ingest or
+retention run since makes it stale; the startup path then rebuilds from
+the database and writes a new one.
+
+Every API process refreshes the snapshot at shutdown; refresh() holds an
+exclusive lock on {path}.lock while it checks and writes, so one process
+writes a stale snapshot and the others find it current or skip.
+"""
+import json
+import mmap
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock
+    fcntl = None
+import os
+import struct
+import time
+
+import numpy as np
+
+import schedule
+import status_cache
+from db import current_watermark
+
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "output/snapshot.bin")
+# Bumped whenever the layout or the header fields change
+SNAPSHOT_FORMAT = 2
+
+MAGIC = b"STORESNP"
+_PREFIX = struct.Struct("<8sII")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _schedule_to_json(compiled):
+    return None if compiled is None else [[list(slot) for slot in day] for day in compiled]
+
+
+def _schedule_from_json(value):
+    return None if value is None else tuple(tuple(tuple(slot) for slot in day) for day in value)
+
+
+def save(db, path=None):
+    """Write the current schedules and status cache to path; returns the header written."""
+    path = path or SNAPSHOT_PATH
+    started = time.perf_counter()
+    watermark = current_watermark(db.connection())
+    schedules, timezones, schedules_version = schedule.versioned_schedules(db)
+    cache = status_cache.export()
+    series, cache_range = {}, None
+    if cache is not None and cache[3] == watermark[1]:
+        series, start_us, latest_us, _ = cache
+        cache_range = [start_us, latest_us]
+
+    # Stores sharing hours share one compiled schedule, so store each once
+    unique = {}
+    for compiled in schedules.values():
+        unique.setdefault(compiled, len(unique))
+    stores = sorted(series)
+    offsets = np.cumsum([0] + [len(series[s][0]) for s in stores]).tolist()
+    header = {
+        "watermark": list(watermark),
+        "schedules_version": schedules_version,
+        "created_at": time.time(),
+        "schedules": [_schedule_to_json(compiled) for compiled in unique],
+        "store_schedules": {store_id: unique[compiled] for store_id, compiled in schedules.items()},
+        "timezones": timezones,
+        "cache_range": cache_range,
+        "stores": stores,
+        "offsets": offsets,
+    }
+    raw = json.dumps(header, separators=(",", ":")).encode()
+    padding = -(_PREFIX.size + len(raw)) % 8
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, SNAPSHOT_FORMAT, len(raw)) + raw + b"\0" * padding)
+        for store_id in stores:
+            series[store_id][0].astype("<i8", copy=False).tofile(f)
+        for store_id in stores:
+            series[store_id][1].astype(np.uint8, copy=False).tofile(f)
+    # Readers keep mapping the old file until they reopen
+    os.replace(tmp, path)
+    print(f"[SNAPSHOT] wrote {path}: {len(schedules)} schedules, {offsets[-1]} polls, "
+          f"{os.path.getsize(path) / 1e6:.1f} MB in {time.perf_counter() - started:.2f}s")
+    return header
+
+
+def read(path=None):
+    """(header, mmap, data offset) of a snapshot file; raises SnapshotError if unreadable."""
+    path = path or SNAPSHOT_PATH
+    try:
+        with open(path, "rb") as f:
+            magic, fmt, length = _PREFIX.unpack(f.read(_PREFIX.size))
+            if magic != MAGIC:
+                raise SnapshotError(f"{path} is not a snapshot")
+            if fmt != SNAPSHOT_FORMAT:
+                raise SnapshotError(f"snapshot format {fmt}, expected {SNAPSHOT_FORMAT}")
+            header = json.loads(f.read(length))
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, struct.error) as e:
+        raise SnapshotError(f"cannot read {path}: {e}")
+    data_offset = _PREFIX.size + length + (-(_PREFIX.size + length) % 8)
+    samples = header["offsets"][-1]
+    if len(mapped) < data_offset + 9 * samples:
+        mapped.close()
+        raise SnapshotError(f"{path} is truncated")
+    return header, mapped, data_offset
+
+
+def restore(db, path=None):
+    """
+    Install the schedules and status cache of a snapshot matching the
+    database's data watermark. Returns True if restored, False if the
+    snapshot is missing, unreadable or stale.
+    """
+    path = path or SNAPSHOT_PATH
+    if not os.path.exists(path):
+        return False
+    started = time.perf_counter()
+    try:
+        header, mapped, data_offset = read(path)
+    except SnapshotError as e:
+        print(f"[SNAPSHOT] ignoring snapshot: {e}")
+        return False
+    watermark = current_watermark(db.connection())
+    if watermark[0] is None or tuple(header["watermark"]) != watermark:
+        mapped.close()
+        print(f"[SNAPSHOT] stale: built at {tuple(header['watermark'])}, database at {watermark}")
+        return False
+
+    compiled = [_schedule_from_json(value) for value in header["schedules"]]
+    # Rebuilt on first use if the database has other schedules since
+    schedule.install({store_id: compiled[i] for store_id, i in header["store_schedules"].items()},
+                     header["timezones"], header["schedules_version"])
+    if header["cache_range"] is not None:
+        offsets = header["offsets"]
+        samples = offsets[-1]
+        # Read-only views of the mapping; the cache replaces them as it updates
+        if samples:
+            ts = np.frombuffer(mapped, dtype="<i8", count=samples, offset=data_offset)
+            active = np.frombuffer(mapped, dtype=bool, count=samples, offset=data_offset + 8 * samples)
+        else:
+            ts, active = np.empty(0, np.int64), np.empty(0, bool)
+        series = {store_id: (ts[lo:hi], active[lo:hi])
+                  for store_id, lo, hi in zip(header["stores"], offsets[:-1], offsets[1:])}
+        start_us, latest_us = header["cache_range"]
+        status_cache.restore(series, start_us, latest_us, watermark[1])
+    print(f"[SNAPSHOT] restored {path}: {len(header['store_schedules'])} schedules, "
+          f"{header['offsets'][-1]} polls in {time.perf_counter() - started:.3f}s")
+    return True
+
+
+def is_current(db, path=None):
+    """True if the snapshot file exists and matches the database's data watermark."""
+    try:
+        header, mapped, _ = read(path)
+    except SnapshotError:
+        return False
+    mapped.close()
+    return tuple(header["watermark"]) == current_watermark(db.connection())
+
+
+def refresh(db, path=None):
+    """
+    Rewrite the snapshot if it is missing or stale; returns True if written.
+    Skips if another process is writing it.
+    """
+    path = path or SNAPSHOT_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "w") as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print(f"[SNAPSHOT] {path} is being written by another process")
+                return False
+        if is_current(db, path):
+            return False
+        save(db, path)
+        return True
+
+
+if __name__ == "__main__":
+    from db import SessionLocal
+    with SessionLocal() as session:
+        status_cache.fill(session, current_watermark(session.connection())[1])
+        save(session)
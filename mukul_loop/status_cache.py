@@ -0,0 +1,315 @@
+"""
+In-process cache of recent status polls, per store.
+
+Each store keeps its polls from the last STATUS_CACHE_DAYS as two sorted
+NumPy arrays (epoch microseconds, active bits). The cache is filled once at
+startup with fill(), kept current by db.ingest_new_data through update(),
+and read by report.py, so a warm full report does no status queries.
+
+The cache is labelled with the ingest version it holds. update() and
+evict_before() only apply a change on top of the version just before it;
+if another process ingested in between, the cache has missed those polls
+and is refilled from SQLite instead.
+
+Samples older than STATUS_CACHE_DAYS before the latest poll are evicted on
+every update. If the arrays outgrow STATUS_CACHE_MAX_BYTES, the oldest
+samples are dropped until they fit and the covered range shrinks with
+them: readers get None for windows the cache does not fully cover and fall
+back to SQLite, as they do when the cache is cold or was filled for an
+older ingest version (another process ingested since).
+
+Arrays are never modified in place, only replaced, so the cache can also
+start from read-only arrays mapped from a snapshot file (snapshot.py).
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from metrics import STATUS_CACHE_BYTES, STATUS_CACHE_SAMPLES
+from models import StatusPoll, Store
+from uptime_engine import StatusArrays, polls_from_arrays
+
+STATUS_CACHE_DAYS = float(os.environ.get("STATUS_CACHE_DAYS", "30"))
+STATUS_CACHE_MAX_BYTES = int(os.environ.get("STATUS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+DAY_US = 86400 * 1_000_000
+# A poll costs 8 bytes of timestamp and 1 of status
+SAMPLE_BYTES = 9
+
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+
+_lock = threading.Lock()
+# store_id -> (ts int64 array, active bool array), both sorted by ts
+_series = {}
+# Polls in [_start_us, _latest_us] are all cached; None while cold
+_start_us = None
+_latest_us = None
+_version = None
+
+
+def is_warm():
+    return _start_us is not None
+
+
+def clear():
+    global _series, _start_us, _latest_us, _version
+    with _lock:
+        _series, _start_us, _latest_us, _version = {}, None, None, None
+        _report_size()
+
+
+def _query_polls(db, since_us, store_ids=None, until_us=None):
+    """{store_id: (ts, active)} of the polls with ts >= since_us (and <= until_us)."""
+    query = select(StatusPoll.store_key, StatusPoll.ts, StatusPoll.active).where(
+        StatusPoll.ts >= since_us
+    ).order_by(StatusPoll.store_key, StatusPoll.ts)
+    if until_us is not None:
+        query = query.where(StatusPoll.ts <= until_us)
+    names = select(Store.store_key, Store.store_id)
+    if store_ids is not None:
+        names = names.where(Store.store_id.in_(store_ids))
+        query = query.where(StatusPoll.store_key.in_(names.with_only_columns(Store.store_key)))
+    names = dict(db.execute(names).all())
+
+    rows = db.execute(query).all()
+    keys = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    ts = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+    active = np.fromiter((r[2] for r in rows), dtype=bool, count=len(rows))
+
+    series = {}
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1, [len(keys)]))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        series[names[int(keys[lo])]] = (ts[lo:hi].copy(), active[lo:hi].copy())
+    return series
+
+
+def fill(db, version=None):
+    """Load the last STATUS_CACHE_DAYS of polls for every store."""
+    global _series, _start_us, _latest_us, _version
+    if STATUS_CACHE_DAYS <= 0:
+        return stats()
+    latest = db.execute(select(StatusPoll.ts).order_by(StatusPoll.ts.desc()).limit(1)).scalar()
+    if latest is None:
+        return stats()
+    start = latest - int(STATUS_CACHE_DAYS * DAY_US)
+    series = _query_polls(db, start)
+    with _lock:
+        _series, _start_us, _latest_us, _version = series, start, latest, version
+        _trim_to_budget()
+        _report_size()
+    info = stats()
+    print(f"[CACHE] {info['samples']} polls of {info['stores']} stores cached, "
+          f"{info['bytes'] / 1e6:.1f} MB, {STATUS_CACHE_DAYS:g} days")
+    return info
+
+
+def _follows(version, since=None):
+    """
+    "merge" if a change from version since (default version - 1) to version
+    applies on top of the cache, "skip" if the cache already holds it,
+    "refill" if the cache missed a change before it.
+    """
+    if version is not None and _version is not None:
+        if _version == (version - 1 if since is None else since):
+            return "merge"
+        if _version >= version:
+            return "skip"
+    return "refill"
+
+
+def _refill(db, version):
+    print(f"[CACHE] holds ingest version {_version}, change is {version}: refilling")
+    fill(db, version)
+
+
+def update(db, touched, version, since=None):
+    """
+    Merge freshly ingested polls. touched maps store_id to the (min_us, max_us)
+    of the polls written for it; those spans are re-read from the database,
+    which also picks up status changes of existing polls. version is the
+    ingest version this change bumped to, since the version before it when
+    that is not version - 1. No-op while cold.
+    """
+    global _latest_us, _version
+    if not is_warm():
+        return
+    action = _follows(version, since)
+    if action == "merge":
+        latest = max([_latest_us] + [hi for _, hi in touched.values()])
+        fresh = {}
+        for store_id, (lo, hi) in touched.items():
+            lo = max(lo, _start_us)
+            if hi >= lo:
+                fresh[store_id] = (lo, hi)
+
+        # One query for all touched spans, then keep each store's own span
+        loaded = {}
+        if fresh:
+            since = min(lo for lo, _ in fresh.values())
+            until = max(hi for _, hi in fresh.values())
+            loaded = _query_polls(db, since, store_ids=list(fresh), until_us=until)
+
+        with _lock:
+            # Another thread may have moved the version while the spans were read
+            action = _follows(version, since)
+            if action == "merge":
+                for store_id, (lo, hi) in fresh.items():
+                    old_ts, old_active = _series.get(store_id, (np.empty(0, np.int64), np.empty(0, bool)))
+                    new_ts, new_active = loaded.get(store_id, (np.empty(0, np.int64), np.empty(0, bool)))
+                    span = (new_ts >= lo) & (new_ts <= hi)
+                    keep = (old_ts < lo) | (old_ts > hi)
+                    ts = np.concatenate((old_ts[keep], new_ts[span]))
+                    active = np.concatenate((old_active[keep], new_active[span]))
+                    order = np.argsort(ts, kind='stable')
+                    _series[store_id] = (ts[order], active[order])
+                _latest_us = latest
+                _version = version
+                _evict_before(max(_start_us, latest - int(STATUS_CACHE_DAYS * DAY_US)))
+                _trim_to_budget()
+                _report_size()
+    if action == "refill":
+        _refill(db, version)
+
+
+def _evict_before(start):
+    """Drop samples older than start. Caller holds _lock."""
+    global _start_us
+    for store_id, (ts, active) in list(_series.items()):
+        if len(ts) and ts[0] < start:
+            cut = np.searchsorted(ts, start, side='left')
+            if cut == len(ts):
+                del _series[store_id]
+            else:
+                # Copies, so the evicted head is freed
+                _series[store_id] = (ts[cut:].copy(), active[cut:].copy())
+    _start_us = start
+
+
+def evict_before(db, start_us, version, since=None):
+    """
+    Drop cached polls older than start_us after retention deleted them,
+    bumping the ingest version from since (default version - 1) to version.
+    """
+    global _version
+    with _lock:
+        if not is_warm():
+            return
+        action = _follows(version, since)
+        if action == "merge":
+            _evict_before(max(_start_us, start_us))
+            _version = version
+            _report_size()
+    if action == "refill":
+        _refill(db, version)
+
+
+def _trim_to_budget():
+    """Raise the covered start until the arrays fit STATUS_CACHE_MAX_BYTES. Caller holds _lock."""
+    allowed = STATUS_CACHE_MAX_BYTES // SAMPLE_BYTES
+    total = sum(len(ts) for ts, _ in _series.values())
+    if total <= allowed:
+        return
+    if allowed == 0:
+        _series.clear()
+        _evict_before(_latest_us + 1)
+        return
+    # Keep the newest `allowed` samples across all stores
+    all_ts = np.sort(np.concatenate([ts for ts, _ in _series.values()]))
+    _evict_before(int(all_ts[total - allowed]) + 1)
+    print(f"[CACHE] over {STATUS_CACHE_MAX_BYTES / 1e6:.0f} MB, now covering from "
+          f"{_NAIVE_EPOCH + timedelta(microseconds=_start_us)}")
+
+
+def _report_size():
+    samples = sum(len(ts) for ts, _ in _series.values())
+    STATUS_CACHE_SAMPLES.set(samples)
+    STATUS_CACHE_BYTES.set(sum(ts.nbytes + active.nbytes for ts, active in _series.values()))
+
+
+def stats():
+    with _lock:
+        return {
+            "warm": is_warm(),
+            "stores": len(_series),
+            "samples": sum(len(ts) for ts, _ in _series.values()),
+            "bytes": sum(ts.nbytes + active.nbytes for ts, active in _series.values()),
+            "start_us": _start_us,
+            "latest_us": _latest_us,
+            "version": _version,
+        }
+
+
+def _covers(start_us, end_us, version):
+    return (is_warm() and start_us >= _start_us and end_us <= _latest_us
+            and (version is None or version == _version))
+
+
+def status_arrays(store_ids, start_us, end_us, version=None):
+    """
+    uptime_engine.StatusArrays of the polls in [start_us, end_us] for the
+    given stores, or None if the cache does not cover the window (or holds
+    an ingest version other than version, when given).
+    """
+    with _lock:
+        if not _covers(start_us, end_us, version):
+            return None
+        parts_idx, parts_ts, parts_active = [], [], []
+        for i, store_id in enumerate(store_ids):
+            series = _series.get(store_id)
+            if series is None:
+                continue
+            ts, active = series
+            lo = np.searchsorted(ts, start_us, side='left')
+            hi = np.searchsorted(ts, end_us, side='right')
+            parts_idx.append(np.full(hi - lo, i, dtype=np.int64))
+            parts_ts.append(ts[lo:hi])
+            parts_active.append(active[lo:hi])
+    if not parts_ts:
+        return StatusArrays(list(store_ids), np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, bool))
+    return StatusArrays(list(store_ids), np.concatenate(parts_idx),
+                        np.concatenate(parts_ts), np.concatenate(parts_active))
+
+
+def store_series(store_id, start_us, end_us, version=None):
+    """(ts, active) arrays of one store's polls in [start_us, end_us], or None if not covered."""
+    with _lock:
+        if not _covers(start_us, end_us, version):
+            return None
+        ts, active = _series.get(store_id, (np.empty(0, np.int64), np.empty(0, bool)))
+        lo = np.searchsorted(ts, start_us, side='left')
+        hi = np.searchsorted(ts, end_us, side='right')
+        return ts[lo:hi], active[lo:hi]
+
+
+def store_polls(store_id, start_us, end_us, version=None):
+    """Polls of one store in [start_us, end_us] as Poll tuples, or None if not covered."""
+    series = store_series(store_id, start_us, end_us, version)
+    if series is None:
+        return None
+    return polls_from_arrays(*series)
+
+
+def export():
+    """(series, start_us, latest_us, version) as of now, for snapshot.save; None while cold."""
+    with _lock:
+        if not is_warm():
+            return None
+        return dict(_series), _start_us, _latest_us, _version
+
+
+def restore(series, start_us, latest_us, version):
+    """Install series saved by export(), e.g. read-only views of a snapshot file."""
+    global _series, _start_us, _latest_us, _version
+    with _lock:
+        _series, _start_us, _latest_us, _version = dict(series), start_us, latest_us, version
+        _report_size()
+
+
+def refresh_if_stale(db, version):
+    """Refill a warm cache that was built for another ingest version."""
+    if is_warm() and _version is not None and version != _version:
+        print(f"[CACHE] ingest version {_version} -> {version}, refilling")
+        fill(db, version)
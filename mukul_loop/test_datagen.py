@@ -0,0 +1,61 @@
+"""
+Synthetic dataset generator and benchmark harness
+"""
+
+import csv
+
+from sqlalchemy import create_engine
+
+import bench
+import datagen
+import db
+from models import Base
+
+
+def read(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_generator_is_deterministic(tmp_path):
+    a = datagen.generate(tmp_path / 'a', stores=20, days=2, seed=3)
+    b = datagen.generate(tmp_path / 'b', stores=20, days=2, seed=3)
+    assert a == b
+    for name in (datagen.STATUS_CSV, datagen.HOURS_CSV, datagen.TIMEZONES_CSV):
+        assert (tmp_path / 'a' / name).read_bytes() == (tmp_path / 'b' / name).read_bytes()
+
+    datagen.generate(tmp_path / 'c', stores=20, days=2, seed=4)
+    assert (tmp_path / 'c' / datagen.STATUS_CSV).read_bytes() != (tmp_path / 'a' / datagen.STATUS_CSV).read_bytes()
+
+
+def test_generator_parameters(tmp_path):
+    counts = datagen.generate(tmp_path, stores=30, days=1, poll_minutes=30, timezone_count=2,
+                              hours_mix={'always': 1.0}, missing_timezone=0.0)
+    polls = read(tmp_path / datagen.STATUS_CSV)
+    assert counts['store_status'] == len(polls)
+    assert len({p['store_id'] for p in polls}) == 30
+    # About two polls an hour per store
+    assert 30 * 24 * 1.5 < len(polls) < 30 * 24 * 2.5
+    assert [p['timestamp_utc'] for p in polls] == sorted(p['timestamp_utc'] for p in polls)
+    assert read(tmp_path / datagen.HOURS_CSV) == []
+    assert {t['timezone_str'] for t in read(tmp_path / datagen.TIMEZONES_CSV)} == set(datagen.TIMEZONES[:2])
+
+
+def test_generated_data_ingests(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    counts = datagen.generate('data', stores=10, days=1)
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        assert db.ingest_source(conn, 'store_status') == (counts['store_status'],) * 2
+        assert db.ingest_source(conn, 'business_hours') == (counts['menu_hours'],) * 2
+
+        appended = datagen.append_polls('data', stores=10, hours=2)
+        assert db.ingest_source(conn, 'store_status') == (appended, appended)
+
+
+def test_bench_runs_a_scale():
+    results = bench.run_scale_in_child('tiny', repeat=1)
+    assert set(results) == {'load_data', 'ingest_new_data', 'get_local_time_range',
+                            'interpolate_status', 'generate_report'}
+    assert all(r['median'] > 0 for r in results.values())
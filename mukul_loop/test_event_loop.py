@@ -0,0 +1,101 @@
+"""
+Blocking work stays off the event loop: polls are answered while an ingest
+or a slow synchronous endpoint is running
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+import requests
+import uvicorn
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+from models import Base
+
+# Generous bound for one poll on a loaded CI box; a blocked loop shows up as
+# the full BLOCKING_SECONDS
+MAX_POLL_SECONDS = 0.3
+BLOCKING_SECONDS = 1.5
+
+
+class Client:
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def get(self, path):
+        return requests.get(self.base_url + path)
+
+    def post(self, path):
+        return requests.post(self.base_url + path)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stores.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(main, "SessionLocal", factory)
+    monkeypatch.setattr(main.worker_pool, "session_factory", factory)
+
+    # A real server, so all requests share one event loop (TestClient runs
+    # each request on its own). No lifespan: the test database needs no CSV load.
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield Client(f"http://127.0.0.1:{port}")
+    server.should_exit = True
+    thread.join()
+
+
+def poll_latencies(client, until):
+    latencies = []
+    while not until():
+        started = time.perf_counter()
+        assert client.get("/reports").status_code == 200
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.02)
+    return latencies
+
+
+def test_ingest_returns_202_and_polls_stay_flat(client, monkeypatch):
+    monkeypatch.setattr(main, "ingest_new_data", lambda: time.sleep(BLOCKING_SECONDS) or {})
+    main.worker_pool.start()
+    try:
+        started = time.perf_counter()
+        response = client.post("/ingest")
+        assert response.status_code == 202
+        assert time.perf_counter() - started < MAX_POLL_SECONDS
+        job_id = response.json()["job_id"]
+
+        # A second trigger joins the queued/running ingest
+        assert client.post("/ingest").json()["job_id"] == job_id
+
+        latencies = poll_latencies(client, lambda: client.get(f"/jobs/{job_id}").json()["status"] == "Complete")
+    finally:
+        main.worker_pool.stop()
+
+    assert len(latencies) > 5
+    assert max(latencies) < MAX_POLL_SECONDS
+
+
+def test_slow_sync_endpoint_does_not_block_polls(client, monkeypatch):
+    import report
+    monkeypatch.setattr(report, "get_store_summary", lambda store_id: time.sleep(BLOCKING_SECONDS) or {})
+
+    slow = threading.Thread(target=client.get, args=("/store_summary/s1",))
+    slow.start()
+    time.sleep(0.1)
+    latencies = poll_latencies(client, lambda: not slow.is_alive())
+    slow.join()
+
+    assert len(latencies) > 5
+    assert max(latencies) < MAX_POLL_SECONDS
@@ -0,0 +1,121 @@
+"""
+Checkpointed CSV tailing and natural-key upserts in db.ingest_source
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+
+import db
+import schedule
+from models import Base, StoreStatus
+
+
+def write(path, content, mode='w'):
+    with open(path, mode) as f:
+        f.write(content)
+
+
+def setup_sources(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    write('data/store_status.csv',
+          'store_id,status,timestamp_utc\n'
+          's1,active,2023-01-25 09:00:00 UTC\n'
+          's1,inactive,2023-01-25 09:30:00.250000 UTC\n')
+    write('data/menu_hours.csv', 'store_id,dayOfWeek,start_time_local,end_time_local\ns1,0,09:00:00,17:00:00\n')
+    write('data/timezones.csv', 'store_id,timezone_str\ns1,America/Chicago\n')
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def ingest_all(conn):
+    return {name: db.ingest_source(conn, name) for name in db.SOURCES}
+
+
+def test_ingest_tails_appended_rows_only(tmp_path, monkeypatch):
+    engine = setup_sources(tmp_path, monkeypatch)
+    with engine.connect() as conn:
+        assert ingest_all(conn) == {'store_status': (2, 2), 'business_hours': (1, 1), 'store_timezones': (1, 1)}
+
+        # Unchanged files are skipped without parsing
+        assert ingest_all(conn) == {'store_status': (0, 0), 'business_hours': (0, 0), 'store_timezones': (0, 0)}
+
+        # A partially written last line waits for the next cycle
+        write('data/store_status.csv', 's2,active,2023-01-25 10:00:00 UTC\ns1,act', 'a')
+        assert db.ingest_source(conn, 'store_status') == (1, 1)
+        write('data/store_status.csv', 'ive,2023-01-25 09:30:00.250000 UTC\n', 'a')
+        assert db.ingest_source(conn, 'store_status') == (1, 1)
+
+        rows = conn.execute(select(StoreStatus.store_id, StoreStatus.timestamp_utc, StoreStatus.status)
+                            .order_by(StoreStatus.store_id, StoreStatus.timestamp_utc)).all()
+        assert rows == [
+            ('s1', datetime(2023, 1, 25, 9, 0), 'active'),
+            ('s1', datetime(2023, 1, 25, 9, 30, 0, 250000), 'active'),
+            ('s2', datetime(2023, 1, 25, 10, 0), 'active'),
+        ]
+        # Stored compactly: interned store keys, epoch microseconds, 0/1 status
+        assert conn.execute(text("SELECT store_key, ts, active FROM status_polls ORDER BY store_key, ts")).all() == [
+            (1, 1674637200000000, 1), (1, 1674639000250000, 1), (2, 1674640800000000, 1),
+        ]
+
+
+def test_ingest_rereads_rewritten_file(tmp_path, monkeypatch):
+    engine = setup_sources(tmp_path, monkeypatch)
+    with engine.connect() as conn:
+        ingest_all(conn)
+
+        # Rewritten in place: same natural key upserted, new zone applied
+        write('data/timezones.csv', 'store_id,timezone_str\ns1,Asia/Kolkata\ns2,UTC\n')
+        assert db.ingest_source(conn, 'store_timezones') == (2, 2)
+        rows = conn.execute(text("SELECT store_id, timezone_str FROM store_timezones ORDER BY store_id")).all()
+        assert rows == [('s1', 'Asia/Kolkata'), ('s2', 'UTC')]
+
+
+def test_ingest_updates_fingerprints_of_touched_stores(tmp_path, monkeypatch):
+    engine = setup_sources(tmp_path, monkeypatch)
+    monkeypatch.setattr(db, 'engine', engine)
+    monkeypatch.setattr(db, 'SessionLocal', sessionmaker(bind=engine))
+    db.ingest_new_data()
+    with engine.connect() as conn:
+        # One version bump per source that parsed rows
+        assert db.store_fingerprints(conn) == {'s1': (2, 1674639000250000, 1)}
+        assert schedule.schedules_version(conn) == 3
+
+    write('data/store_status.csv', 's2,active,2023-01-25 10:00:00 UTC\n', 'a')
+    db.ingest_new_data()
+    with engine.connect() as conn:
+        assert db.store_fingerprints(conn) == {'s1': (2, 1674639000250000, 1), 's2': (1, 1674640800000000, 4)}
+        assert schedule.schedules_version(conn) == 3
+
+
+def test_failed_fingerprints_leave_checkpoint_for_next_ingest(tmp_path, monkeypatch):
+    engine = setup_sources(tmp_path, monkeypatch)
+    monkeypatch.setattr(db, 'engine', engine)
+    monkeypatch.setattr(db, 'SessionLocal', sessionmaker(bind=engine))
+    db.ingest_new_data()
+
+    write('data/store_status.csv', 's2,active,2023-01-25 10:00:00 UTC\n', 'a')
+    update_fingerprints = db.update_fingerprints
+    monkeypatch.setattr(db, 'update_fingerprints', lambda *args: (_ for _ in ()).throw(RuntimeError("crash")))
+    with pytest.raises(RuntimeError):
+        db.ingest_new_data()
+    with engine.connect() as conn:
+        # The poll was committed with its chunk, the version and checkpoint were not
+        assert conn.execute(text("SELECT COUNT(*) FROM status_polls")).scalar() == 3
+        assert db.get_ingest_version(conn) == 3
+        assert 's2' not in db.store_fingerprints(conn)
+
+    # The next ingest re-reads the rows, even though they no longer change anything
+    monkeypatch.setattr(db, 'update_fingerprints', update_fingerprints)
+    assert db.ingest_new_data()['store_status'] == 0
+    with engine.connect() as conn:
+        assert db.get_ingest_version(conn) == 4
+        assert db.store_fingerprints(conn)['s2'] == (1, 1674640800000000, 4)
+    assert db.ingest_new_data() == {'store_status': 0, 'business_hours': 0, 'store_timezones': 0}
+    with engine.connect() as conn:
+        assert db.get_ingest_version(conn) == 4
@@ -0,0 +1,54 @@
+"""
+Property test: the sweep-based interpolate_status agrees with the original
+per-period implementation on randomized polls and business periods
+"""
+
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pytz
+
+from utils import interpolate_status, interpolate_status_reference
+
+Poll = namedtuple('Poll', ['timestamp_utc', 'status'])
+
+BASE = datetime(2023, 1, 18)
+
+
+def random_polls(rng):
+    t = BASE + timedelta(seconds=rng.randint(-3600, 3600))
+    polls = []
+    for _ in range(rng.randint(0, 60)):
+        t += timedelta(seconds=rng.randint(1, 4 * 3600), microseconds=rng.randint(0, 999999))
+        polls.append(Poll(t, rng.choice(['active', 'active', 'inactive'])))
+    return polls
+
+
+def random_periods(rng):
+    tz = pytz.timezone(rng.choice(['UTC', 'America/Chicago', 'Asia/Kolkata']))
+    periods = []
+    for _ in range(rng.randint(0, 12)):
+        start = pytz.utc.localize(BASE + timedelta(seconds=rng.randint(0, 5 * 86400)))
+        # Includes empty, overlapping and inverted (overnight) periods
+        end = start + timedelta(seconds=rng.randint(-6 * 3600, 14 * 3600), microseconds=rng.randint(0, 999999))
+        periods.append((start.astimezone(tz), end.astimezone(tz)))
+    if rng.random() < 0.5:
+        periods.sort()
+    return periods
+
+
+def test_matches_reference_on_random_inputs():
+    rng = random.Random(20230118)
+    for _ in range(1500):
+        polls = random_polls(rng)
+        periods = random_periods(rng)
+        assert interpolate_status(polls, periods) == interpolate_status_reference(polls, periods)
+
+
+def test_poll_on_period_bounds():
+    start = pytz.utc.localize(BASE)
+    end = start + timedelta(hours=2)
+    polls = [Poll(BASE, 'inactive'), Poll(BASE + timedelta(hours=1), 'active'), Poll(BASE + timedelta(hours=2), 'inactive')]
+    assert interpolate_status(polls, [(start, end)]) == (timedelta(hours=1), timedelta(hours=1))
+    assert interpolate_status(polls, [(start, end)]) == interpolate_status_reference(polls, [(start, end)])
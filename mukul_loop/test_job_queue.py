@@ -0,0 +1,125 @@
+"""
+SQLite-backed report jobs: priorities, leases and the worker pool
+"""
+
+import os
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+import job_queue
+from job_queue import WorkerPool, QueueFull, PRIORITY_SINGLE_STORE
+from models import Base
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def test_single_store_jobs_jump_the_queue(session_factory):
+    with session_factory() as db:
+        job_queue.submit(db, "full", job_id="full-1")
+        job_queue.submit(db, "full", job_id="full-2")
+        job_queue.submit(db, "single_store", {"store_id": "s"}, PRIORITY_SINGLE_STORE, job_id="single")
+
+        claimed = [job_queue.claim(db, "w")[0] for _ in range(3)]
+        assert claimed == ["single", "full-1", "full-2"]
+        assert job_queue.claim(db, "w") is None
+
+
+def test_expired_lease_is_reclaimed(session_factory, monkeypatch):
+    with session_factory() as db:
+        job_queue.submit(db, "full", {"fmt": "csv"}, job_id="r1")
+        assert job_queue.claim(db, "crashed") == ("r1", "full", {"fmt": "csv"})
+        assert job_queue.claim(db, "other") is None
+
+        # The crashed worker stops heartbeating
+        monkeypatch.setattr(job_queue, "LEASE_SECONDS", -1)
+        job_queue.heartbeat(db, "r1", "crashed")
+        assert job_queue.claim(db, "other")[0] == "r1"
+        assert job_queue.get_job(db, "r1").attempts == 2
+
+        # A late result from the old owner does not count
+        assert not job_queue.finish(db, "r1", "crashed", path="stale")
+        assert job_queue.finish(db, "r1", "other", path="fresh")
+        db.expire_all()
+        assert job_queue.get_job(db, "r1").path == "fresh"
+
+
+def test_job_given_up_after_max_attempts(session_factory, monkeypatch):
+    monkeypatch.setattr(job_queue, "LEASE_SECONDS", -1)
+    with session_factory() as db:
+        job_queue.submit(db, "full", job_id="r1")
+        for attempt in range(job_queue.MAX_ATTEMPTS):
+            assert job_queue.claim(db, f"w{attempt}")[0] == "r1"
+        assert job_queue.claim(db, "w") is None
+        assert job_queue.list_jobs(db)["r1"].startswith("Failed")
+
+
+def test_queue_is_bounded(session_factory, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_QUEUE_MAX", 2)
+    with session_factory() as db:
+        job_queue.submit(db, "full")
+        job_queue.submit(db, "single_store")
+        with pytest.raises(QueueFull):
+            job_queue.submit(db, "full")
+        # Scheduled jobs still get in behind a full report queue
+        job_queue.submit(db, "ingest", priority=job_queue.PRIORITY_INGEST)
+        job_queue.submit(db, "retention", priority=job_queue.PRIORITY_MAINTENANCE)
+        with pytest.raises(QueueFull):
+            job_queue.submit(db, "single_store")
+
+
+def test_pool_runs_jobs(session_factory, tmp_path):
+    def handler(job_id, name):
+        path = tmp_path / f"{job_id}.csv"
+        path.write_text(name)
+        return str(path)
+
+    def broken(job_id):
+        raise ValueError("no data")
+
+    pool = WorkerPool(session_factory, {"ok": handler, "broken": broken}, workers=2)
+    with session_factory() as db:
+        job_queue.submit(db, "ok", {"name": "a"}, job_id="a")
+        job_queue.submit(db, "broken", job_id="b")
+    pool.start()
+    try:
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            with session_factory() as db:
+                statuses = job_queue.list_jobs(db)
+            if "Queued" not in statuses.values() and "Running" not in statuses.values():
+                break
+            time.sleep(0.05)
+    finally:
+        pool.stop()
+
+    assert statuses == {"a": "Complete", "b": "Failed: no data"}
+    with session_factory() as db:
+        assert os.path.exists(job_queue.get_job(db, "a").path)
+
+
+def test_submit_once_joins_job_queued_by_another_process(session_factory, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "SessionLocal", session_factory)
+    with session_factory() as db:
+        job_queue.submit(db, "ingest", priority=job_queue.PRIORITY_INGEST, job_id="other")
+        with pytest.raises(IntegrityError):
+            job_queue.submit(db, "ingest", priority=job_queue.PRIORITY_INGEST)
+
+    active_job = job_queue.active_job
+
+    def stale_check(db, kind):
+        # The other process inserts between our check and our insert
+        monkeypatch.setattr(job_queue, "active_job", active_job)
+        return None
+    monkeypatch.setattr(job_queue, "active_job", stale_check)
+    assert main.submit_ingest() == ("other", job_queue.COALESCED)
+    assert main.submit_retention()[1] == job_queue.STARTED
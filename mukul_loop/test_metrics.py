@@ -0,0 +1,53 @@
+"""
+Phase timers, counters and the Prometheus text rendering
+"""
+
+import pstats
+
+import metrics
+import report
+from test_uptime_engine import make_session
+
+
+def test_render_prometheus_text():
+    requests = metrics.Counter("test_requests_total", "Requests", ["path"])
+    latency = metrics.Histogram("test_latency_seconds", "Latency", buckets=(0.1, 1))
+    requests.inc(path="/a")
+    requests.inc(2, path='/b"')
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    text = metrics.render()
+    assert "# TYPE test_requests_total counter\n" in text
+    assert 'test_requests_total{path="/a"} 1\n' in text
+    assert 'test_requests_total{path="/b\\""} 2\n' in text
+    assert "# TYPE test_latency_seconds histogram\n" in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'test_latency_seconds_bucket{le="1.0"} 2\n' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 2\n' in text
+    assert "test_latency_seconds_sum 0.55\n" in text
+    assert "test_latency_seconds_count 2\n" in text
+
+
+def test_generate_report_records_phases(tmp_path, monkeypatch):
+    session, _ = make_session(2, n_stores=6, url=f"sqlite:///{tmp_path / 'stores.db'}")
+    monkeypatch.setattr(report, 'SessionLocal', lambda: session)
+    monkeypatch.chdir(tmp_path)
+
+    before = {p: metrics.PHASE_SECONDS.count(operation="report", phase=p)
+              for p in ("query", "schedule", "interpolation", "serialization")}
+    stores_before = metrics.STORES_PROCESSED.value(kind="full")
+    report.generate_report("r1")
+
+    for p, count in before.items():
+        assert metrics.PHASE_SECONDS.count(operation="report", phase=p) > count
+    assert metrics.STORES_PROCESSED.value(kind="full") == stores_before + 6
+    assert metrics.REPORT_ROWS.value(format="csv") >= 6
+
+
+def test_profiled_dumps_pstats(tmp_path):
+    path = str(tmp_path / "r.prof")
+    with metrics.profiled(path):
+        sorted(range(1000), key=lambda x: -x)
+    stats = pstats.Stats(path)
+    assert any(func[2] == "<lambda>" for func in stats.stats)
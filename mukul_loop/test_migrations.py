@@ -0,0 +1,52 @@
+"""
+In-place schema upgrade of a pre-index stores.db and the report query plans
+"""
+
+from sqlalchemy import create_engine, text
+
+import db
+
+# store_status / store_timezones as created by the original models.py
+LEGACY_SCHEMA = [
+    "CREATE TABLE store_status (id INTEGER PRIMARY KEY, store_id VARCHAR, timestamp_utc DATETIME, status VARCHAR)",
+    "CREATE INDEX ix_store_status_id ON store_status (id)",
+    "CREATE INDEX ix_store_status_store_id ON store_status (store_id)",
+    'CREATE TABLE business_hours (id INTEGER PRIMARY KEY, store_id VARCHAR, "dayOfWeek" INTEGER, '
+    "start_time_local VARCHAR, end_time_local VARCHAR)",
+    "CREATE TABLE store_timezones (id INTEGER PRIMARY KEY, store_id VARCHAR, timezone_str VARCHAR)",
+]
+
+
+def test_migrate_legacy_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for sql in LEGACY_SCHEMA:
+            conn.execute(text(sql))
+        conn.execute(text(
+            "INSERT INTO store_status (store_id, timestamp_utc, status) VALUES "
+            "('s1', '2023-01-25 09:00:00.000000', 'active'), "
+            "('s1', '2023-01-25 09:00:00.000000', 'inactive'), "
+            "('s2', '2023-01-25 09:00:00.000000', 'active')"
+        ))
+        # Enough history that ANALYZE favours the indexes for a window scan
+        conn.exec_driver_sql(
+            "INSERT INTO store_status (store_id, timestamp_utc, status) VALUES (?, ?, 'active')",
+            [(f"s{n % 50}", f"2023-01-{1 + n // 500:02d} {n % 24:02d}:{n % 60:02d}:00.000000") for n in range(5000)]
+        )
+
+    db.migrate_db(engine)
+    db.migrate_db(engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA user_version")).scalar() == len(db.MIGRATIONS)
+        # store_status is now a view over the compact status_polls table
+        kinds = dict(conn.execute(text("SELECT name, type FROM sqlite_master")).all())
+        assert kinds["store_status"] == "view" and kinds["status_polls"] == "table"
+        assert conn.execute(text("SELECT COUNT(*) FROM status_polls")).scalar() == 5002
+        # Duplicate natural key collapsed to the newest row
+        rows = conn.execute(text(
+            "SELECT store_id, status FROM store_status WHERE timestamp_utc >= :ts ORDER BY store_id"
+        ), {"ts": 1674604800000000}).all()
+        assert rows == [('s1', 0), ('s2', 1)]
+
+    assert db.check_query_plans(engine) == {}
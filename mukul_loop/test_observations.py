@@ -0,0 +1,150 @@
+"""
+POST /observations: incremental NDJSON / CSV parsing, batched upserts and 429 backpressure
+"""
+
+import json
+import queue
+import time
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import db
+import main
+import observations
+import status_cache
+from models import Base
+from utils import to_epoch_us
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(observations, "_queue", queue.Queue(maxsize=4))
+    status_cache.clear()
+    yield engine
+    observations.stop(timeout=5)
+
+
+def chunked(body, size=7):
+    """The body in small pieces, so lines and batches span chunk boundaries."""
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def polls(engine):
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT store_id, ts, active FROM status_polls JOIN stores USING (store_key) ORDER BY store_id, ts"
+        )).all()
+
+
+def test_ndjson_push(engine, monkeypatch):
+    monkeypatch.setattr(observations, "OBSERVATIONS_BATCH_ROWS", 2)
+    lines = [
+        {"store_id": "s1", "timestamp_utc": "2023-01-25 09:00:00 UTC", "status": "active"},
+        {"store_id": "s1", "timestamp_utc": "2023-01-25T09:30:00.250000", "status": "inactive"},
+        {"store_id": 42, "timestamp_utc": "2023-01-25T10:00:00+01:00", "status": "active"},
+        {"store_id": "s2", "timestamp_utc": "yesterday", "status": "active"},
+        {"store_id": "s2", "timestamp_utc": "2023-01-25 09:00:00", "status": "open"},
+    ]
+    body = ("\n".join(json.dumps(line) for line in lines) + "\nnot json\n").encode()
+    client = TestClient(main.app)
+
+    response = client.post("/observations", content=chunked(body), headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["rows"], result["changed"], result["rejected"]) == (3, 3, 3)
+    assert [error.split(":")[0] for error in result["errors"]] == ["line 4", "line 5", "line 6"]
+    assert result["rows_per_sec"] > 0
+    assert polls(engine) == [
+        ("42", to_epoch_us(datetime(2023, 1, 25, 9, 0)), 1),
+        ("s1", to_epoch_us(datetime(2023, 1, 25, 9, 0)), 1),
+        ("s1", to_epoch_us(datetime(2023, 1, 25, 9, 30, 0, 250000)), 0),
+    ]
+    with engine.connect() as conn:
+        assert db.get_ingest_version(conn) == 1
+        assert db.store_fingerprints(conn)["s1"][:2] == (2, to_epoch_us(datetime(2023, 1, 25, 9, 30, 0, 250000)))
+
+    # Resending is idempotent: nothing changes, the version stays
+    response = client.post("/observations", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.json()["changed"] == 0
+    with engine.connect() as conn:
+        assert db.get_ingest_version(conn) == 1
+
+
+def test_csv_push(engine):
+    client = TestClient(main.app)
+    body = (b"status,store_id,timestamp_utc\r\n"
+            b"active,s1,2023-01-25 09:00:00 UTC\r\n"
+            b"inactive,s1,2023-01-25 09:00:00 UTC\r\n"
+            b"inactive,s3,2023-01-25 11:00:00.5 UTC")
+    response = client.post("/observations", content=chunked(body, 5), headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200 and response.json()["rows"] == 3
+    # The later row for the same poll wins, as in CSV ingestion
+    assert polls(engine) == [
+        ("s1", to_epoch_us(datetime(2023, 1, 25, 9, 0)), 0),
+        ("s3", to_epoch_us(datetime(2023, 1, 25, 11, 0, 0, 500000)), 0),
+    ]
+
+    response = client.post("/observations", content=b"store_id,status\ns1,active\n", headers={"Content-Type": "text/csv"})
+    assert response.status_code == 400
+    assert client.post("/observations", content=b"{}", headers={"Content-Type": "text/plain"}).status_code == 415
+
+
+def test_backpressure(engine, monkeypatch):
+    client = TestClient(main.app)
+    headers = {"Content-Type": "application/x-ndjson"}
+    body = b"".join(json.dumps({"store_id": f"s{i}", "timestamp_utc": "2023-01-25 09:00:00",
+                                "status": "active"}).encode() + b"\n" for i in range(6))
+
+    # Full queue: turned away before reading the body
+    monkeypatch.setattr(observations, "start", lambda: None)
+    monkeypatch.setattr(observations, "_queue", queue.Queue(maxsize=1))
+    observations._queue.put(([], None))
+    response = client.post("/observations", content=body, headers=headers)
+    assert response.status_code == 429 and response.headers["Retry-After"] == str(main.OBSERVATIONS_RETRY_AFTER)
+    monkeypatch.undo()
+
+    # A slow writer fills the queue mid-request: what was queued is still written
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(observations, "_queue", queue.Queue(maxsize=1))
+    monkeypatch.setattr(observations, "OBSERVATIONS_BATCH_ROWS", 1)
+    monkeypatch.setattr(observations, "OBSERVATIONS_QUEUE_WAIT", 0.05)
+    upsert = observations.upsert_observations
+    monkeypatch.setattr(observations, "upsert_observations", lambda batches: (time.sleep(0.3), upsert(batches))[1])
+    response = client.post("/observations", content=body, headers=headers)
+    assert response.status_code == 429 and "Retry-After" in response.headers
+    accepted = response.json()["rows"]
+    assert 0 < accepted < 6
+    assert len(polls(engine)) == accepted
+
+
+def test_failed_write_reports_counts(engine, monkeypatch):
+    def fail(batches):
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(observations, "upsert_observations", fail)
+    body = b'{"store_id": "s1", "timestamp_utc": "2023-01-25 09:00:00", "status": "active"}\nbad\n'
+    response = TestClient(main.app).post("/observations", content=body,
+                                         headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 500
+    result = response.json()
+    assert "database is locked" in result["detail"]
+    assert (result["rows"], result["failed"], result["changed"], result["rejected"]) == (1, 1, 0, 1)
+    assert polls(engine) == []
+
+
+def test_polls_and_version_commit_together(engine, monkeypatch):
+    monkeypatch.setattr(db, "update_fingerprints", lambda *args: (_ for _ in ()).throw(RuntimeError("crash")))
+    with pytest.raises(RuntimeError):
+        db.upsert_observations([[("s1", to_epoch_us(datetime(2023, 1, 25, 9)), True)]])
+    assert polls(engine) == []
+    with engine.connect() as conn:
+        assert db.get_ingest_version(conn) == 0
@@ -0,0 +1,83 @@
+"""
+Watermark-keyed report jobs: reuse, coalescing and eviction
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import job_queue
+from job_queue import CACHED, COALESCED, STARTED
+from models import Base
+from report_cache import evict_reports
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+def write(path, size):
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def run(db, job_id, path=None, error=None):
+    assert job_queue.claim(db, "w")[0] == job_id
+    assert job_queue.finish(db, job_id, "w", path, error)
+
+
+def test_submit_coalesces_then_reuses(db, tmp_path):
+    key = "full|csv|2023-01-25 12:00:00.000000|3"
+
+    assert job_queue.submit(db, "full", cache_key=key, job_id="r1") == ("r1", STARTED)
+    assert job_queue.submit(db, "full", cache_key=key, job_id="r2") == ("r1", COALESCED)
+
+    run(db, "r1", write(tmp_path / "r1.csv", 10))
+    assert job_queue.submit(db, "full", cache_key=key, job_id="r3") == ("r1", CACHED)
+
+    # New data, new watermark
+    assert job_queue.submit(db, "full", cache_key="full|csv|2023-01-25 13:00:00.000000|4",
+                            job_id="r4") == ("r4", STARTED)
+
+
+def test_failed_report_is_not_reused(db):
+    assert job_queue.submit(db, "full", cache_key="k", job_id="r1") == ("r1", STARTED)
+    run(db, "r1", error="Failed: boom")
+    assert job_queue.submit(db, "full", cache_key="k", job_id="r2") == ("r2", STARTED)
+
+
+def test_evicts_by_size_and_age(db, tmp_path):
+    for n in range(3):
+        report_id = f"r{n}"
+        job_queue.submit(db, "full", cache_key=str(n), job_id=report_id)
+        run(db, report_id, write(tmp_path / f"{report_id}.csv", 10))
+        evicted = evict_reports(db, max_bytes=25, max_age=3600)
+    assert evicted == ["r0"]
+    assert job_queue.submit(db, "full", cache_key="0", job_id="new") == ("new", STARTED)
+    assert not (tmp_path / "r0.csv").exists()
+
+    now = job_queue.get_job(db, "r2").updated_at + 3601
+    assert sorted(evict_reports(db, max_bytes=25, max_age=3600, now=now)) == ["r1", "r2"]
+    assert job_queue.list_jobs(db) == {"new": "Queued"}
+
+
+def test_evicts_uncached_reports_and_their_profiles(db, tmp_path):
+    job_queue.submit(db, "single_store", {"store_id": "s1"}, job_id="single")
+    run(db, "single", write(tmp_path / "single.csv", 10))
+    job_queue.submit(db, "full", {"fmt": "csv", "profile": True}, job_id="profiled")
+    run(db, "profiled", write(tmp_path / "profiled.csv", 10))
+    write(tmp_path / "profiled.prof", 20)
+    job_queue.submit(db, "ingest", job_id="ingest")
+    run(db, "ingest")
+
+    # The profile counts towards the size
+    assert evict_reports(db, max_bytes=35, max_age=3600) == ["single"]
+    assert not (tmp_path / "single.csv").exists()
+    now = job_queue.get_job(db, "profiled").updated_at + 3601
+    assert evict_reports(db, max_bytes=35, max_age=3600, now=now) == ["profiled"]
+    assert not (tmp_path / "profiled.csv").exists() and not (tmp_path / "profiled.prof").exists()
+    assert job_queue.list_jobs(db)["ingest"] == "Complete"
@@ -0,0 +1,114 @@
+"""
+Serving finished reports: Range / ETag downloads, JSON row pages and /reports pagination
+"""
+
+import os
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import job_queue
+import main
+from models import Base
+from report_writer import ReportWriter, index_path, read_rows
+
+ROWS = [{'store_id': f'store-{i}', 'uptime_last_hour': float(i % 61), 'downtime_last_hour': 60.0 - i % 61}
+        for i in range(250)]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(main, "SessionLocal", sessionmaker(bind=engine))
+    return TestClient(main.app)
+
+
+def finished_report(tmp_path, fmt, batch=40):
+    """A complete report job with ROWS written in fmt; returns its id."""
+    with main.SessionLocal() as db:
+        job_id = job_queue.submit(db, "full", {"fmt": fmt})[0]
+        path = str(tmp_path / f"{job_id}.{fmt}")
+        with ReportWriter(path, fmt) as writer:
+            for start in range(0, len(ROWS), batch):
+                writer.write_rows(ROWS[start:start + batch])
+        assert job_queue.claim(db, "w")[0] == job_id
+        assert job_queue.finish(db, job_id, "w", path)
+    return job_id
+
+
+@pytest.mark.parametrize("fmt", ["csv", "csv.gz", "parquet"])
+def test_pages_match_report(client, tmp_path, monkeypatch, fmt):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+        monkeypatch.setattr("report_writer.PARQUET_ROW_GROUP_SIZE", 64)
+    job_id = finished_report(tmp_path, fmt)
+
+    rows, offset = [], 0
+    while offset is not None:
+        page = client.get(f"/get_report/{job_id}/rows", params={"offset": offset, "limit": 70}).json()
+        assert page["total"] == len(ROWS)
+        rows.extend(page["rows"])
+        offset = page["next_offset"]
+    assert rows == ROWS
+
+    page = client.get(f"/get_report/{job_id}/rows", params={"store_id": "store-137"}).json()
+    assert page["rows"] == [ROWS[137]]
+    assert client.get(f"/get_report/{job_id}/rows", params={"store_id": "nope"}).status_code == 404
+    assert client.get(f"/get_report/{job_id}/rows", params={"limit": 10**6}).status_code == 422
+    assert client.get("/get_report/nope/rows").status_code == 404
+
+
+def test_index_built_for_reports_without_one(tmp_path):
+    path = str(tmp_path / "single.csv")
+    pd.DataFrame(ROWS).to_csv(path, index=False)
+    assert not os.path.exists(index_path(path))
+    assert read_rows(path, "csv", 245, 10) == (len(ROWS), ROWS[245:])
+    assert os.path.exists(index_path(path))
+    assert read_rows(path, "csv", store_id="store-3")[1] == [ROWS[3]]
+
+
+def test_range_and_etag(client, tmp_path):
+    job_id = finished_report(tmp_path, "csv")
+    with open(tmp_path / f"{job_id}.csv", "rb") as f:
+        content = f.read()
+
+    full = client.get(f"/get_report/{job_id}")
+    assert full.status_code == 200 and full.content == content
+    etag = full.headers["etag"]
+    assert client.get(f"/get_report/{job_id}", headers={"If-None-Match": etag}).status_code == 304
+
+    part = client.get(f"/get_report/{job_id}", headers={"Range": "bytes=100-199"})
+    assert part.status_code == 206 and part.content == content[100:200]
+    resumed = client.get(f"/get_report/{job_id}", headers={"Range": "bytes=100-", "If-Range": etag})
+    assert resumed.status_code == 206 and resumed.content == content[100:]
+
+
+def test_reports_pagination(client, tmp_path):
+    ids = [finished_report(tmp_path, "csv") for _ in range(5)]
+    seen, cursor = [], None
+    while True:
+        page = client.get("/reports", params={"limit": 2, **({"cursor": cursor} if cursor else {})}).json()
+        assert len(page["reports"]) <= 2
+        seen.extend(page["reports"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(ids)
+    assert client.get("/reports", params={"cursor": "garbage"}).status_code == 400
+
+
+def test_gzip_report_varies_on_accept_encoding(client, tmp_path):
+    job_id = finished_report(tmp_path, "csv.gz")
+    gzipped = client.get(f"/get_report/{job_id}", headers={"Accept-Encoding": "gzip"})
+    plain = client.get(f"/get_report/{job_id}", headers={"Accept-Encoding": "identity"})
+    assert gzipped.headers["content-encoding"] == "gzip" and "content-encoding" not in plain.headers
+    assert gzipped.content == plain.content
+    assert gzipped.headers["vary"] == plain.headers["vary"] == "Accept-Encoding"
+    assert gzipped.headers["etag"] != plain.headers["etag"]
+    cached = client.get(f"/get_report/{job_id}", headers={"Accept-Encoding": "gzip",
+                                                          "If-None-Match": gzipped.headers["etag"]})
+    assert cached.status_code == 304 and cached.headers["vary"] == "Accept-Encoding"
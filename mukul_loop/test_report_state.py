@@ -0,0 +1,76 @@
+"""
+Differential full reports: reused rows are exact, dirty and boundary stores are recomputed
+"""
+
+from datetime import timedelta
+
+import pytest
+
+import report
+import report_state
+import status_cache
+from db import bump_ingest_version, get_ingest_version, update_fingerprints
+from models import StoreStatus
+from report_writer import report_path
+from schedule import set_schedules_version
+from test_uptime_engine import make_session
+from uptime_engine import poll_range
+from utils import from_epoch_us
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    session, _ = make_session(71, n_stores=30, url=f"sqlite:///{tmp_path / 'stores.db'}")
+    monkeypatch.setattr(report, 'SessionLocal', lambda: session)
+    monkeypatch.chdir(tmp_path)
+    status_cache.clear()
+    ingest(session, None)
+    yield session
+    status_cache.clear()
+
+
+def ingest(session, store_ids):
+    """What ingest_new_data does after writing polls of store_ids (all when None)."""
+    with session.get_bind().begin() as conn:
+        bump_ingest_version(conn)
+        update_fingerprints(conn, get_ingest_version(conn), store_ids)
+
+
+def read(report_id):
+    with open(report_path(report_id)) as f:
+        return f.read()
+
+
+def test_differential_report_matches_full_recompute(session):
+    report.generate_report('r1', differential=True)
+    first = report_state.read_metadata('r1')
+    assert first["mode"] == "full" and first["recomputed"] == 30 and first["reused"] == 0
+
+    # Nothing changed: every row is carried over
+    report.generate_report('r2', differential=True)
+    assert report_state.read_metadata('r2')["reused"] == 30
+    assert read('r2') == read('r1')
+
+    # New polls for two stores move the latest poll, and so every window, by 20 minutes
+    latest = from_epoch_us(poll_range(session)[1]).replace(tzinfo=None)
+    for store_id in ('store-3', 'store-7'):
+        session.add(StoreStatus(store_id=store_id, timestamp_utc=latest + timedelta(minutes=20), status='inactive'))
+    session.commit()
+    ingest(session, ['store-3', 'store-7'])
+
+    report.generate_report('r3', differential=True)
+    report.generate_report('r4', differential=False)
+    metadata = report_state.read_metadata('r3')
+    assert metadata["mode"] == "differential" and metadata["base_report_id"] == 'r2'
+    assert 0 < metadata["reused"] < 28 and metadata["recomputed"] + metadata["reused"] == 30
+    assert read('r3') == read('r4')
+
+
+def test_schedule_change_recomputes_everything(session):
+    report.generate_report('r1', differential=True)
+    with session.get_bind().begin() as conn:
+        bump_ingest_version(conn)
+        set_schedules_version(conn, get_ingest_version(conn))
+    report.generate_report('r2', differential=True)
+    assert report_state.read_metadata('r2')["reused"] == 0
+    assert read('r2') == read('r1')
@@ -0,0 +1,88 @@
+"""
+Streaming report output: formats, atomic files, and batched generation
+"""
+
+import gzip
+import io
+
+import pandas as pd
+import pytest
+import pytz
+
+import report
+from models import StoreStatus
+from report_writer import ReportWriter, report_path, validate_format
+from test_uptime_engine import make_session, intervals_for
+from uptime_engine import compute_report_rows
+
+ROWS = [
+    {'store_id': 'a', 'uptime_last_hour': 60.0, 'downtime_last_hour': 0.0},
+    {'store_id': 'b', 'uptime_last_hour': 12.5, 'downtime_last_hour': 47.5},
+    {'store_id': 'c', 'uptime_last_hour': 0.0, 'downtime_last_hour': -3.25},
+]
+
+
+def test_csv_matches_pandas_output(tmp_path):
+    path = str(tmp_path / 'r.csv')
+    with ReportWriter(path, 'csv') as writer:
+        writer.write_rows(ROWS[:1])
+        writer.write_rows(ROWS[1:])
+
+    expected = pd.DataFrame(ROWS).to_csv(index=False)
+    with open(path, newline='') as f:
+        assert f.read() == expected
+
+
+def test_gzip_round_trip(tmp_path):
+    path = str(tmp_path / 'r.csv.gz')
+    with ReportWriter(path, 'csv.gz') as writer:
+        writer.write_rows(ROWS)
+
+    with gzip.open(path, 'rt', newline='') as f:
+        assert pd.read_csv(io.StringIO(f.read())).to_dict('records') == ROWS
+
+
+def test_parquet_round_trip(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr('report_writer.PARQUET_ROW_GROUP_SIZE', 2)
+    path = str(tmp_path / 'r.parquet')
+    with ReportWriter(path, 'parquet') as writer:
+        for row in ROWS:
+            writer.write_rows([row])
+
+    assert pd.read_parquet(path).to_dict('records') == ROWS
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+    path = str(tmp_path / 'r.csv')
+    with pytest.raises(RuntimeError):
+        with ReportWriter(path, 'csv') as writer:
+            writer.write_rows(ROWS)
+            raise RuntimeError('boom')
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_unknown_format_rejected():
+    with pytest.raises(ValueError):
+        validate_format('xlsx')
+
+
+def test_generate_report_streams_batches(tmp_path, monkeypatch):
+    session, _ = make_session(5, n_stores=12, url=f"sqlite:///{tmp_path / 'stores.db'}")
+    monkeypatch.setattr(report, 'SessionLocal', lambda: session)
+    monkeypatch.setattr(report, 'REPORT_BATCH_STORES', 5)
+    monkeypatch.chdir(tmp_path)
+
+    batches = []
+    original = report.ReportWriter.write_rows
+    monkeypatch.setattr(report.ReportWriter, 'write_rows',
+                        lambda self, rows: (batches.append(len(rows)), original(self, rows)))
+    report.generate_report('r1', fmt='csv.gz')
+
+    assert batches == [5, 5, 2]
+    stores = sorted(s.store_id for s in session.query(StoreStatus.store_id).distinct())
+    latest = session.query(StoreStatus.timestamp_utc).order_by(StoreStatus.timestamp_utc.desc()).first()[0]
+    now = latest.replace(tzinfo=pytz.utc)
+    expected = compute_report_rows(session, stores, now, intervals_for(now))
+    with gzip.open(report_path('r1', 'csv.gz'), 'rt', newline='') as f:
+        assert f.read() == pd.DataFrame(expected).to_csv(index=False)
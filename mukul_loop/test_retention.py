@@ -0,0 +1,63 @@
+"""
+Retention: whole days past the window are deleted, each with its own version bump
+"""
+
+from datetime import timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+import retention
+from db import get_ingest_version, store_fingerprints, update_fingerprints
+from models import StoreStatus
+from schedule import DAY_US
+from test_uptime_engine import make_session
+from uptime_engine import poll_range
+
+
+def use_database(monkeypatch, session):
+    engine = session.get_bind()
+    monkeypatch.setattr(retention, "engine", engine)
+    monkeypatch.setattr(retention, "SessionLocal", sessionmaker(bind=engine))
+
+
+def count_polls(session, since_us=0):
+    return session.execute(text("SELECT COUNT(*) FROM status_polls WHERE ts >= :ts"), {"ts": since_us}).scalar()
+
+
+def test_deletes_whole_days_past_retention(tmp_path, monkeypatch):
+    session, _ = make_session(31, n_stores=6, url=f"sqlite:///{tmp_path / 'stores.db'}")
+    use_database(monkeypatch, session)
+    _, latest = poll_range(session)
+    cutoff = retention.retention_cutoff(latest, 5)
+    kept, total = count_polls(session, cutoff), count_polls(session)
+    assert kept < total
+
+    assert retention.apply_retention(5) == total - kept
+    session.expire_all()
+    assert count_polls(session) == kept
+    assert poll_range(session)[0] >= cutoff
+    assert retention.apply_retention(5) == 0
+
+
+
+def test_each_day_bumps_version_and_drops_empty_fingerprints(tmp_path, monkeypatch):
+    session, end = make_session(33, n_stores=4, url=f"sqlite:///{tmp_path / 'stores.db'}")
+    use_database(monkeypatch, session)
+    # A store whose only poll is past the window
+    session.add(StoreStatus(store_id="gone", timestamp_utc=end - timedelta(days=8), status="active"))
+    session.commit()
+    conn = session.connection()
+    update_fingerprints(conn, 0)
+    session.commit()
+    _, latest = poll_range(session)
+    first_day = poll_range(session)[0] // DAY_US
+    days = retention.retention_cutoff(latest, 5) // DAY_US - first_day
+
+    assert retention.apply_retention(5) > 0
+    session.expire_all()
+    conn = session.connection()
+    assert get_ingest_version(conn) == days
+    fingerprints = store_fingerprints(conn)
+    assert "gone" not in fingerprints
+    assert {changed for _, _, changed in fingerprints.values()} == {days}
@@ -0,0 +1,78 @@
+"""
+Compiled schedules vs utils.get_local_time_range
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytz
+
+import schedule
+from models import BusinessHours
+from utils import get_local_time_range
+
+TIMEZONES = ['America/Chicago', 'America/New_York', 'America/Denver', 'Asia/Kolkata',
+             'Europe/London', 'Australia/Sydney', 'Pacific/Auckland']
+
+
+def random_hours(rng):
+    hours = []
+    for day in range(7):
+        for _ in range(rng.choice([0, 1, 1, 2])):
+            start = rng.randint(0, 86399)
+            end = rng.choice([rng.randint(start, 86399), rng.randint(0, 86399)])
+            hours.append(BusinessHours(
+                store_id='s', dayOfWeek=day,
+                start_time_local=f"{start // 3600:02d}:{start // 60 % 60:02d}:{start % 60:02d}",
+                end_time_local=f"{end // 3600:02d}:{end // 60 % 60:02d}:{end % 60:02d}",
+            ))
+    return hours
+
+
+def test_local_time_range_matches_reference():
+    rng = random.Random(5)
+    # Windows around the 2023 northern and southern DST changes
+    anchors = [datetime(2023, 3, 12, 8), datetime(2023, 4, 2, 0), datetime(2023, 11, 5, 6), datetime(2023, 3, 26, 1)]
+    for _ in range(300):
+        hours = random_hours(rng)
+        timezone_str = rng.choice(TIMEZONES)
+        end = (rng.choice(anchors) + timedelta(seconds=rng.randint(-3 * 86400, 3 * 86400),
+                                                microseconds=rng.randint(0, 999999))).replace(tzinfo=pytz.utc)
+        start = end - rng.choice([timedelta(hours=1), timedelta(days=1), timedelta(days=7), timedelta(days=30)])
+
+        compiled = schedule.compile_schedule(hours)
+        if hours:
+            expected = get_local_time_range(start, end, timezone_str, hours=hours)
+        else:
+            expected = get_local_time_range(start, end, timezone_str, full_day=True)
+        assert schedule.local_time_range(compiled, timezone_str, start, end) == expected
+
+
+def test_identical_hours_share_schedule():
+    rng = random.Random(1)
+    hours = random_hours(rng)
+    copy = [BusinessHours(store_id='other', dayOfWeek=h.dayOfWeek, start_time_local=h.start_time_local,
+                          end_time_local=h.end_time_local) for h in hours]
+    assert schedule.compile_schedule(hours) == schedule.compile_schedule(copy)
+    assert schedule.compile_schedule([]) is None
+
+
+def test_schedules_follow_version_changed_elsewhere():
+    from schedule import set_schedules_version
+    from models import StoreTimezones
+    from test_uptime_engine import make_session
+
+    session, _ = make_session(3, n_stores=6)
+    schedules, timezones = schedule.get_store_schedules(session)
+    assert timezones.get('store-5') is None
+
+    # Another process ingests new hours and timezones: no invalidate() here
+    session.add(StoreTimezones(store_id='store-5', timezone_str='Asia/Kolkata'))
+    session.add(BusinessHours(store_id='store-0', dayOfWeek=2, start_time_local='08:00:00', end_time_local='09:00:00'))
+    set_schedules_version(session.connection(), 7)
+    session.commit()
+
+    schedules, timezones = schedule.get_store_schedules(session)
+    assert timezones['store-5'] == 'Asia/Kolkata'
+    assert schedules['store-0'][2] == ((8 * 3600, 9 * 3600),)
+    assert schedule.current_version() == 7
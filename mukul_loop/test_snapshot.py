@@ -0,0 +1,92 @@
+"""
+Startup snapshot: round trip of schedules and status cache, staleness, bad files
+"""
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+import schedule
+import snapshot
+import status_cache
+from db import bump_ingest_version, current_watermark
+from test_uptime_engine import make_session
+
+
+@pytest.fixture(autouse=True)
+def cold_cache():
+    status_cache.clear()
+    yield
+    status_cache.clear()
+
+
+def test_restore_matches_rebuilt_state(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    session, _ = make_session(61, n_stores=10)
+    version = current_watermark(session.connection())[1]
+    status_cache.fill(session, version)
+    schedules, timezones = schedule.get_store_schedules(session)
+    expected = {store_id: (ts.copy(), active.copy()) for store_id, (ts, active) in status_cache.export()[0].items()}
+    cache_stats = status_cache.stats()
+    snapshot.save(session, path)
+    assert snapshot.is_current(session, path)
+
+    status_cache.clear()
+    schedule.invalidate()
+    assert snapshot.restore(session, path)
+    assert schedule.get_store_schedules(session) == (schedules, timezones)
+    assert status_cache.stats() == cache_stats
+    series = status_cache.export()[0]
+    assert series.keys() == expected.keys()
+    for store_id, (ts, active) in expected.items():
+        assert np.array_equal(series[store_id][0], ts) and np.array_equal(series[store_id][1], active)
+        # Mapped from the file, not copied
+        assert not series[store_id][0].flags.writeable
+
+
+def test_stale_or_damaged_snapshot_is_not_used(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    session, _ = make_session(62, n_stores=4)
+    snapshot.save(session, path)
+
+    with session.get_bind().begin() as conn:
+        bump_ingest_version(conn)
+    assert not snapshot.is_current(session, path)
+    assert not snapshot.restore(session, path)
+    assert snapshot.refresh(session, path) and not snapshot.refresh(session, path)
+    assert snapshot.restore(session, path)
+
+    session.execute(text("DELETE FROM status_polls WHERE ts = (SELECT MAX(ts) FROM status_polls)"))
+    session.commit()
+    assert not snapshot.restore(session, path)
+
+    with open(path, "r+b") as f:
+        f.write(b"garbage!")
+    assert not snapshot.restore(session, path)
+    assert not snapshot.restore(session, str(tmp_path / "missing.bin"))
+
+
+def test_snapshot_schedules_carry_their_version(tmp_path):
+    from schedule import set_schedules_version
+    from models import StoreTimezones
+
+    path = str(tmp_path / "snapshot.bin")
+    session, _ = make_session(63, n_stores=5)
+    assert snapshot.refresh(session, path)
+
+    # Written by another process: the hours changed but not the watermark
+    session.add(StoreTimezones(store_id='store-0', timezone_str='Asia/Tokyo'))
+    set_schedules_version(session.connection(), 9)
+    session.commit()
+    schedule.invalidate()
+    assert snapshot.restore(session, path)
+    assert schedule.get_store_schedules(session)[1]['store-0'] == 'Asia/Tokyo'
+
+    # Held lock: another process is writing, nothing is written here
+    import fcntl
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with session.get_bind().begin() as conn:
+            bump_ingest_version(conn)
+        assert not snapshot.refresh(session, path)
+    assert snapshot.refresh(session, path)
@@ -0,0 +1,75 @@
+"""
+Non-blocking startup: liveness at once, readiness and gated endpoints after the background load
+"""
+
+import subprocess
+import sys
+import threading
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import db
+import main
+
+
+def test_endpoints_wait_for_initial_load(monkeypatch):
+    release = threading.Event()
+    loaded = threading.Event()
+
+    def slow_load():
+        db.LOAD_PROGRESS.update({"store_status": (50, 200), "timezones": (0, 0)})
+        release.wait(10)
+        loaded.set()
+
+    monkeypatch.setattr(main, "init_db", lambda: None)
+    monkeypatch.setattr(main, "load_data", slow_load)
+    monkeypatch.setattr(main.status_cache, "fill", lambda *args, **kwargs: None)
+    monkeypatch.setattr(main, "SessionLocal", sessionmaker(bind=create_engine("sqlite://")))
+    monkeypatch.setattr(main, "get_ingest_version", lambda conn: 0)
+    monkeypatch.setattr(main.worker_pool, "start", lambda: None)
+    monkeypatch.setattr(main, "start_scheduler", lambda: None)
+    monkeypatch.setattr(main.snapshot, "restore", lambda session: False)
+    monkeypatch.setattr(main, "save_snapshot", lambda: None)
+    monkeypatch.setattr(db, "LOAD_PROGRESS", {})
+    monkeypatch.setattr(main, "startup_state", {"phase": None, "error": None})
+
+    with TestClient(main.app) as client:
+        assert client.get("/healthz").json() == {"status": "ok"}
+        response = client.get("/readyz")
+        assert response.status_code == 503 and response.headers["Retry-After"] == str(main.READY_RETRY_AFTER)
+        assert response.json()["phase"] in ("initializing", "loading")
+        response = client.get("/uptime/store-1")
+        assert response.status_code == 503 and "Retry-After" in response.headers
+
+        release.set()
+        assert loaded.wait(10)
+        for _ in range(100):
+            if main.startup_state["phase"] == "ready":
+                break
+            threading.Event().wait(0.05)
+        assert client.get("/readyz").json() == {"ready": True, "phase": "ready", "load_percent": 100.0}
+
+
+def test_failed_load_is_reported(monkeypatch):
+    monkeypatch.setattr(main, "startup_state", {"phase": None, "error": None})
+    monkeypatch.setattr(main, "init_db", lambda: (_ for _ in ()).throw(RuntimeError("disk full")))
+    main.initial_load()
+    client = TestClient(main.app)
+    assert client.get("/healthz").status_code == 500
+    response = client.get("/readyz")
+    assert response.status_code == 503 and response.json()["error"] == "disk full"
+
+
+def test_load_fraction(monkeypatch):
+    monkeypatch.setattr(db, "LOAD_PROGRESS", {})
+    assert db.load_fraction() == 1.0
+    db.LOAD_PROGRESS.update({"a": (10, 40), "b": (30, 60)})
+    assert db.load_fraction() == 0.4
+
+
+def test_import_does_not_load_pandas():
+    code = "import sys, main; print('pandas' in sys.modules, 'apscheduler' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert out.split()[-2:] == ["False", "False"]
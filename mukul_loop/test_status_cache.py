@@ -0,0 +1,146 @@
+"""
+status_cache: warm reads match SQLite, incremental updates, age and size eviction
+"""
+
+from datetime import timedelta
+
+import numpy as np
+import pytest
+import pytz
+from sqlalchemy import text
+
+import report
+import status_cache
+from models import StoreStatus
+from test_uptime_engine import make_session, intervals_for
+from uptime_engine import compute_report_rows, load_status_arrays, poll_range, polled_store_ids
+from utils import from_epoch_us, to_epoch_us
+
+
+@pytest.fixture(autouse=True)
+def cold_cache():
+    status_cache.clear()
+    yield
+    status_cache.clear()
+
+
+def assert_same_arrays(actual, expected):
+    assert actual.store_ids == expected.store_ids
+    assert np.array_equal(actual.store_idx, expected.store_idx)
+    assert np.array_equal(actual.ts, expected.ts)
+    assert np.array_equal(actual.active, expected.active)
+
+
+def test_warm_cache_matches_database():
+    session, _ = make_session(21, n_stores=12)
+    stores = polled_store_ids(session)
+    now = from_epoch_us(poll_range(session)[1])
+    start = now - timedelta(days=7)
+
+    assert status_cache.status_arrays(stores, to_epoch_us(start), to_epoch_us(now)) is None
+    info = status_cache.fill(session, version=1)
+    assert info["stores"] == 12 and info["bytes"] == info["samples"] * status_cache.SAMPLE_BYTES
+
+    arrays = status_cache.status_arrays(stores, to_epoch_us(start), to_epoch_us(now))
+    assert_same_arrays(arrays, load_status_arrays(session, stores, start, now))
+    assert compute_report_rows(session, stores, now, intervals_for(now), arrays=arrays) == \
+        compute_report_rows(session, stores, now, intervals_for(now))
+
+    polls = status_cache.store_polls('store-3', to_epoch_us(start), to_epoch_us(now))
+    rows = session.query(StoreStatus).filter(
+        StoreStatus.store_id == 'store-3', StoreStatus.timestamp_utc >= start.replace(tzinfo=None)
+    ).order_by(StoreStatus.timestamp_utc).all()
+    assert polls == [(r.timestamp_utc, r.status) for r in rows]
+
+    # Another ingest version, or a window past the latest poll, is not covered
+    assert status_cache.store_polls('store-3', to_epoch_us(start), to_epoch_us(now), version=2) is None
+    assert status_cache.status_arrays(stores, to_epoch_us(start), to_epoch_us(now) + 1) is None
+
+
+def test_update_merges_ingested_polls_and_evicts_by_age(monkeypatch):
+    monkeypatch.setattr(status_cache, "STATUS_CACHE_DAYS", 3)
+    session, end = make_session(22, n_stores=6)
+    status_cache.fill(session, version=1)
+
+    # A new poll a day past the end, and a late status change inside the cache
+    changed = session.query(StoreStatus).filter_by(store_id='store-2').order_by(StoreStatus.timestamp_utc.desc()).first()
+    late_ts = changed.timestamp_utc
+    session.expunge(changed)
+    # Inserts through the store_status view replace an existing poll
+    session.add(StoreStatus(store_id='store-2', timestamp_utc=late_ts,
+                            status='active' if changed.status == 'inactive' else 'inactive'))
+    new_end = end + timedelta(days=1)
+    session.add(StoreStatus(store_id='store-1', timestamp_utc=new_end, status='inactive'))
+    session.commit()
+
+    status_cache.update(session, {'store-1': (to_epoch_us(new_end), to_epoch_us(new_end)),
+                                  'store-2': (to_epoch_us(late_ts), to_epoch_us(late_ts))}, version=2)
+
+    stores = polled_store_ids(session)
+    now = new_end.replace(tzinfo=pytz.utc)
+    start = now - timedelta(days=3)
+    assert status_cache.stats()["start_us"] == to_epoch_us(start)
+    arrays = status_cache.status_arrays(stores, to_epoch_us(start), to_epoch_us(now), version=2)
+    assert_same_arrays(arrays, load_status_arrays(session, stores, start, now))
+    # Polls older than the retention window are gone
+    assert status_cache.status_arrays(stores, to_epoch_us(start) - 1, to_epoch_us(now)) is None
+    assert status_cache.stats()["samples"] == len(arrays)
+
+
+def test_size_budget_shrinks_covered_range(monkeypatch):
+    session, _ = make_session(23, n_stores=10)
+    full = status_cache.fill(session)
+    monkeypatch.setattr(status_cache, "STATUS_CACHE_MAX_BYTES", full["bytes"] // 2)
+    trimmed = status_cache.fill(session)
+
+    assert trimmed["bytes"] <= full["bytes"] // 2
+    assert trimmed["start_us"] > full["start_us"]
+    stores = polled_store_ids(session)
+    now = from_epoch_us(full["latest_us"])
+    assert status_cache.status_arrays(stores, full["start_us"], to_epoch_us(now)) is None
+    arrays = status_cache.status_arrays(stores, trimmed["start_us"], to_epoch_us(now))
+    start = from_epoch_us(trimmed["start_us"])
+    assert_same_arrays(arrays, load_status_arrays(session, stores, start, now))
+
+
+def test_update_after_missed_ingest_refills(monkeypatch):
+    session, end = make_session(24, n_stores=4)
+    status_cache.fill(session, version=1)
+
+    # Version 2 was ingested by another process: this cache never saw its poll
+    missed = end + timedelta(minutes=5)
+    session.add(StoreStatus(store_id='store-0', timestamp_utc=missed, status='inactive'))
+    ours = end + timedelta(minutes=10)
+    session.add(StoreStatus(store_id='store-1', timestamp_utc=ours, status='inactive'))
+    session.commit()
+    status_cache.update(session, {'store-1': (to_epoch_us(ours), to_epoch_us(ours))}, version=3)
+
+    assert status_cache.stats()["version"] == 3
+    polls = status_cache.store_polls('store-0', to_epoch_us(missed), to_epoch_us(ours), version=3)
+    assert polls == [(missed, 'inactive')]
+
+    # A change the cache already holds is not merged twice
+    status_cache.update(session, {'store-1': (to_epoch_us(ours), to_epoch_us(ours))}, version=3)
+    assert status_cache.stats()["version"] == 3
+
+
+def test_report_rows_skip_cache_of_another_version():
+    session, _ = make_session(24, n_stores=5)
+    stores = polled_store_ids(session)
+    now = from_epoch_us(poll_range(session)[1])
+    status_cache.fill(session, version=1)
+    expected = compute_report_rows(session, stores, now, intervals_for(now))
+
+    # A change the cache has not seen: flip every status of one store
+    session.execute(text("UPDATE status_polls SET active = 1 - active "
+                         "WHERE store_key = (SELECT store_key FROM stores WHERE store_id = 'store-2')"))
+    session.commit()
+    fresh = compute_report_rows(session, stores, now, intervals_for(now))
+    assert fresh != expected
+
+    rows = [row for batch in report.iter_report_rows(session, stores, now, intervals_for(now), version=2)
+            for row in batch]
+    assert rows == fresh
+    rows = [row for batch in report.iter_report_rows(session, stores, now, intervals_for(now), version=1)
+            for row in batch]
+    assert rows == expected
@@ -0,0 +1,82 @@
+"""
+Batched store summaries: grouped queries, per-ingest-version cache, endpoints
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import db
+import main
+import report
+from models import StoreStatus, StoreTimezones, BusinessHours
+from test_uptime_engine import make_session
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    session, _ = make_session(41, n_stores=8, url=f"sqlite:///{tmp_path / 'stores.db'}")
+    monkeypatch.setattr(report, "SessionLocal", sessionmaker(bind=session.get_bind()))
+    monkeypatch.setattr(report, "_summary_version", None)
+    report._summary_cache.clear()
+    return session
+
+
+def expected_summary(session, store_id):
+    polls = session.query(StoreStatus.timestamp_utc).filter_by(store_id=store_id).order_by(StoreStatus.timestamp_utc)
+    timestamps = [t for (t,) in polls]
+    timezone = session.query(StoreTimezones).filter_by(store_id=store_id).first()
+    hours = session.query(BusinessHours).filter_by(store_id=store_id).count()
+    return {
+        "store_id": store_id,
+        "total_status_records": len(timestamps),
+        "data_available_from": timestamps[0].strftime('%Y-%m-%d %H:%M:%S UTC'),
+        "data_available_until": timestamps[-1].strftime('%Y-%m-%d %H:%M:%S UTC'),
+        "timezone": timezone.timezone_str if timezone else 'America/Chicago',
+        "has_business_hours": hours > 0,
+        "business_days_defined": hours,
+    }
+
+
+def count_queries(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_batch_matches_per_store_queries(session):
+    stores = [f"store-{n}" for n in range(8)]
+    statements = count_queries(session.get_bind())
+    summaries = report.get_store_summaries(stores + ["missing"])
+    # Version lookup plus one aggregate, one timezone and one hours query
+    assert len(statements) == 4
+
+    assert summaries == {**{s: expected_summary(session, s) for s in stores}, "missing": {"error": "Store not found"}}
+    assert report.get_store_summary("store-3") == expected_summary(session, "store-3")
+
+
+def test_cache_serves_repeats_until_next_ingest(session):
+    statements = count_queries(session.get_bind())
+    report.get_store_summaries(["store-1", "store-2"])
+    first = len(statements)
+    report.get_store_summaries(["store-2", "store-1"])
+    # Only the ingest version lookup
+    assert len(statements) - first == 1
+
+    with session.get_bind().begin() as conn:
+        db.bump_ingest_version(conn)
+    report.get_store_summaries(["store-1"])
+    assert len(statements) - first > 2
+
+
+def test_store_summaries_endpoint(session, monkeypatch):
+    client = TestClient(main.app)
+    response = client.post("/store_summaries", json={"store_ids": ["store-4", "nope"]})
+    assert response.status_code == 200
+    assert response.json()["summaries"] == {"store-4": expected_summary(session, "store-4"),
+                                            "nope": {"error": "Store not found"}}
+    assert client.get("/store_summary/store-4").json() == expected_summary(session, "store-4")
+
+    monkeypatch.setattr(main, "MAX_SUMMARY_STORES", 1)
+    assert client.post("/store_summaries", json={"store_ids": ["a", "b"]}).status_code == 400
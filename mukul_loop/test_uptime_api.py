@@ -0,0 +1,94 @@
+"""
+GET /uptime/{store_id}: buckets match per-window get_local_time_range + interpolate_status
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+import main
+import report
+import status_cache
+from models import StoreStatus, BusinessHours, StoreTimezones
+from test_uptime_engine import make_session
+from uptime_engine import bucket_edges, poll_range
+from utils import from_epoch_us, get_local_time_range, interpolate_status
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    session, _ = make_session(51, n_stores=8, url=f"sqlite:///{tmp_path / 'stores.db'}")
+    monkeypatch.setattr(report, "SessionLocal", sessionmaker(bind=session.get_bind()))
+    status_cache.clear()
+    yield session
+    status_cache.clear()
+
+
+def expected_bucket(session, store_id, start, end):
+    hours = session.query(BusinessHours).filter_by(store_id=store_id).all()
+    tz = session.query(StoreTimezones).filter_by(store_id=store_id).first()
+    periods = get_local_time_range(start, end, tz.timezone_str if tz else 'America/Chicago',
+                                   hours=hours, full_day=not hours)
+    polls = session.query(StoreStatus).filter(
+        StoreStatus.store_id == store_id,
+        StoreStatus.timestamp_utc >= start.replace(tzinfo=None),
+        StoreStatus.timestamp_utc <= end.replace(tzinfo=None),
+    ).order_by(StoreStatus.timestamp_utc).all()
+    up, down = interpolate_status(polls, periods)
+    return round(up.total_seconds(), 3), round(down.total_seconds(), 3)
+
+
+def test_bucket_edges_align_to_utc_boundaries():
+    hour = 3600 * 10**6
+    assert bucket_edges(30 * 60 * 10**6, 3 * hour, 'hour') == [30 * 60 * 10**6, hour, 2 * hour, 3 * hour]
+    # 1970-01-05 was a Monday
+    day = 24 * hour
+    assert bucket_edges(day, 20 * day, 'week') == [day, 4 * day, 11 * day, 18 * day, 20 * day]
+
+
+@pytest.mark.parametrize("granularity, days", [("hour", 1.5), ("day", 6)])
+def test_series_matches_reference(session, granularity, days):
+    _, latest = poll_range(session)
+    end = from_epoch_us(latest)
+    start = end - timedelta(days=days, minutes=17)
+    for store_id in ("store-0", "store-1", "store-6"):
+        result = report.get_uptime_series(store_id, start, end, granularity)
+        assert result["source"] == "database"
+        series = result["series"]
+        assert series[0]["start"] == start.isoformat() and series[-1]["end"] == end.isoformat()
+        actual = [(b["uptime_seconds"], b["downtime_seconds"]) for b in series]
+        expected = [expected_bucket(session, store_id, datetime.fromisoformat(b["start"]),
+                                    datetime.fromisoformat(b["end"])) for b in series]
+        assert actual == expected
+
+
+def test_cached_series_matches_database(session):
+    from_db = report.get_uptime_series("store-2", granularity="hour")
+    status_cache.fill(session, version=0)
+    from_cache = report.get_uptime_series("store-2", granularity="hour")
+    assert from_cache["source"] == "cache"
+    assert from_cache["series"] == from_db["series"] and len(from_db["series"]) in (24, 25)
+
+
+def test_uptime_endpoint(session):
+    client = TestClient(main.app)
+    response = client.get("/uptime/store-3", params={"granularity": "day"})
+    assert response.status_code == 200
+    assert response.json()["granularity"] == "day"
+    assert client.get("/uptime/nope").status_code == 404
+    assert client.get("/uptime/store-3", params={"granularity": "minute"}).status_code == 400
+    assert client.get("/uptime/store-3", params={"start": "2023-03-14T00:00:00",
+                                                 "end": "2023-03-13T00:00:00"}).status_code == 400
+    assert client.get("/uptime/store-3", params={"start": "2020-01-01T00:00:00",
+                                                 "end": "2023-03-13T00:00:00"}).status_code == 400
+
+
+def test_uptime_without_polls(session):
+    session.execute(text("DELETE FROM status_polls"))
+    session.commit()
+    response = TestClient(main.app).get("/uptime/store-3")
+    assert response.status_code == 200
+    assert response.json()["series"] == [] and response.json()["end"] is None
@@ -0,0 +1,140 @@
+"""
+Equivalence tests: vectorized uptime engine vs the per-store reference path
+"""
+
+import csv
+import random
+from datetime import datetime, timedelta
+
+import pytz
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import schedule
+from models import Base, StoreStatus, BusinessHours, StoreTimezones
+import report
+from report import compute_report_rows_reference
+from uptime_engine import compute_report_rows
+from utils import get_local_time_range, interpolate_status
+
+TIMEZONES = ['America/Chicago', 'America/New_York', 'Asia/Kolkata', 'Europe/London', 'Australia/Sydney']
+
+
+def make_session(seed, n_stores=25, url="sqlite://"):
+    engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    rng = random.Random(seed)
+    # Straddles the US DST change on 2023-03-12
+    end = datetime(2023, 3, 14, 9, 30, 0)
+    for n in range(n_stores):
+        store_id = f"store-{n}"
+        t = end - timedelta(days=9)
+        while t <= end:
+            session.add(StoreStatus(
+                store_id=store_id,
+                timestamp_utc=t,
+                status='active' if rng.random() < 0.8 else 'inactive'
+            ))
+            t += timedelta(minutes=rng.randint(20, 150), microseconds=rng.randint(0, 999999))
+
+        if n % 5 != 0:
+            session.add(StoreTimezones(store_id=store_id, timezone_str=rng.choice(TIMEZONES)))
+        if n % 4 != 0:
+            for day in range(7):
+                if rng.random() < 0.2:
+                    continue
+                start_h = rng.randint(0, 12)
+                # Some stores have overnight hours, where end < start
+                end_h = rng.choice([rng.randint(start_h + 1, 23), rng.randint(0, 3)])
+                session.add(BusinessHours(
+                    store_id=store_id, dayOfWeek=day,
+                    start_time_local=f"{start_h:02d}:00:00",
+                    end_time_local=f"{end_h:02d}:59:59"
+                ))
+    session.commit()
+    # Compiled schedules are cached per process; this is a fresh database
+    schedule.invalidate()
+    return session, end
+
+
+def intervals_for(now):
+    return {
+        'hour': now - timedelta(hours=1),
+        'day': now - timedelta(days=1),
+        'week': now - timedelta(days=7),
+    }
+
+
+def test_engine_matches_reference():
+    for seed in range(3):
+        session, end = make_session(seed)
+        stores = [s[0] for s in session.query(StoreStatus.store_id).distinct().all()]
+        now = end.replace(tzinfo=pytz.utc)
+
+        expected = compute_report_rows_reference(session, stores, now, intervals_for(now))
+        actual = compute_report_rows(session, stores, now, intervals_for(now))
+        assert actual == expected
+
+
+def test_engine_handles_windows_without_polls():
+    session, end = make_session(7, n_stores=5)
+    stores = [s[0] for s in session.query(StoreStatus.store_id).distinct().all()]
+    now = (end + timedelta(days=3)).replace(tzinfo=pytz.utc)
+
+    expected = compute_report_rows_reference(session, stores, now, intervals_for(now))
+    actual = compute_report_rows(session, stores, now, intervals_for(now))
+    assert actual == expected
+
+
+def test_parallel_shards_match_serial(tmp_path, monkeypatch):
+    path = tmp_path / 'stores.db'
+    session, end = make_session(3, n_stores=30, url=f"sqlite:///{path}")
+    monkeypatch.setattr(report, 'database_path', lambda: str(path))
+    stores = sorted(s[0] for s in session.query(StoreStatus.store_id).distinct().all())
+    now = end.replace(tzinfo=pytz.utc)
+
+    rows, timings = report.compute_report_rows_parallel(stores, now, intervals_for(now), workers=2)
+    assert rows == compute_report_rows(session, stores, now, intervals_for(now))
+    assert [r['store_id'] for r in rows] == stores
+    assert timings['shards'] == len(timings['shard_seconds']) == 8
+
+
+def test_reference_reads_all_stores_in_constant_queries():
+    session, end = make_session(8, n_stores=12)
+    stores = [s[0] for s in session.query(StoreStatus.store_id).distinct().order_by(StoreStatus.store_id)]
+    now = end.replace(tzinfo=pytz.utc)
+    statements = []
+    event.listen(session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    rows = compute_report_rows_reference(session, stores, now, intervals_for(now))
+    # Store keys, status scan, timezones, business hours
+    assert len(statements) == 4
+    assert rows == compute_report_rows(session, stores, now, intervals_for(now))
+
+
+def test_single_store_report_matches_per_window_queries(tmp_path, monkeypatch):
+    session, end = make_session(9, n_stores=4, url=f"sqlite:///{tmp_path / 'stores.db'}")
+    monkeypatch.setattr(report, 'SessionLocal', sessionmaker(bind=session.get_bind()))
+    monkeypatch.chdir(tmp_path)
+    report.generate_single_store_report('single', 'store-1')
+    with open(tmp_path / 'output' / 'single.csv') as f:
+        row = next(csv.DictReader(f))
+
+    now = end.replace(tzinfo=pytz.utc)
+    hours = session.query(BusinessHours).filter_by(store_id='store-1').all()
+    timezone = session.query(StoreTimezones).filter_by(store_id='store-1').first()
+    for label, days in (('day', 1), ('week', 7), ('month', 30)):
+        start = now - timedelta(days=days)
+        polls = session.query(StoreStatus).filter(
+            StoreStatus.store_id == 'store-1',
+            StoreStatus.timestamp_utc >= start, StoreStatus.timestamp_utc <= now
+        ).order_by(StoreStatus.timestamp_utc).all()
+        periods = get_local_time_range(start, now, timezone.timezone_str if timezone else 'America/Chicago',
+                                       hours=hours, full_day=not hours)
+        up, down = interpolate_status(polls, periods)
+        assert float(row[f'uptime_last_{label}_hours']) == round(up.total_seconds() / 3600, 2)
+        assert float(row[f'downtime_last_{label}_hours']) == round(down.total_seconds() / 3600, 2)
+        assert int(row[f'status_records_last_{label}']) == len(polls)
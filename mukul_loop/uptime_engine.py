@@ -0,0 +1,267 @@
+"""
+Vectorized uptime/downtime engine.
+
+Loads the status polls for every store into flat, sorted NumPy arrays and
+computes uptime/downtime for all stores and all report windows in one pass,
+using searchsorted over a (store, timestamp) key and prefix sums of the gaps
+between polls. Produces the same numbers as running
+utils.interpolate_status store by store.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+from sqlalchemy import exists, select
+
+from models import StatusPoll, Store
+from metrics import phase
+from schedule import DEFAULT_TIMEZONE, get_store_schedules, utc_intervals
+from utils import to_epoch_us
+
+# Rows fetched per round of a streamed status query
+STREAM_ROWS = 50_000
+# Up to this many stores, a status query reads only their primary key ranges
+KEY_FILTER_MAX = 500
+
+# Same attributes as StoreStatus rows, for utils.interpolate_status
+Poll = namedtuple('Poll', ['timestamp_utc', 'status'])
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+
+
+def polls_from_arrays(ts, active):
+    """Sorted ts/active arrays of one store as Poll tuples (naive UTC, like the view)."""
+    return [Poll(_NAIVE_EPOCH + timedelta(microseconds=int(t)), 'active' if a else 'inactive')
+            for t, a in zip(ts, active)]
+
+
+class StatusArrays:
+    """Status polls of many stores, sorted by (store index, timestamp)."""
+
+    def __init__(self, store_ids, store_idx, ts, active):
+        self.store_ids = store_ids
+        self.index = {store_id: i for i, store_id in enumerate(store_ids)}
+        self.store_idx = store_idx
+        self.ts = ts
+        self.active = active
+
+    def __len__(self):
+        return len(self.ts)
+
+    def store_series(self, store_id, start_us, end_us):
+        """(ts, active) of one store's polls in [start_us, end_us], as views."""
+        i = self.index[store_id]
+        lo, hi = np.searchsorted(self.store_idx, [i, i + 1])
+        ts = self.ts[lo:hi]
+        first = np.searchsorted(ts, start_us, side='left')
+        stop = np.searchsorted(ts, end_us, side='right')
+        return ts[first:stop], self.active[lo:hi][first:stop]
+
+
+def polled_store_ids(db):
+    """Sorted store_ids that have at least one status poll."""
+    query = select(Store.store_id).where(
+        exists().where(StatusPoll.store_key == Store.store_key)
+    ).order_by(Store.store_id)
+    return list(db.execute(query).scalars())
+
+
+def poll_range(db, store_id=None):
+    """(earliest, latest) poll in epoch microseconds, or None without polls."""
+    polls = select(StatusPoll.ts)
+    if store_id is not None:
+        polls = polls.where(StatusPoll.store_key == select(Store.store_key).where(Store.store_id == store_id)
+                            .scalar_subquery())
+    # Separate ORDER BY ... LIMIT 1 lookups: one index seek each, where
+    # SELECT min(), max() in one query would scan
+    first = db.execute(polls.order_by(StatusPoll.ts).limit(1)).scalar()
+    last = db.execute(polls.order_by(StatusPoll.ts.desc()).limit(1)).scalar()
+    return None if first is None else (first, last)
+
+
+def load_status_arrays(db, store_ids, start, end, store_range=None):
+    """
+    Load all polls with start <= timestamp_utc <= end for the given stores.
+    store_range=(first, last) limits the scan to that store_id range, which
+    lets a shard of sorted store ids read only its slice of the primary key.
+    One streamed scan of plain rows, STREAM_ROWS at a time, so no ORM
+    objects or full row list are built.
+    """
+    index = {store_id: i for i, store_id in enumerate(store_ids)}
+    # Store keys are interned in ingest order, so map them to store indexes
+    names = select(Store.store_key, Store.store_id)
+    if store_range is not None:
+        names = names.where(Store.store_id >= store_range[0], Store.store_id <= store_range[1])
+    key_index = {key: index[store_id] for key, store_id in db.execute(names) if store_id in index}
+
+    query = select(StatusPoll.store_key, StatusPoll.ts, StatusPoll.active).where(
+        StatusPoll.ts >= to_epoch_us(start),
+        StatusPoll.ts <= to_epoch_us(end)
+    )
+    if len(key_index) <= KEY_FILTER_MAX:
+        query = query.where(StatusPoll.store_key.in_(list(key_index)))
+    elif store_range is not None:
+        query = query.join(Store, Store.store_key == StatusPoll.store_key).where(
+            Store.store_id >= store_range[0], Store.store_id <= store_range[1])
+    parts_idx, parts_ts, parts_active = [], [], []
+    for rows in db.execute(query.execution_options(yield_per=STREAM_ROWS)).partitions():
+        idx = np.fromiter((key_index.get(r[0], -1) for r in rows), dtype=np.int64, count=len(rows))
+        keep = idx >= 0
+        parts_idx.append(idx[keep])
+        parts_ts.append(np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))[keep])
+        parts_active.append(np.fromiter((r[2] for r in rows), dtype=bool, count=len(rows))[keep])
+    if not parts_ts:
+        return StatusArrays(list(store_ids), np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, bool))
+    store_idx, ts, active = np.concatenate(parts_idx), np.concatenate(parts_ts), np.concatenate(parts_active)
+
+    order = np.lexsort((ts, store_idx))
+    return StatusArrays(list(store_ids), store_idx[order], ts[order], active[order])
+
+
+def load_store_series(db, store_key, start_us, end_us):
+    """(ts, active) arrays of one store's polls in [start_us, end_us]: one range of the primary key."""
+    rows = db.execute(
+        select(StatusPoll.ts, StatusPoll.active)
+        .where(StatusPoll.store_key == store_key, StatusPoll.ts >= start_us, StatusPoll.ts <= end_us)
+        .order_by(StatusPoll.ts)
+    ).all()
+    return (np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)),
+            np.fromiter((r[1] for r in rows), dtype=bool, count=len(rows)))
+
+
+def build_periods(store_ids, schedules, timezones, start_us, end_us):
+    """
+    Business periods of every store in [start_us, end_us] as flat arrays
+    (store index, start us, end us), from the compiled schedules.
+    """
+    p_store, p_start, p_end = [], [], []
+    for i, store_id in enumerate(store_ids):
+        periods = utc_intervals(schedules.get(store_id), timezones.get(store_id, DEFAULT_TIMEZONE), start_us, end_us)
+        p_store.extend([i] * len(periods))
+        for period_start, period_end in periods:
+            p_start.append(period_start)
+            p_end.append(period_end)
+    return (np.array(p_store, dtype=np.int64),
+            np.array(p_start, dtype=np.int64),
+            np.array(p_end, dtype=np.int64))
+
+
+def interpolate_periods(arrays, p_store, p_start, p_end, base, span, groups=None, n_groups=None):
+    """
+    Vectorized equivalent of utils.interpolate_status for many stores at once.
+
+    Every poll and period bound is mapped to key = store * span + (t - base),
+    so one searchsorted finds the polls inside each period across all stores.
+    All timestamps must lie in [base, base + span). Returns per-store
+    (up_us, down_us) float arrays, or per-group ones when groups gives each
+    period a group index below n_groups.
+    """
+    n_stores = len(arrays.store_ids)
+    if n_stores * span >= 2 ** 62:
+        raise ValueError("Time span too large for the vectorized engine")
+
+    ts = arrays.ts
+    active = arrays.active
+    keys = arrays.store_idx * span + (ts - base)
+
+    # Gap from each poll to the next poll of the same store, split by state
+    gaps = np.zeros(len(ts), dtype=np.int64)
+    if len(ts) > 1:
+        gaps[:-1] = np.diff(ts)
+        gaps[:-1][arrays.store_idx[1:] != arrays.store_idx[:-1]] = 0
+    up_cum = np.concatenate(([0], np.cumsum(np.where(active, gaps, 0))))
+    down_cum = np.concatenate(([0], np.cumsum(np.where(active, 0, gaps))))
+
+    first = np.searchsorted(keys, p_store * span + (p_start - base), side='left')
+    stop = np.searchsorted(keys, p_store * span + (p_end - base), side='right')
+    has_polls = stop > first
+    last = np.where(has_polls, stop - 1, 0)
+
+    up = np.zeros(len(p_store), dtype=np.int64)
+    down = np.zeros(len(p_store), dtype=np.int64)
+    if len(ts):
+        tail = p_end - ts[last]
+        last_active = active[last]
+        up = up_cum[last] - up_cum[first] + np.where(last_active, tail, 0)
+        down = down_cum[last] - down_cum[first] + np.where(last_active, 0, tail)
+    up = np.where(has_polls, up, 0)
+    down = np.where(has_polls, down, p_end - p_start)
+
+    if groups is None:
+        groups, n_groups = p_store, n_stores
+    return (np.bincount(groups, weights=up, minlength=n_groups),
+            np.bincount(groups, weights=down, minlength=n_groups))
+
+
+# Bucket sizes of series queries; weeks start on Monday 00:00 UTC
+GRANULARITY_US = {'hour': 3600 * 1_000_000, 'day': 86400 * 1_000_000, 'week': 7 * 86400 * 1_000_000}
+_WEEK_ORIGIN_US = 4 * 86400 * 1_000_000
+
+
+def bucket_edges(start_us, end_us, granularity):
+    """Bucket bounds from start_us to end_us, cut at whole UTC hours/days/weeks."""
+    step = GRANULARITY_US[granularity]
+    origin = _WEEK_ORIGIN_US if granularity == 'week' else 0
+    edges = [start_us]
+    edge = origin + (start_us - origin) // step * step + step
+    while edge < end_us:
+        edges.append(edge)
+        edge += step
+    edges.append(end_us)
+    return edges
+
+
+def bucket_totals(ts, active, schedule, timezone_str, edges):
+    """
+    Up/down microseconds of one store per bucket [edges[i], edges[i + 1]],
+    each computed like a report window of its own: business periods from
+    utc_intervals over the bucket, polls interpolated as in interpolate_status.
+    ts/active are the store's sorted polls within [edges[0], edges[-1]].
+    """
+    p_group, p_start, p_end = [], [], []
+    for i, (lo, hi) in enumerate(zip(edges, edges[1:])):
+        for period_start, period_end in utc_intervals(schedule, timezone_str, lo, hi):
+            p_group.append(i)
+            p_start.append(period_start)
+            p_end.append(period_end)
+    p_group = np.array(p_group, dtype=np.int64)
+    arrays = StatusArrays([None], np.zeros(len(ts), dtype=np.int64), ts, active)
+    return interpolate_periods(arrays, np.zeros(len(p_group), dtype=np.int64),
+                               np.array(p_start, dtype=np.int64), np.array(p_end, dtype=np.int64),
+                               edges[0], edges[-1] - edges[0] + 1, groups=p_group, n_groups=len(edges) - 1)
+
+
+def compute_report_rows(db, store_ids, now, intervals, store_range=None, arrays=None):
+    """
+    Compute the generate_report rows for all stores.
+
+    intervals maps a window label ('hour', 'day', 'week') to its start time;
+    the hour window is reported in minutes, the others in hours. arrays, if
+    given, are the polls of store_ids over the whole window (e.g. from
+    status_cache) and replace the status query.
+    """
+    store_ids = list(store_ids)
+    now = now.astimezone(pytz.utc)
+    earliest = min(start.astimezone(pytz.utc) for start in intervals.values())
+
+    with phase("report", "query"):
+        if arrays is None:
+            arrays = load_status_arrays(db, store_ids, earliest, now, store_range=store_range)
+        schedules, timezones = get_store_schedules(db)
+
+    base = to_epoch_us(earliest)
+    now_us = to_epoch_us(now)
+    span = now_us - base + 1
+
+    rows = [{'store_id': store_id} for store_id in store_ids]
+    for label, start_time in intervals.items():
+        with phase("report", "schedule"):
+            p_store, p_start, p_end = build_periods(store_ids, schedules, timezones, to_epoch_us(start_time), now_us)
+        with phase("report", "interpolation"):
+            up, down = interpolate_periods(arrays, p_store, p_start, p_end, base, span)
+
+        divisor = 60 if label == 'hour' else 3600
+        for i, metrics in enumerate(rows):
+            metrics[f'uptime_last_{label}'] = round(float(up[i]) / 1e6 / divisor, 2)
+            metrics[f'downtime_last_{label}'] = round(float(down[i]) / 1e6 / divisor, 2)
+    return rows